@@ -0,0 +1,7 @@
+def compute(country, variables, **kwargs):
+    '''
+    Computes variables of country running only the steps they need, see Compute.compute. kwargs are passed to
+    Compute (country_forecast_filename, ameco_filename...), use a Compute to keep the step results between calls.
+    '''
+    from fdms.computation.annual_series import Compute
+    return Compute(country=country, **kwargs).compute(variables)
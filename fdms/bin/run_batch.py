@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+'''
+Usage: run_batch.py [--aggregates] [--profile] [COUNTRY ...]
+
+All the countries of the transfer matrix (FCFTM) by default.
+
+--aggregates  Adds the aggregates of the country groups (EA, EU...) to the result
+--profile     Writes the timings of every country, and of the rest of the batch as 'batch', to DMS_PROFILE_DIR
+              (output/profile), see fdms.utils.profiler
+'''
+import sys
+
+from fdms.computation.batch import run_batch
+from fdms.config.country_groups import FCFTM
+from fdms.utils import profiler
+from fdms.utils.series import export_to_excel
+
+OPTIONS = ['--aggregates', '--profile']
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    aggregates = '--aggregates' in arguments
+    if '--profile' in arguments:
+        profiler.enable()
+    countries = [argument for argument in arguments if argument not in OPTIONS]
+    result, errors = run_batch(countries or FCFTM, aggregates=aggregates)
+    if len(result):
+        export_to_excel(result, 'output/outputall.txt', 'output/outputall.xlsx')
+    profiler.write('batch')
+    for country, error in errors.items():
+        print('{}: {}'.format(country, error.strip().splitlines()[-1]))
+    sys.exit(1 if errors else 0)
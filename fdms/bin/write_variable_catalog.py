@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+'''
+Usage: write_variable_catalog.py
+
+Runs the steps of BE and writes what they look up and produce to the seed catalog (fdms/config/variable_catalog.json),
+see VariableCatalog. Run it again when the steps change, test_country_calculations checks the seed is up to date.
+'''
+import json
+import shutil
+import tempfile
+
+from fdms.computation.annual_series import SEED_CATALOG, Compute, seed_catalog
+from fdms.config import DEFAULT_COUNTRY
+
+
+if __name__ == '__main__':
+    # The catalog of the previous runs is not used, the seed only has what this run looks up
+    catalog_dir = tempfile.mkdtemp()
+    try:
+        compute = Compute(country=DEFAULT_COUNTRY, catalog_dir=catalog_dir)
+        compute.perform_computation()
+    finally:
+        shutil.rmtree(catalog_dir)
+    with open(SEED_CATALOG, 'w') as f:
+        json.dump(seed_catalog(compute.catalog.steps), f, indent=1)
+        f.write('\n')
@@ -0,0 +1,213 @@
+'''
+Aggregates of the country groups (EA, EU, FCFTM...), computed from the results of their countries (run_batch).
+
+The results of all the countries are stacked in one countries x variables x years float64 array, and every group is
+computed at once from a groups x countries x years membership mask:
+
+    - the series in national currency at current prices (U*.1.0.0.0) are converted to euro with the exchange rate of
+      every country (XNE.1.0.99.0, national currency per euro) and summed as *.1.0.99.0, the persons (N*.1.0.0.0)
+      are summed as they are;
+    - RATIOS are computed on the group sums;
+    - the volumes (CHAINED) are chain-linked: the growth of the group is the mean of the growth of its members
+      (*.6.0.0.0) weighted by their values at current prices in euro of the year before, and the volume levels
+      (*.1.0.99.0) are chained from the value at current prices of the group in the base period.
+
+The values are converted to units before they are summed, the sums are expressed in the largest scale of the
+members. A group value is missing when the value of one of the members of the year is, members without results (not
+computed, or failed) included. Countries are members of the EA from their membership date (get_membership_date) on,
+and of the other groups in all the years.
+'''
+import logging
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(filename='error.log',
+                    format='{%(pathname)s:%(lineno)d} - %(asctime)s %(module)s %(levelname)s: %(message)s',
+                    level=logging.INFO)
+
+import collections
+import re
+
+import numpy as np
+import pandas as pd
+
+from fdms.config import BASE_PERIOD
+from fdms.config.country_groups import EA, EU, FCFTM, FCWEMS1999, get_membership_date
+from fdms.config.variable_groups import NA_VO
+from fdms.utils.block import SeriesBlock
+from fdms.utils.mixins import StepMixin
+from fdms.utils.series import remove_duplicates
+from fdms.utils.transforms import pch
+
+GROUPS = collections.OrderedDict([('EA', EA), ('EU', EU), ('FCFTM', FCFTM), ('FCWEMS1999', FCWEMS1999)])
+# Groups with evolving composition, member from get_membership_date on
+EVOLVING = ['EA']
+EXCHANGE_RATE = 'XNE.1.0.99.0'
+CURRENCY_REGEX = re.compile(r'^U[A-Z0-9]+\.1\.0\.0\.0$')
+PERSONS_REGEX = re.compile(r'^N[A-Z0-9]+\.1\.0\.0\.0$')
+# target -> (numerator, denominator), in percent of the denominator
+RATIOS = collections.OrderedDict([
+    ('ZUTN.1.0.0.0', ('NUTN.1.0.0.0', 'NLTN.1.0.0.0')),
+    ('UBLGE.1.0.319.0', ('UBLGE.1.0.99.0', 'UVGD.1.0.99.0')),
+    ('UDGG.1.0.319.0', ('UDGG.1.0.99.0', 'UVGD.1.0.99.0')),
+    ('UBGS.1.0.319.0', ('UBGS.1.0.99.0', 'UVGD.1.0.99.0')),
+])
+# Volumes chain-linked (NA_VO), the balances and the changes in inventories have no meaningful growth rate
+CHAINED = [variable for variable in NA_VO if variable not in ['OIST', 'OBGN', 'OBGS', 'OBSN']]
+# Scale names by code (StepMixin.codes)
+SCALES = ['Units', 'Thousands', 'Millions', 'Billions']
+
+
+def stack(result):
+    '''
+    Returns tuple(countries, variables, years, values, scales) for result, the rows of several countries indexed by
+    (Country Ameco, Variable Code). values is the countries x variables x years array, NaN for the missing series,
+    scales the countries x variables scale codes (StepMixin.codes).
+    '''
+    block = remove_duplicates(SeriesBlock.from_frame(result))
+    years = [year for year in block.years if re.match('^[0-9]{4}$', str(year))]
+    columns = [block.years.index(year) for year in years]
+    countries = list(collections.OrderedDict.fromkeys(block.countries))
+    variables = list(collections.OrderedDict.fromkeys(block.variables))
+    rows = np.array([countries.index(country) for country in block.countries], dtype=np.intp)
+    codes = {variable: position for position, variable in enumerate(variables)}
+    series = np.array([codes[variable] for variable in block.variables], dtype=np.intp)
+    values = np.full((len(countries), len(variables), len(years)), np.nan)
+    values[rows, series] = block.values[:, columns]
+    scales = np.zeros((len(countries), len(variables)), dtype=int)
+    if 'Scale' in block.meta:
+        scales[rows, series] = [StepMixin.codes.get(str(scale).capitalize(), 0) for scale in block.meta['Scale']]
+    return countries, variables, years, values, scales
+
+
+def membership(groups, countries, years):
+    '''groups x countries x years bool array, True when the country is a member of the group in the year'''
+    mask = np.zeros((len(groups), len(countries), len(years)), dtype=bool)
+    years = np.array(years, dtype=int)
+    for group_position, (group, members) in enumerate(groups.items()):
+        for country_position, country in enumerate(countries):
+            if country not in members:
+                continue
+            start = get_membership_date(country) if group in EVOLVING else None
+            mask[group_position, country_position] = years >= (start or years.min())
+    return mask
+
+
+def group_sums(mask, values):
+    '''
+    groups x variables x years sums of the countries x variables x years values of the members (mask, groups x
+    countries x years), NaN when the value of a member is missing or the group has no members in the year
+    '''
+    sums = np.einsum('gcy,cvy->gvy', mask.astype(float), np.nan_to_num(values))
+    missing = np.einsum('gcy,cvy->gvy', mask.astype(int), np.isnan(values).astype(int)) > 0
+    sums[missing | ~mask.any(axis=1)[:, None, :]] = np.nan
+    return sums
+
+
+def chain_link(growth, weights, mask, base_column):
+    '''
+    Returns tuple(group growth, group levels), both groups x variables x years.
+
+    growth      -- countries x variables x years percent changes (t/t-1).
+    weights     -- countries x variables x years values at current prices in a common currency.
+    mask        -- groups x countries x years membership, the growth of the year is the one of the members of the year.
+    base_column -- Column of the base period, where the levels are the sums of the weights.
+
+    The group growth is the mean of the growth of the members weighted by their values of the year before, the levels
+    are chained from the base period with it.
+    '''
+    previous = np.full(weights.shape, np.nan)
+    previous[:, :, 1:] = weights[:, :, :-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        group_growth = group_sums(mask, previous * growth) / group_sums(mask, previous)
+        steps = 1 + group_growth / 100
+        levels = np.full(group_growth.shape, np.nan)
+        levels[:, :, base_column] = group_sums(mask, weights)[:, :, base_column]
+        for column in range(base_column + 1, levels.shape[2]):
+            levels[:, :, column] = levels[:, :, column - 1] * steps[:, :, column]
+        for column in range(base_column, 0, -1):
+            levels[:, :, column - 1] = levels[:, :, column] / steps[:, :, column]
+    return group_growth, levels
+
+
+def compute_aggregates(result, groups=GROUPS, frequency='Annual', base_period=BASE_PERIOD):
+    '''
+    Returns the aggregates of groups (name -> member countries) as a dataframe indexed by (Country Ameco, Variable
+    Code) like the country results, the group names as countries. Series missing in all the years are left out.
+    '''
+    countries, variables, years, values, scales = stack(result)
+    # Members without results make the values of their groups missing
+    absent = list(collections.OrderedDict.fromkeys(
+        country for members in groups.values() for country in members if country not in countries))
+    if absent:
+        logger.warning('No results for {}, the aggregates of their groups are missing'.format(' '.join(absent)))
+        values = np.concatenate([values, np.full((len(absent),) + values.shape[1:], np.nan)])
+        scales = np.concatenate([scales, np.zeros((len(absent), scales.shape[1]), dtype=int)])
+        countries = countries + absent
+    currency = np.array([CURRENCY_REGEX.match(variable) is not None for variable in variables])
+    persons = np.array([PERSONS_REGEX.match(variable) is not None for variable in variables])
+    summed = currency | persons
+
+    units = values[:, summed] * np.power(1000.0, scales[:, summed])[:, :, None]
+    if EXCHANGE_RATE in variables:
+        exchange_rates = values[:, variables.index(EXCHANGE_RATE)]
+    else:
+        exchange_rates = np.full((len(countries), len(years)), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        units[:, currency[summed]] /= exchange_rates[:, None, :]
+
+    mask = membership(groups, countries, years)
+    sums = group_sums(mask, units)
+    codes = [re.sub(r'\.1\.0\.0\.0$', '.1.0.99.0', variable) if is_currency else variable
+             for variable, is_currency in zip(np.array(variables)[summed], currency[summed])]
+    positions = {code: position for position, code in enumerate(codes)}
+    # The sums in the largest scale of the members of the group
+    sum_scales = np.zeros((len(groups), len(codes)), dtype=int)
+    for group in range(len(groups)):
+        members = mask[group].any(axis=1)
+        if members.any():
+            sum_scales[group] = scales[members][:, summed].max(axis=0)
+
+    ratios = [(target, positions[numerator], positions[denominator])
+              for target, (numerator, denominator) in RATIOS.items()
+              if numerator in positions and denominator in positions]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio_values = np.stack([sums[:, numerator] / sums[:, denominator] * 100
+                                 for _, numerator, denominator in ratios], axis=1) if ratios else None
+
+    # Volumes, weighted by the values at current prices in euro
+    chained = [variable for variable in CHAINED if 'U' + variable[1:] + '.1.0.99.0' in positions and (
+        variable + '.1.0.0.0' in variables or variable + '.6.0.0.0' in variables)]
+    parts = [(codes, sums, sum_scales), ([target for target, _, _ in ratios], ratio_values, 0)]
+    if chained and base_period in years:
+        weights = units[:, [positions['U' + variable[1:] + '.1.0.99.0'] for variable in chained]]
+        growth = np.stack([_growth(variables, values, variable) for variable in chained], axis=1)
+        group_growth, levels = chain_link(growth, weights, mask, years.index(base_period))
+        level_scales = sum_scales[:, [positions['U' + variable[1:] + '.1.0.99.0'] for variable in chained]]
+        parts.append(([variable + '.6.0.0.0' for variable in chained], group_growth, 0))
+        parts.append(([variable + '.1.0.99.0' for variable in chained], levels, level_scales))
+
+    keys, rows = [], []
+    for group_position, group in enumerate(groups):
+        for part_codes, part_values, part_scales in parts:
+            part_scales = np.broadcast_to(part_scales, (len(groups), len(part_codes)))
+            for position, code in enumerate(part_codes):
+                scale = part_scales[group_position, position]
+                row = part_values[group_position, position] / pow(1000.0, scale)
+                if np.isnan(row).all():
+                    continue
+                keys.append((group, code))
+                rows.append([frequency, SCALES[scale]] + list(row))
+    index = pd.MultiIndex.from_arrays([[key[0] for key in keys], [key[1] for key in keys]],
+                                      names=['Country Ameco', 'Variable Code'])
+    return pd.DataFrame(rows, columns=['Frequency', 'Scale'] + years, index=index)
+
+
+def _growth(variables, values, variable):
+    '''countries x years percent changes of the volume variable, its .6.0.0.0 series or the ones of its levels'''
+    growth = np.full(values.shape[::2], np.nan)
+    if variable + '.1.0.0.0' in variables:
+        growth = pch(values[:, variables.index(variable + '.1.0.0.0')])
+    if variable + '.6.0.0.0' in variables:
+        reported = values[:, variables.index(variable + '.6.0.0.0')]
+        growth = np.where(np.isnan(reported).all(axis=1)[:, None], growth, reported)
+    return growth
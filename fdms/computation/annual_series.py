@@ -1,72 +1,491 @@
+import collections
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(filename='error.log',
+                    format='{%(pathname)s:%(lineno)d} - %(asctime)s %(module)s %(levelname)s: %(message)s',
+                    level=logging.INFO)
+
 import pandas as pd
-import re
 
 from fdms.computation.country.annual.transfer_matrix import TransferMatrix
 from fdms.computation.country.annual.population import Population
 from fdms.computation.country.annual.national_accounts_components import GDPComponents
 from fdms.computation.country.annual.national_accounts_volume import NationalAccountsVolume
-from fdms.config import FORECAST, AMECO, AMECO_SHEET
-from fdms.utils.interfaces import read_country_forecast_excel, read_ameco_txt
+from fdms.computation.country.annual.national_accounts_value import NationalAccountsValue
+from fdms.computation.country.annual.recalculate_uvgdh import RecalculateUvgdh
+from fdms.computation.country.annual.prices import Prices
+from fdms.computation.country.annual.capital_stock import CapitalStock
+from fdms.computation.country.annual.output_gap import OutputGap
+from fdms.computation.country.annual.exchange_rates import ExchangeRates
+from fdms.computation.country.annual.labour_market import LabourMarket
+from fdms.computation.country.annual.fiscal_sector import FiscalSector
+from fdms.computation.country.annual.corporate_sector import CorporateSector
+from fdms.computation.country.annual.household_sector import HouseholdSector
+from fdms.computation.scheduler import Scheduler, Task
+from fdms.config import AMECO, BASE_DIR, CATALOG_DIR, COUNTRY, TRADE_WEIGHTS, USE_CACHE
+from fdms.config.scale_correction import fix_scales
+from fdms.utils.interfaces import (
+    read_country_forecast_excel, read_ameco_txt, read_ameco_db_xls, read_output_gap_xls, read_xr_ir_xls,
+    read_ameco_xne_us_xls, read_trade_weights_xls, get_scales_from_forecast)
+from fdms.utils.availability import Availability
+from fdms.utils.lookup import get_series_index
+from fdms.utils.output import get_output_writer
+from fdms.utils.mixins import record_reads
+from fdms.utils import profiler
+from fdms.utils.series import changed_variables, remove_duplicates
+from fdms.utils.store import AmecoStore, get_ameco_db_store, get_ameco_h_store
+
+
+def _indexed(df):
+    # get_data sorts the dataframes it reads, do it before they are shared by steps running at the same time. They are
+    # not modified in place, their year values are converted once
+    get_series_index(df, read_only=True)
+    return df
+
+
+def _get_ameco_df(ameco_df, country, ameco_vars):
+    if isinstance(ameco_df, AmecoStore):
+        ameco_df = ameco_df.to_frame(country)
+    ameco_series = ameco_df.loc[ameco_df.index.isin(ameco_vars, level='Variable Code')].copy().loc[country]
+    ameco_df = pd.DataFrame(ameco_series)
+    ameco_df.insert(0, 'Country Ameco', country)
+    ameco_df = ameco_df.reset_index()
+    ameco_df.set_index(['Country Ameco', 'Variable Code'], drop=True, inplace=True)
+    return ameco_df
+
+
+# Inputs
+def _read_forecast(forecast_filename):
+    # Not indexed, the transfer matrix goes through its rows in the order of the workbook
+    return read_country_forecast_excel(forecast_filename)
+
+
+def _read_ameco_h(ameco_filename):
+    # Memory-mapped store, the processes of a batch open it instead of getting a copy
+    if USE_CACHE:
+        return get_ameco_h_store([ameco_filename])
+    return _indexed(read_ameco_txt(ameco_filename))
+
+
+def _read_ameco_db(country):
+    return _indexed(read_ameco_db_xls(country=country))
+
+
+def _read_ameco_db_all(country):
+    if USE_CACHE:
+        return get_ameco_db_store(country)
+    return _indexed(read_ameco_db_xls(all_data=True, country=country))
+
+
+def _read_output_gap():
+    return _indexed(read_output_gap_xls())
+
+
+def _read_xr_ir():
+    return _indexed(read_xr_ir_xls())
+
+
+def _read_ameco_xne_us():
+    return _indexed(read_ameco_xne_us_xls())
+
+
+def _read_trade_weights():
+    # Optional, the effective exchange rates are copied from AMECO DB without it
+    if not os.path.exists(TRADE_WEIGHTS):
+        logger.info('No trade weights {}, effective exchange rates copied from AMECO DB'.format(TRADE_WEIGHTS))
+        return None
+    return read_trade_weights_xls(TRADE_WEIGHTS)
+
+
+# Steps
+def _transfer_matrix(country, scales, forecast, ameco_h):
+    # Convert all transfer matrix variables to 1.0.0.0 (except National Account (volume)) and splice in country
+    # desk forecast
+    step = TransferMatrix(scales=scales, country=country)
+    return _indexed(step.perform_computation(forecast.copy(), ameco_h))
+
+
+def _population(country, scales, result_1, ameco_h):
+    # Population and related variables - splice AMECO Historical data with forecast data
+    step_2_vars = ['NUTN.1.0.0.0', 'NETN.1.0.0.0', 'NWTD.1.0.0.0', 'NETD.1.0.0.0', 'NPAN1.1.0.0.0', 'NETN',
+                   'NLHA.1.0.0.0']
+    # NECN.1.0.0.0 is calculated and used in step_2
+    step_2_df = result_1.loc[result_1.index.isin(step_2_vars, level='Variable Code')].copy()
+    return Population(scales=scales, country=country).perform_computation(step_2_df, ameco_h)
+
+
+def _gdp_components(country, scales, result_1, ameco_h):
+    # National Accounts - Calculate additional GDP components
+    return GDPComponents(scales=scales, country=country).perform_computation(result_1, ameco_h)
+
+
+def _national_accounts_volume(country, scales, forecast, result_1, result_3, ameco_h):
+    # National Accounts (Volume) - splice AMECO Historical data with forecast data, calculate year/year percent
+    #  change, per-capita GDP, and contribution to %change in GDP
+    df_input = forecast.copy()
+    df_input[1993] = pd.np.nan
+    df_input[1994] = pd.np.nan
+    df_input[1995] = pd.np.nan
+    step_4_df = pd.concat([df_input, result_1, result_3], sort=True)
+    return NationalAccountsVolume(scales=scales, country=country).perform_computation(step_4_df, ameco_h)
+
+
+def _national_accounts_value(country, scales, result_1, ameco_db, ovgd1):
+    # National Accounts (Value) - calculate additional components
+    step = NationalAccountsValue(scales=scales, country=country)
+    return step.perform_computation(result_1.copy(), ameco_db, ovgd1)
+
+
+def _recalculate_uvgdh(country, scales, forecast, ameco_h):
+    ameco_df = _get_ameco_df(ameco_h, country, ['UVGDH.1.0.0.0', 'KNP.1.0.212.0'])
+    return RecalculateUvgdh(scales=scales, country=country).perform_computation(forecast.copy(), ameco_df)
+
+
+def _prices(country, scales, result_1, result_3, result_4, result_5):
+    step_7_df = pd.concat([result_1, result_3, result_4, result_5], sort=True)
+    return _indexed(Prices(scales=scales, country=country).perform_computation(step_7_df))
+
+
+def _capital_stock(country, scales, result_1, result_2, result_3, result_4, result_5, ameco_h, ameco_db_all):
+    step_8_df = pd.concat([result_1, result_2, result_3, result_4, result_5], sort=True)
+    return CapitalStock(scales=scales, country=country).perform_computation(step_8_df, ameco_h, ameco_db_all)
+
+
+def _output_gap(country, scales, output_gap):
+    return OutputGap(scales=scales, country=country).perform_computation(output_gap)
+
+
+def _exchange_rates(country, scales, ameco_db, xr_ir, ameco_xne_us, ameco_h, trade_weights):
+    step = ExchangeRates(scales=scales, country=country)
+    return step.perform_computation(ameco_db, xr_ir, ameco_xne_us, ameco_h, trade_weights)
+
+
+def _labour_market(country, scales, result_1, result_2, result_4, result_5, result_7, ameco_h):
+    step_11_df = pd.concat([result_1, result_2, result_4, result_5, result_7], sort=True)
+    return LabourMarket(scales=scales, country=country).perform_computation(step_11_df, ameco_h)
+
+
+def _fiscal_sector(country, scales, result_1, ameco_h):
+    return FiscalSector(scales=scales, country=country).perform_computation(result_1, ameco_h)
+
+
+def _corporate_sector(country, scales, result_1, ameco_h):
+    return CorporateSector(scales=scales, country=country).perform_computation(result_1, ameco_h)
+
+
+def _household_sector(country, scales, result_1, result_7, ameco_h):
+    return HouseholdSector(scales=scales, country=country).perform_computation(result_1, result_7, ameco_h)
+
+
+def _combine(country, **results):
+    # TODO: Fix all scales
+    result = pd.concat([results['result_{}'.format(step)] for step in range(1, 15)], sort=True)
+    result = remove_duplicates(result)
+    fix_scales(result, country)
+    return result
+
+
+STEP_RESULTS = ['result_{}'.format(step) for step in range(1, 15)]
+STEP_READS = ['reads_{}'.format(step) for step in range(1, 15)]
+# Inputs with series of the country, looked up by the steps (Compute.preflight)
+SERIES_INPUTS = ['forecast', 'ameco_h', 'ameco_db', 'ameco_db_all', 'output_gap', 'xr_ir', 'ameco_xne_us']
+# Inputs read from the forecast workbook of the country desk, read again by Compute.recompute
+FORECAST_INPUTS = ['forecast', 'scales']
+
+
+class _Tracked:
+    '''Runs a step and returns the variable codes it looked up too, after its result(s), profiled as name'''
+    def __init__(self, function, name):
+        self.function = function
+        self.name = name
+
+    def __call__(self, **inputs):
+        with record_reads() as reads, profiler.step(self.name):
+            values = self.function(**inputs)
+        return (values if isinstance(values, tuple) else (values,)) + (reads,)
+
+
+def _step(number, function, consumes, produces=None):
+    '''Task of step number, it produces result_{number} (or produces) and reads_{number}'''
+    name = 'step_{}'.format(number)
+    produces = produces or ['result_{}'.format(number)]
+    return Task(name, _Tracked(function, name), consumes=['country', 'scales'] + consumes,
+                produces=produces + ['reads_{}'.format(number)])
+
+
+def get_country_tasks():
+    '''
+    Tasks computing the annual series of a country, they consume the inputs country, forecast_filename and
+    ameco_filename and produce the results of the steps (result_1 ... result_14), the variable codes every step
+    looked up (reads_1 ... reads_14) and the combined result (result)
+    '''
+    return [
+        Task('scales', get_scales_from_forecast, consumes=['country']),
+        Task('forecast', _read_forecast, consumes=['forecast_filename']),
+        Task('ameco_h', _read_ameco_h, consumes=['ameco_filename']),
+        Task('ameco_db', _read_ameco_db, consumes=['country']),
+        Task('ameco_db_all', _read_ameco_db_all, consumes=['country']),
+        Task('output_gap', _read_output_gap),
+        Task('xr_ir', _read_xr_ir),
+        Task('ameco_xne_us', _read_ameco_xne_us),
+        Task('trade_weights', _read_trade_weights),
+        _step(1, _transfer_matrix, ['forecast', 'ameco_h']),
+        _step(2, _population, ['result_1', 'ameco_h']),
+        _step(3, _gdp_components, ['result_1', 'ameco_h']),
+        _step(4, _national_accounts_volume, ['forecast', 'result_1', 'result_3', 'ameco_h'],
+              produces=['result_4', 'ovgd1']),
+        _step(5, _national_accounts_value, ['result_1', 'ameco_db', 'ovgd1']),
+        _step(6, _recalculate_uvgdh, ['forecast', 'ameco_h']),
+        _step(7, _prices, ['result_1', 'result_3', 'result_4', 'result_5']),
+        _step(8, _capital_stock, ['result_1', 'result_2', 'result_3', 'result_4', 'result_5', 'ameco_h',
+                                  'ameco_db_all']),
+        _step(9, _output_gap, ['output_gap']),
+        _step(10, _exchange_rates, ['ameco_db', 'xr_ir', 'ameco_xne_us', 'ameco_h', 'trade_weights']),
+        _step(11, _labour_market, ['result_1', 'result_2', 'result_4', 'result_5', 'result_7', 'ameco_h']),
+        _step(12, _fiscal_sector, ['result_1', 'ameco_h']),
+        _step(13, _corporate_sector, ['result_1', 'ameco_h']),
+        _step(14, _household_sector, ['result_1', 'result_7', 'ameco_h']),
+        Task('result', _combine, consumes=['country'] + STEP_RESULTS),
+    ]
+
+
+def _changes(old, new):
+    '''Variable codes that changed from old to new (dataframes or dicts by code), None if anything may have'''
+    if isinstance(new, pd.DataFrame) and isinstance(old, pd.DataFrame):
+        return changed_variables(old, new)
+    if isinstance(new, dict) and isinstance(old, dict):
+        return set(code for code in set(old).union(new) if old.get(code) != new.get(code))
+    if isinstance(new, pd.Series) and isinstance(old, pd.Series):
+        return set() if old.equals(new) else None
+    if isinstance(new, set) and isinstance(old, set):
+        return set() if old == new else None
+    return set() if type(old) == type(new) and old == new else None
+
+
+SEED_CATALOG = os.path.join(BASE_DIR, 'config/variable_catalog.json')
+
+
+def seed_catalog(steps):
+    '''
+    Seed catalog of the steps of a VariableCatalog: the codes sorted, without the reads of the transfer matrix
+    (reads_1), they are the rows of the forecast workbook of the country. fdms/bin/write_variable_catalog.py writes it.
+    '''
+    return collections.OrderedDict((name, sorted(steps[name])) for name in STEP_RESULTS + STEP_READS[1:]
+                                   if name in steps)
+
+
+def _read_catalog(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class VariableCatalog:
+    '''
+    Variable codes produced by every step of a country ({'result_1': [codes], ...}) and looked up by it ({'reads_1':
+    [codes], ...}), as seen in the runs of the country. The steps only know what they produce once they run (the
+    transfer matrix produces the variables of the forecast workbook), the catalog remembers it for the next runs of the
+    same Compute and, in catalog_dir, of the next ones. It's saved whatever DMS_CACHE is, it's not a copy of an input.
+
+    Until the country has run once, missing reports the reads of the seed catalog (SEED_CATALOG, fdms/config): what the
+    steps of BE look up and produce, without the transfer matrix that looks up the rows of the forecast.
+    '''
+    def __init__(self, country, catalog_dir=CATALOG_DIR, seed_filename=SEED_CATALOG):
+        self.country = country
+        self.filename = os.path.join(catalog_dir, '{}.json'.format(country))
+        self.seed_filename = seed_filename
+        self.steps = _read_catalog(self.filename)
+        self.seed = _read_catalog(seed_filename)
+
+    def producers(self, variables):
+        '''
+        Results of the steps producing variables, in the order of the steps. All the steps if any variable is not in
+        the catalog: a variable can be produced by more than one step and the last one wins, an unknown variable
+        could be produced by any of them.
+        '''
+        producers = set()
+        for variable in variables:
+            steps = [name for name in STEP_RESULTS if variable in self.steps.get(name, [])]
+            if not steps:
+                logger.info('Variable {} of {} not in the catalog, computing all the steps'.format(
+                    variable, self.country))
+                return list(STEP_RESULTS)
+            producers.update(steps)
+        return [name for name in STEP_RESULTS if name in producers]
+
+    def missing(self, availability, country):
+        '''
+        OrderedDict step result -> variable codes the step looked up that are in none of the sources of availability
+        (an Availability) and produced by no step, for the steps with any
+        '''
+        steps = self.steps
+        if not any(reads in steps for reads in STEP_READS):
+            if not any(reads in self.seed for reads in STEP_READS):
+                logger.warning('No variable catalog for {} and no seed catalog {}, the missing data is only known once '
+                               'the country ran'.format(self.country, self.seed_filename))
+                return collections.OrderedDict()
+            logger.info('No variable catalog for {} yet, checking the reads of the seed catalog'.format(self.country))
+            steps = self.seed
+        produced = set(variable for name in STEP_RESULTS for variable in steps.get(name, []))
+        missing = collections.OrderedDict()
+        for name, reads in zip(STEP_RESULTS, STEP_READS):
+            variables = availability.missing(country, [variable for variable in steps.get(reads, [])
+                                                       if variable not in produced])
+            if variables:
+                missing[name] = variables
+        return missing
+
+    def update(self, results):
+        '''Remembers the variables of the step results and reads in results'''
+        steps = {name: list(dict.fromkeys(results[name].index.get_level_values('Variable Code')))
+                 for name in STEP_RESULTS if name in results}
+        steps.update((name, sorted(results[name])) for name in STEP_READS if name in results)
+        if all(self.steps.get(name) == variables for name, variables in steps.items()):
+            return
+        self.steps.update(steps)
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        tmp_filename = '{}.{}.tmp'.format(self.filename, os.getpid())
+        with open(tmp_filename, 'w') as f:
+            json.dump(self.steps, f)
+        os.replace(tmp_filename, self.filename)
 
 
 class Compute:
-    def __init__(self, country_forecast_filename=FORECAST, ameco_filename=AMECO, ameco_sheet_name=AMECO_SHEET):
-        self.excel_raw = country_forecast_filename
+    '''
+    Computes the annual series of a country, the steps run as soon as the results they need are ready. compute only
+    runs the steps needed for some variables.
+
+    executor -- 'thread', 'process' or None to run the steps one after the other (see Scheduler.run). With profiling on
+                the steps don't run on a thread pool, the peak memory of a step is measured for its whole process.
+    '''
+    def __init__(self, country=COUNTRY, country_forecast_filename=None, ameco_filename=AMECO, executor='thread',
+                 workers=None, catalog_dir=CATALOG_DIR):
+        self.country = country
+        self.excel_raw = country_forecast_filename or os.path.join(
+            BASE_DIR, 'sample_data/{}.Forecast.SF2018.xlsm'.format(country))
         self.ameco_filename = ameco_filename
-        self.ameco_sheet_name = ameco_sheet_name
-
-    def perform_computation(self):
-        df, ameco_df = read_country_forecast_excel(), read_ameco_txt()
-
-        ##################################################################
-        # If Country in group 'Forecast: Countries from transfer matrix' #
-        ##################################################################
-
-        # Convert all transfer matrix variables to 1.0.0.0 (except National Account (volume)) and splice in country
-        # desk forecast
-        ###########################################################################################################
-
-        step_1 = TransferMatrix()
-        result_1 = step_1.perform_computation(df, ameco_df)
-        self.result = result_1.copy()
-
-        # Population and related variables - splice AMECO Historical data with forecast data
-        ####################################################################################
-
-        step_2_vars = ['NUTN.1.0.0.0', 'NETN.1.0.0.0', 'NWTD.1.0.0.0', 'NETD.1.0.0.0', 'NPAN1.1.0.0.0', 'NETN',
-                       'NLHA.1.0.0.0']
-        # NECN.1.0.0.0 is calculated and used in step_2
-        step_2_df = result_1.loc[result_1.index.isin(step_2_vars, level='Variable Code')].copy()
-        step_2 = Population()
-        result_2 = step_2.perform_computation(step_2_df, ameco_df)
-        self.result = pd.concat([self.result, result_2], sort=True)
-
-        # National Accounts - Calculate additional GDP components
-        # National Accounts (Value) - calculate additional components
-        ####################################################################################
-
-        step_3_vars = ['UMGN', 'UMSN', 'UXGN', 'UXSN', 'UMGN', 'UMSN', 'UXGS', 'UMGS', 'UIGG0', 'UIGT', 'UIGG', 'UIGCO',
-                       'UIGDW', 'UCPH', 'UCTG', 'UIGT', 'UIST']
-        step_3_additional_vars = ['UMGN.1.0.0.0', 'UMSN.1.0.0.0', 'UXGN.1.0.0.0', 'UXSN.1.0.0.0', 'UMGN.1.0.0.0',
-                                  'UMSN.1.0.0.0', 'UXGS.1.0.0.0', 'UMGS.1.0.0.0', 'UIGG0.1.0.0.0', 'UIGT.1.0.0.0',
-                                  'UIGG.1.0.0.0', 'UIGCO.1.0.0.0', 'UIGDW.1.0.0.0', 'UCPH.1.0.0.0', 'UCTG.1.0.0.0',
-                                  'UIGT.1.0.0.0', 'UIST.1.0.0.0', 'UXGN', 'UMGN']
-        step3_vars = set(step_3_vars + step_3_additional_vars)
-        step_3_df = result_1.loc[result_1.index.isin(step_3_vars, level='Variable Code')].copy()
-        ameco_series = ameco_df.loc[ameco_df.index.isin(step_3_additional_vars, level='Variable Code')].copy()
-        step_3_df = step_3_df.append(ameco_series)
-        step_3 = GDPComponents()
-        # result_3 = step_3.perform_computation(step_3_df)
-        # self.result = pd.concat([self.result, result_3], sort=True)
-
-        # National Accounts (Volume) - splice AMECO Historical data with forecast data, calculate year/year percent
-        #  change, per-capita GDP, and contribution to %change in GDP
-        ####################################################################################
-
-        step_4_vars = ['UMGN.1.0.0.0', 'UMSN.1.0.0.0', 'UXGN.1.0.0.0', 'UXSN.1.0.0.0', 'UMGN.1.0.0.0', 'UMSN.1.0.0.0',
-                       'UXGS.1.0.0.0', 'UMGS.1.0.0.0', 'UIGG0.1.0.0.0', 'UIGT.1.0.0.0', 'UIGG.1.0.0.0', 'UIGCO.1.0.0.0',
-                       'UIGDW.1.0.0.0', 'UCPH.1.0.0.0', 'UCTG.1.0.0.0', 'UIGT.1.0.0.0', 'UIST.1.0.0.0', 'UXGN', 'UMGN']
-        step_4_df = result_1.loc[result_1.index.isin(step_4_vars, level='Variable Code')].copy()
-        step_4 = NationalAccountsVolume()
-        # result_4 = step_4.perform_computation(step_4_df)
-        # self.result = pd.concat([self.result, result_4], sort=True)
+        self.executor = executor
+        self.workers = workers
+        # What the steps produce and look up, as seen in the previous runs
+        self.catalog = VariableCatalog(country, catalog_dir=catalog_dir)
+        self.results = {}
+        self.result = None
+        # Variable codes of the series recomputed by every step in the last recompute
+        self.recomputed = collections.OrderedDict()
+
+    def _executor(self):
+        if self.executor == 'thread' and profiler.is_enabled():
+            return None
+        return self.executor
+
+    def _run(self, inputs, targets=None):
+        values = {'country': self.country, 'forecast_filename': self.excel_raw, 'ameco_filename': self.ameco_filename}
+        values.update(self.results)
+        values.update(inputs or {})
+        scheduler = Scheduler(get_country_tasks())
+        self.results = scheduler.run(values, executor=self._executor(), workers=self.workers, targets=targets)
+        self.catalog.update(self.results)
+        get_output_writer().flush()
+        profiler.write(self.country)
+
+    def preflight(self, inputs=None):
+        '''
+        Reads the inputs of the country and reports, before anything is computed, the variable codes the steps looked
+        up in the previous runs (VariableCatalog, its seed on a first run) that are in none of the inputs and produced
+        by no step. Returns an OrderedDict step result -> missing variable codes, they are logged too. The inputs are
+        kept for the next computation.
+
+        inputs -- Optional dict with inputs already read, like perform_computation
+        '''
+        values = {'country': self.country, 'forecast_filename': self.excel_raw, 'ameco_filename': self.ameco_filename}
+        values.update(self.results)
+        values.update(inputs or {})
+        values = Scheduler(get_country_tasks()).run(values, executor=self._executor(), workers=self.workers,
+                                                    targets=SERIES_INPUTS)
+        self.results.update((name, values[name]) for name in SERIES_INPUTS)
+        availability = Availability((name, values[name]) for name in SERIES_INPUTS)
+        missing = self.catalog.missing(availability, self.country)
+        for name, variables in missing.items():
+            logger.warning('Missing data for {} in the inputs of {}: {}'.format(
+                self.country, name.replace('result', 'step'), ' '.join(variables)))
+        return missing
+
+    def perform_computation(self, inputs=None):
+        '''
+        inputs -- Optional dict with inputs already read (i.e. {'ameco_h': ameco_df}), they are not read again
+        '''
+        self._run(inputs)
+        self.result = self.results['result']
+        return self.result
+
+    def compute(self, variables, inputs=None):
+        '''
+        Returns the rows of the combined result for variables, running only the steps (and reading only the inputs)
+        they need. The values computed are kept in self.results and reused by the next calls.
+        '''
+        targets = self.catalog.producers(variables)
+        self._run(inputs, targets=targets)
+        result = remove_duplicates(pd.concat([self.results[name] for name in targets], sort=True))
+        result = result.loc[result.index.get_level_values('Variable Code').isin(variables)].copy()
+        fix_scales(result, self.country)
+        return result
+
+    def recompute(self, inputs=None):
+        '''
+        Computes again after the forecast workbook changed, reusing the previous run: only the steps that look up a
+        series that changed (in their inputs or in the results of the steps they depend on) run again, and the steps
+        after them only if their results changed. The result is the same as a full computation.
+
+        inputs -- Optional dict with the new inputs (i.e. {'forecast': forecast_df}), the inputs read from the forecast
+                  workbook (FORECAST_INPUTS) are read again if not given, the others are the ones of the previous run.
+
+        The variable codes of the series recomputed by every step are in self.recomputed.
+        '''
+        if 'result' not in self.results:
+            raise ValueError('Nothing to recompute for {}, run perform_computation first'.format(self.country))
+        previous = self.results
+        values = {'country': self.country, 'forecast_filename': self.excel_raw, 'ameco_filename': self.ameco_filename}
+        values.update(inputs or {})
+        scheduler = Scheduler(get_country_tasks())
+        values = scheduler.run(values, executor=None, targets=FORECAST_INPUTS)
+
+        changes = {}
+        for name, value in values.items():
+            changed = _changes(previous.get(name), value)
+            if changed != set():
+                changes[name] = changed
+        self.recomputed = collections.OrderedDict()
+        for name in scheduler.order():
+            task = scheduler.tasks[name]
+            if all(produced in values for produced in task.produces):
+                continue
+            dirty = [changes[consumed] for consumed in task.consumes if consumed in changes]
+            reads = [produced for produced in task.produces if produced.startswith('reads_')]
+            if reads and dirty and None not in dirty:
+                # Only the series the step looks up matter
+                dirty = [changed for changed in dirty if changed.intersection(previous[reads[0]])]
+            if not dirty:
+                values.update((produced, previous[produced]) for produced in task.produces)
+                continue
+            logger.info('Recomputing {} of {}'.format(name, self.country))
+            values.update(Scheduler([task]).run({consumed: values[consumed] for consumed in task.consumes},
+                                                executor=None))
+            for produced in task.produces:
+                changed = _changes(previous[produced], values[produced])
+                if changed != set():
+                    changes[produced] = changed
+                if produced in STEP_RESULTS:
+                    self.recomputed[name] = list(dict.fromkeys(
+                        values[produced].index.get_level_values('Variable Code')))
+
+        self.results = values
+        self.result = values['result']
+        self.catalog.update(self.results)
+        get_output_writer().flush()
+        profiler.write(self.country)
+        return self.result
@@ -0,0 +1,84 @@
+'''
+Computes the annual series of several countries on a process pool.
+
+The inputs shared by all the countries (AMECO_H.TXT, OUTPUT_GAP.xlsx, XR_IR.xlsx, AMECO_XNE_US.xlsx and the trade
+weights) are read once in the main process and handed to every worker when it starts, the workers only read the files
+of their countries. AMECO_H.TXT is handed over as an AmecoStore (DMS_CACHE on), every worker opens the memory-mapped
+store in STORE_DIR instead of getting a copy of its values.
+The missing data of every country is logged before it is computed (Compute.preflight). A country that fails is
+reported and the others go on. The aggregates of the country groups can be computed from the results once all the
+countries are done (fdms.computation.aggregates).
+With profiling on (fdms.utils.profiler) the workers write the profile of every country, the main process records the
+reading of the shared inputs and the aggregates.
+'''
+import logging
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(filename='error.log',
+                    format='{%(pathname)s:%(lineno)d} - %(asctime)s %(module)s %(levelname)s: %(message)s',
+                    level=logging.INFO)
+
+import collections
+import multiprocessing
+import traceback
+
+import pandas as pd
+
+from fdms.computation.aggregates import compute_aggregates
+from fdms.computation.annual_series import Compute, get_country_tasks
+from fdms.computation.scheduler import Scheduler
+from fdms.config import AMECO
+from fdms.config.country_groups import FCFTM
+
+SHARED_INPUTS = ['ameco_h', 'output_gap', 'xr_ir', 'ameco_xne_us', 'trade_weights']
+
+# Inputs of the worker processes, set by _init_worker
+_shared_inputs = {}
+
+
+def load_shared_inputs(ameco_filename=AMECO):
+    '''Reads the inputs every country needs, returns a dict that can be passed to Compute.perform_computation'''
+    scheduler = Scheduler([task for task in get_country_tasks() if task.name in SHARED_INPUTS])
+    values = scheduler.run({'ameco_filename': ameco_filename})
+    return {name: values[name] for name in SHARED_INPUTS}
+
+
+def _init_worker(shared_inputs):
+    _shared_inputs.update(shared_inputs)
+
+
+def _compute_country(country):
+    '''returns tuple(country, result or None, error message or None)'''
+    try:
+        # The countries already run in parallel, the steps of each one run one after the other
+        compute = Compute(country=country, executor=None)
+        compute.preflight(inputs=_shared_inputs)
+        result = compute.perform_computation(inputs=_shared_inputs)
+    except Exception:
+        logger.error('Failed to compute country {}'.format(country), exc_info=True)
+        return country, None, traceback.format_exc()
+    return country, result, None
+
+
+def run_batch(countries=FCFTM, workers=None, ameco_filename=AMECO, aggregates=False):
+    '''
+    Computes every country in countries, workers processes at a time (one per CPU by default). With aggregates=True
+    the aggregates of the country groups are appended to the result.
+
+    returns -- tuple(result of all the countries that succeeded, dict country -> error message)
+    '''
+    countries = list(collections.OrderedDict.fromkeys(countries))
+    shared_inputs = load_shared_inputs(ameco_filename)
+    results, errors = {}, {}
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(shared_inputs,)) as pool:
+        for country, result, error in pool.imap_unordered(_compute_country, countries):
+            if error is None:
+                results[country] = result
+            else:
+                errors[country] = error
+    if not results:
+        return pd.DataFrame(), errors
+    result = pd.concat([results[country] for country in countries if country in results], sort=True)
+    if aggregates:
+        result = pd.concat([result, compute_aggregates(result)], sort=True)
+    return result, errors
@@ -1,13 +1,14 @@
-import pandas as pd
-
+from fdms.utils.memo import memoize
 from fdms.utils.mixins import SumAndSpliceMixin
 from fdms.utils.splicer import Splicer
 from fdms.utils.operators import Operators
-from fdms.utils.series import export_to_excel
 
 
 # STEP 13
+# TODO: Compute with the formulas of 'Corporate Sector' like GDPComponents (step 3), the formulas of USGC and UOGC are
+#       cut short in country_calculation.txt
 class CorporateSector(SumAndSpliceMixin):
+    @memoize(step=13)
     def perform_computation(self, df, ameco_h_df):
         splicer = Splicer()
         operators = Operators()
@@ -33,11 +34,9 @@ class CorporateSector(SumAndSpliceMixin):
             df, 'UTVC.1.0.0.0') - self.get_data(df, 'UWCC.1.0.0.0')
         series_data = splicer.butt_splice(base_series, operators.iin(new_data, value_if_null, value))
 
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
+        self.result.add(series_meta, series_data)
 
-        self.result.set_index(['Country Ameco', 'Variable Code'], drop=True, inplace=True)
+        self.result = self.result.to_frame()
         self.apply_scale()
-        export_to_excel(self.result, step=13, country=self.country)
+        self.export_result(step=13)
         return self.result
@@ -1,33 +1,68 @@
+import collections
 import datetime
 
+import numpy as np
 import pandas as pd
 
-from fdms.config import COLUMN_ORDER, LAST_YEAR
+from fdms.config import BASE_PERIOD, COLUMN_ORDER, LAST_YEAR
 from fdms.config.country_groups import EA, get_membership_date
-from fdms.utils.mixins import StepMixin
-from fdms.utils.series import export_to_excel
+from fdms.utils.block import YEAR_REGEX, year_labels, years_frame
+from fdms.utils.effective_rates import effective_rates
+from fdms.utils.memo import memoize
+from fdms.utils.mixins import StepMixin, add_reads
+from fdms.utils.operators import Operators
 from fdms.utils.splicer import Splicer
+from fdms.utils.transforms import Transforms
 
 
 # STEP 10
+# TODO: Compute with the formulas of 'Exchange rates and Interest rates' like GDPComponents (step 3), XNEF.1.0.99.0
+#       uses extend()
 class ExchangeRates(StepMixin):
-    def perform_computation(self, ameco_db_df, xr_df, ameco_xne_us_df):
+    def _effective_rates(self, ameco_h_df, xr_df, trade_weights):
+        '''
+        Effective exchange rates of the country against the partner groups of trade_weights (read_trade_weights_xls),
+        computed for all the countries at once from their XNE (AMECO, extended with XR_IR) and PLCD series. Returns
+        an OrderedDict code -> pd.Series, empty without trade weights or ameco_h_df.
+        '''
+        rates = collections.OrderedDict()
+        if trade_weights is None or ameco_h_df is None:
+            return rates
+        reporters = trade_weights.index.get_level_values('Country')
+        if self.country not in set(reporters):
+            return rates
+        groups = list(collections.OrderedDict.fromkeys(trade_weights.index.get_level_values('Group')))
+        countries = sorted(set(reporters) | set(trade_weights.columns))
+        years = sorted(set(column for column in year_labels(ameco_h_df) + list(xr_df.columns)
+                           if YEAR_REGEX.search(str(column)) is not None))
+        if BASE_PERIOD not in years:
+            return rates
+        add_reads(['XNE.1.0.99.0', 'PLCD.3.1.0.0'])
+        xne = Operators().merge_block([
+            years_frame(ameco_h_df, [(country, 'XNE.1.0.99.0') for country in countries], years),
+            years_frame(xr_df, [(country, 'XNE.1.0.99.0') for country in countries], years)])
+        plcd = years_frame(ameco_h_df, [(country, 'PLCD.3.1.0.0') for country in countries], years)
+        weights = np.stack([trade_weights.loc[group].reindex(index=countries, columns=countries).fillna(0.0).values
+                            for group in groups])
+        position = countries.index(self.country)
+        for code, values in effective_rates(groups, xne.values, plcd.values, weights, years).items():
+            for group_position, group in enumerate(groups):
+                rates['{}.{}'.format(code, group)] = pd.Series(values[group_position, position], index=years)
+        return rates
+
+    @memoize(step=10)
+    def perform_computation(self, ameco_db_df, xr_df, ameco_xne_us_df, ameco_h_df=None, trade_weights=None):
         splicer = Splicer()
         variable = 'XNE.1.0.99.0'
         series_data = self.get_data(ameco_db_df, variable)
-        try:
+        if self.has_data(xr_df, variable):
             xr_data = self.get_data(xr_df, variable)
-        except KeyError:
-            pass
-        else:
             last_valid = xr_data.first_valid_index()
             for year in range(last_valid + 1, LAST_YEAR + 1):
                 series_data[year] = pd.np.nan
             series_data = splicer.ratio_splice(series_data.copy(), xr_data, kind='forward')
         series_meta = self.get_meta(variable)
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
+        self.result.add(series_meta, series_data)
 
         variables = ['ILN.1.0.0.0', 'ISN.1.0.0.0']
         sources = ['ILN.1.1.0.0', 'ISN.1.1.0.0']
@@ -36,15 +71,13 @@ class ExchangeRates(StepMixin):
             series_meta = self.get_meta(variable)
             series_data = self.get_data(ameco_db_df, sources[index], null_dates=null_dates)
             series_data = splicer.butt_splice(series_data, self.get_data(xr_df, sources[index]), kind='forward')
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, series_data)
 
         if self.country in EA:
             membership_date = get_membership_date(self.country)
             variable = 'XNE.1.0.99.0'
             for year in range(membership_date, LAST_YEAR + 1):
-                self.result.loc[self.result['Variable Code'] == 'XNE.1.0.99.0', year] = 1
+                self.result.set_value(self.country, 'XNE.1.0.99.0', year, 1)
 
             variable = 'XNEF.1.0.99.0'
             series_meta = self.get_meta(variable)
@@ -53,26 +86,20 @@ class ExchangeRates(StepMixin):
             if last_valid < LAST_YEAR:
                 for index in range(last_valid + 1, LAST_YEAR + 1):
                     series_data[index] = series_data[last_valid]
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, series_data)
 
             variable = 'XNEB.1.0.99.0'
             series_meta = self.get_meta(variable)
             series_data = self.get_data(self.result, 'XNE.1.0.99.0') * self.get_data(
                 self.result, 'XNEF.1.0.99.0')
             for year in range(membership_date, LAST_YEAR + 1):
-                self.result.loc[self.result['Variable Code'] == 'XNEF.1.0.99.0', year] = pd.np.nan
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+                self.result.set_value(self.country, 'XNEF.1.0.99.0', year, pd.np.nan)
+            self.result.add(series_meta, series_data)
         else:
             variable = 'XNEB.1.0.99.0'
             series_meta = self.get_meta(variable)
             series_data = self.get_data(self.result, 'XNE.1.0.99.0').copy()
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, series_data)
 
         variable = 'XNU.1.0.30.0'
         xne_us = self.get_data(xr_df, 'XNE.1.0.99.0', country='US')
@@ -82,9 +109,7 @@ class ExchangeRates(StepMixin):
             new_xne_us[year] = pd.np.nan
         series_meta = self.get_meta(variable)
         series_data = splicer.ratio_splice(new_xne_us, xne_us, kind='forward')
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
+        self.result.add(series_meta, series_data)
 
         # Effective exchange rates and relative unit labour costs, currently not calculated in FDMS+
         variables = ['PLCDQ.3.0.0.437', 'PLCDQ.3.0.30.437', 'XUNNQ.3.0.30.437', 'XUNRQ.3.0.30.437', 'PLCDQ.3.0.0.414',
@@ -94,45 +119,29 @@ class ExchangeRates(StepMixin):
                      'XUNNQ.3.0.30.417', 'XUNNQ.3.0.30.423', 'XUNNQ.3.0.30.424', 'XUNNQ.3.0.30.427', 'XUNNQ.3.0.30.435',
                      'XUNNQ.3.0.30.436', 'XUNNQ.3.0.30.441', 'XUNRQ.3.0.30.414', 'XUNRQ.3.0.30.415', 'XUNRQ.3.0.30.417',
                      'XUNRQ.3.0.30.424', 'XUNRQ.3.0.30.427', 'XUNRQ.3.0.30.435', 'XUNRQ.3.0.30.436']
+        # Computed from the trade weights when available, copied from AMECO DB otherwise
+        rates = self._effective_rates(ameco_h_df, xr_df, trade_weights)
         missing_vars = []
         for variable in variables:
             series_meta = self.get_meta(variable)
-            try:
-                series_data = self.get_data(ameco_db_df, variable)
-            except KeyError:
-                missing_vars.append(variable)
+            if variable in rates:
+                self.result.add(series_meta, rates[variable])
+                continue
+            if self.has_data(ameco_db_df, variable):
+                self.result.add(series_meta, self.get_data(ameco_db_df, variable))
             else:
-                series = pd.Series(series_meta)
-                series = series.append(series_data)
-                self.result = self.result.append(series, ignore_index=True, sort=True)
-
-        variables = ['PLCDQ.6.0.0.437', 'PLCDQ.6.0.0.435', 'PLCDQ.6.0.0.436']
-        sources = ['PLCDQ.3.0.0.437', 'PLCDQ.3.0.0.435', 'PLCDQ.3.0.0.436']
-        for index, variable in enumerate(variables):
-            series_meta = self.get_meta(variable)
-            try:
-                series_data = self.get_data(self.result, sources[index]).copy().pct_change() * 100
-            except (KeyError, IndexError):
                 missing_vars.append(variable)
-            else:
-                series = pd.Series(series_meta)
-                series = series.append(series_data)
-                self.result = self.result.append(series, ignore_index=True, sort=True)
+        for variable, series_data in rates.items():
+            if variable not in variables:
+                self.result.add(self.get_meta(variable), series_data)
 
-        variables = ['XUNNQ.6.0.30.437', 'XUNRQ.6.0.30.437', 'XUNNQ.6.0.30.435', 'XUNNQ.6.0.30.436', 'XUNRQ.6.0.30.435',
-                     'XUNRQ.6.0.30.436']
-        sources = ['XUNNQ.3.0.30.437', 'XUNRQ.3.0.30.437', 'XUNNQ.3.0.30.435', 'XUNNQ.3.0.30.436', 'XUNRQ.3.0.30.435',
-                   'XUNRQ.3.0.30.436']
-        for index, variable in enumerate(variables):
-            series_meta = self.get_meta(variable)
-            try:
-                series_data = self.get_data(self.result, sources[index]).copy().pct_change() * 100
-            except (KeyError, IndexError):
-                missing_vars.append(variable)
-            else:
-                series = pd.Series(series_meta)
-                series = series.append(series_data)
-                self.result = self.result.append(series, ignore_index=True, sort=True)
+        # Percent changes
+        variables = ['PLCDQ.6.0.0.437', 'PLCDQ.6.0.0.435', 'PLCDQ.6.0.0.436', 'XUNNQ.6.0.30.437', 'XUNRQ.6.0.30.437',
+                     'XUNNQ.6.0.30.435', 'XUNNQ.6.0.30.436', 'XUNRQ.6.0.30.435', 'XUNRQ.6.0.30.436']
+        sources = ['PLCDQ.3.0.0.437', 'PLCDQ.3.0.0.435', 'PLCDQ.3.0.0.436', 'XUNNQ.3.0.30.437', 'XUNRQ.3.0.30.437',
+                   'XUNNQ.3.0.30.435', 'XUNNQ.3.0.30.436', 'XUNRQ.3.0.30.435', 'XUNRQ.3.0.30.436']
+        Transforms([(source, 'pch', variable) for source, variable in zip(sources, variables)
+                    if variable not in rates]).apply(self, missing=missing_vars)
 
         # TODO: is it OK? these are missing in ameco_db: PLCDQ.3.0.0.414 PLCDQ.3.0.0.435 PLCDQ.3.0.0.436
         # PLCDQ.3.0.30.414 PLCDQ.3.0.30.435 PLCDQ.3.0.30.436 XUNNQ.3.0.30.414 XUNNQ.3.0.30.423 XUNNQ.3.0.30.435
@@ -141,7 +150,7 @@ class ExchangeRates(StepMixin):
         with open('errors_step_10.txt', 'w') as f:
             f.write('\n'.join(missing_vars))
 
-        self.result.set_index(['Country Ameco', 'Variable Code'], drop=True, inplace=True)
+        self.result = self.result.to_frame()
         self.apply_scale()
-        export_to_excel(self.result, step=10, country=self.country)
+        self.export_result(step=10)
         return self.result
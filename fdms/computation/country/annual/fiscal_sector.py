@@ -1,13 +1,15 @@
-import pandas as pd
-
 from fdms.config.country_groups import EU
+from fdms.utils.memo import memoize
 from fdms.utils.mixins import SumAndSpliceMixin
 from fdms.utils.splicer import Splicer
-from fdms.utils.series import export_to_excel
 
 
 # STEP 12
+# TODO: Compute with the formulas of 'Fiscal Sector' like GDPComponents (step 3). The formulas of UUCG, UTAT, UCRG and
+#       UUCGI are cut short in country_calculation.txt, EATTG, EATYG, EATSG (and FTTG, FTYG, FTSG using them) read the
+#       Cyclical adjustment database, its series have names instead of codes
 class FiscalSector(SumAndSpliceMixin):
+    @memoize(step=12)
     def perform_computation(self, df, ameco_h_df):
         splicer = Splicer()
         addends = {
@@ -46,16 +48,12 @@ class FiscalSector(SumAndSpliceMixin):
                 variable = 'UBLGE.1.0.0.0'
                 series_meta = self.get_meta(variable)
                 series_data = self.get_data(self.result, 'UBLG.1.0.0.0')
-                series = pd.Series(series_meta)
-                series = series.append(series_data)
-                self.result = self.result.append(series, ignore_index=True, sort=True)
+                self.result.add(series_meta, series_data)
 
                 variable = 'UYIGE.1.0.0.0'
                 series_meta = self.get_meta(variable)
                 series_data = self.get_data(df, 'UYIG.1.0.0.0')
-                series = pd.Series(series_meta)
-                series = series.append(series_data)
-                self.result = self.result.append(series, ignore_index=True, sort=True)
+                self.result.add(series_meta, series_data)
 
         addends = {
             'UBLGI.1.0.0.0': ['UBLG.1.0.0.0', 'UYIG.1.0.0.0'],
@@ -70,9 +68,7 @@ class FiscalSector(SumAndSpliceMixin):
         variable = 'UDGG.1.0.0.0'
         series_meta = self.get_meta(variable)
         series_data = self.get_data(self.result, 'UDGGL.1.0.0.0')
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
+        self.result.add(series_meta, series_data)
 
         # TODO: copy EATTG, EATYG and EATSG from cyclical adjustment database
         # for variable in ['EATTG', 'EATYG', 'EATSG']:
@@ -82,7 +78,7 @@ class FiscalSector(SumAndSpliceMixin):
         #     series = series.append(series_data)
         #     self.result = self.result.append(series, ignore_index=True, sort=True)
 
-        self.result.set_index(['Country Ameco', 'Variable Code'], drop=True, inplace=True)
+        self.result = self.result.to_frame()
         self.apply_scale()
-        export_to_excel(self.result, step=12, country=self.country)
+        self.export_result(step=12)
         return self.result
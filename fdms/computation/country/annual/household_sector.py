@@ -1,14 +1,17 @@
 import pandas as pd
 
 from fdms.config import BASE_PERIOD
+from fdms.utils.memo import memoize
 from fdms.utils.mixins import SumAndSpliceMixin
 from fdms.utils.splicer import Splicer
 from fdms.utils.operators import Operators
-from fdms.utils.series import export_to_excel
 
 
 # STEP 14
+# TODO: Compute with the formulas of 'Household Sector' like GDPComponents (step 3), the formulas of UVGH and USGH are
+#       cut short in country_calculation.txt
 class HouseholdSector(SumAndSpliceMixin):
+    @memoize(step=14)
     def perform_computation(self, result_1, result_7, ameco_h_df):
         # TODO: Check the scales of the output variables
         splicer = Splicer()
@@ -17,12 +20,12 @@ class HouseholdSector(SumAndSpliceMixin):
         # From SumAndSpliceMixin to calculate all the rest
         addends = {'UYOH.1.0.0.0': ['UOGH.1.0.0.0', 'UYNH.1.0.0.0']}
         self._sum_and_splice(addends, result_1, ameco_h_df, splice=False)
-        new_input_df = self.result.set_index(['Country Ameco', 'Variable Code'], drop=True)
+        new_input_df = self.result.to_frame()
         new_input_df = pd.concat([new_input_df, result_1], sort=True)
         addends = {'UVGH.1.0.0.0': ['UWCH.1.0.0.0', 'UYOH.1.0.0.0', 'UCTRH.1.0.0.0', '-UTYH.1.0.0.0', '-UCTPH.1.0.0.0']}
         self._sum_and_splice(addends, new_input_df, ameco_h_df, splice=False)
 
-        new_input_df = self.result.set_index(['Country Ameco', 'Variable Code'], drop=True)
+        new_input_df = self.result.to_frame()
         new_input_df = pd.concat([new_input_df, result_1], sort=True)
         addends = {'UVGHA.1.0.0.0': ['UVGH.1.0.0.0', 'UEHH.1.0.0.0']}
         self._sum_and_splice(addends, new_input_df, ameco_h_df, splice=False)
@@ -31,7 +34,7 @@ class HouseholdSector(SumAndSpliceMixin):
                                     '-UCTPH.1.0.0.0', 'UEHH.1.0.0.0', '-UCPH0.1.0.0.0']}
         self._sum_and_splice(addends, new_input_df, ameco_h_df, splice=False)
 
-        new_input_df = self.result.set_index(['Country Ameco', 'Variable Code'], drop=True)
+        new_input_df = self.result.to_frame()
         new_input_df = pd.concat([new_input_df, result_1], sort=True)
         # Since this formula is using *ignoremissingsubtract* instead of *ignoremissingsum*, we change the sign of all
         # but the first variables in the list
@@ -43,20 +46,16 @@ class HouseholdSector(SumAndSpliceMixin):
         uvgha_base_period = uvgha_data.loc[BASE_PERIOD]
         ovgha_data = operators.rebase(uvgha_data / pcph_data, BASE_PERIOD) / 100 * uvgha_base_period
         series_meta = self.get_meta('OVGHA.3.0.0.0')
-        series = pd.Series(series_meta)
-        series = series.append(ovgha_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
+        self.result.add(series_meta, ovgha_data)
 
         usgh_data = self.get_data(new_input_df, 'USGH.1.0.0.0')
         uvgha_data = self.get_data(new_input_df, 'UVGHA.1.0.0.0')
         asgh_ameco_h = self.get_data(ameco_h_df, 'ASGH.1.0.0.0')
         asgh_data = splicer.butt_splice(asgh_ameco_h, usgh_data / uvgha_data * 100)
         series_meta = self.get_meta('ASGH.1.0.0.0')
-        new_series = pd.Series(series_meta)
-        new_series = new_series.append(asgh_data)
-        self.result = self.result.append(new_series, ignore_index=True, sort=True)
+        self.result.add(series_meta, asgh_data)
 
-        self.result.set_index(['Country Ameco', 'Variable Code'], drop=True, inplace=True)
+        self.result = self.result.to_frame()
         self.apply_scale()
-        export_to_excel(self.result, step=14, country=self.country)
+        self.export_result(step=14)
         return self.result
@@ -1,37 +1,39 @@
-import pandas as pd
 import re
 
+import pandas as pd
+
 from fdms.config import BASE_PERIOD
 from fdms.config.country_groups import EU, FCRIF
+from fdms.utils.memo import memoize
 from fdms.utils.mixins import StepMixin
-from fdms.utils.series import export_to_excel
 from fdms.utils.operators import Operators
 from fdms.utils.splicer import Splicer
+from fdms.utils.transforms import Transforms
 
 
 # STEP 11
+# TODO: Compute with the formulas of 'Labour Market' like GDPComponents (step 3). read_formulas flattens the If
+#       branches of FETD9 and FWTD9 (the last formula wins) and the formula of NUTN.1.0.0.0 is cut short in
+#       country_calculation.txt
 class LabourMarket(StepMixin):
+    @memoize(step=11)
     def perform_computation(self, df, ameco_df):
         operators = Operators()
         splicer = Splicer()
         variables = ['FETD9.1.0.0.0', 'FWTD9.1.0.0.0']
         if self.country in FCRIF:
-            try:
+            if self.has_data(df, 'FETD.1.0.0.0') and self.has_data(df, 'FWTD.1.0.0.0'):
                 fetd9 = self.get_data(df, 'FETD.1.0.0.0')
                 fwtd9 = self.get_data(df, 'FWTD.1.0.0.0')
-            except KeyError:
+            else:
                 fetd9 = self.get_data(df, 'NETD.1.0.0.0')
                 fwtd9 = self.get_data(df, 'NWTD.1.0.0.0')
             series_meta = self.get_meta(variables[0])
             series_data = fetd9.copy()
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, series_data)
             series_meta = self.get_meta(variables[1])
             series_data = fwtd9.copy()
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, series_data)
         else:
             series_meta = self.get_meta(variables[0])
             if self.country == 'US':
@@ -43,14 +45,10 @@ class LabourMarket(StepMixin):
                 fwtd9 = splicer.ratio_splice(self.get_data(ameco_df, variables[0]), self.get_data(
                     df, 'NWTD'), kind='forward')
             series_data = fetd9.copy()
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, series_data)
             series_meta = self.get_meta(variables[1])
             series_data = fwtd9.copy()
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, series_data)
 
         variables = ['UWCD', 'UWWD', 'UWSC']
         variables_1 = [variable + '.1.0.0.0' for variable in variables]
@@ -60,19 +58,17 @@ class LabourMarket(StepMixin):
         private_consumption_o = 'OCPH.1.0.0.0'
         variables_r1 = [re.sub('^U', 'R', variable) + 'C.3.1.0.0' for variable in variables]
         services = ['UMSN', 'UXSN', 'UMSN.1.0.0.0', 'UXSN.1.0.0.0']
+        real_compensation = pd.DataFrame([self.get_data(df, variable) / fwtd9 / self.get_data(
+            df, private_consumption_u) / self.get_data(df, private_consumption_o) for variable in variables_1],
+            index=variables_r1)
+        real_compensation = operators.rebase_block(real_compensation, base_period=BASE_PERIOD)
         for index, variable in enumerate(variables):
             series_meta = self.get_meta(variables_h1[index])
             series_data = self.get_data(df, variables_1[index]) / fwtd9
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, series_data)
 
             series_meta = self.get_meta(variables_r1[index])
-            series_data = operators.rebase(self.get_data(df, variables_1[index]) / fwtd9 / self.get_data(
-                df, private_consumption_u) / self.get_data(df, private_consumption_o), base_period=BASE_PERIOD)
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, real_compensation.loc[variables_r1[index]])
 
         variables = ['RVGDE.1.0.0.0', 'RVGEW.1.0.0.0', 'RVGEW.1.0.0.0', 'ZATN9.1.0.0.0', 'ZETN9.1.0.0.0',
                      'ZUTN9.1.0.0.0']
@@ -89,16 +85,12 @@ class LabourMarket(StepMixin):
             series_data = self.get_data(df, numerators[index]) / denominator_series
             if variable in ['ZATN9.1.0.0.0', 'ZETN9.1.0.0.0', 'ZUTN9.1.0.0.0']:
                 series_data = series_data * 100
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, series_data)
 
         variable = 'FETD9.6.0.0.0'
         series_meta = self.get_meta(variable)
         series_data = fetd9.pct_change() * 100
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
+        self.result.add(series_meta, series_data)
 
         variable = 'ZUTN.1.0.0.0'
         if self.country in EU:
@@ -112,10 +104,7 @@ class LabourMarket(StepMixin):
             series_data = splicer.butt_splice(self.get_data(ameco_df, variable), self.get_data(
                 ameco_df, variable), kind='forward')
         else:
-            try:
-                netn1 = self.get_data(df, 'NETN.1.0.0.0')
-            except KeyError:
-                netn1 = self.get_data(df, 'NETN')
+            netn1 = self.get_data(df, self.first_available(['NETN.1.0.0.0'], df) or 'NETN')
             series_data = splicer.level_splice(self.get_data(ameco_df, variable), self.get_data(
                 df, 'NUTN.1.0.0.0') / (self.get_data(df, 'NUTN.1.0.0.0') + self.get_data(df, netn1)) * 100)
 
@@ -135,21 +124,14 @@ class LabourMarket(StepMixin):
                 index]) / denominator_series, base_period=BASE_PERIOD)
             if index == 0:
                 plcd3 = series_data.copy()
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, series_data)
 
         variables = ['RWCDC.3.1.0.0', 'PLCD.3.1.0.0', 'QLCD.3.1.0.0', 'HWCDW.1.0.0.0', 'HWSCW.1.0.0.0', 'HWWDW.1.0.0.0',
                      'RVGDE.1.0.0.0', 'RVGEW.1.0.0.0']
         variables_6 = [re.sub('.....0.0$', '.6.0.0.0', variable) for variable in variables]
-        for index, variable in enumerate(variables):
-            series_meta = self.get_meta(variables_6[index])
-            series_data = self.get_data(self.result, variable).pct_change() * 100
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+        Transforms([(variable, 'pch', variables_6[index]) for index, variable in enumerate(variables)]).apply(self)
 
-        self.result.set_index(['Country Ameco', 'Variable Code'], drop=True, inplace=True)
+        self.result = self.result.to_frame()
         self.apply_scale()
-        export_to_excel(self.result, step=11, country=self.country)
+        self.export_result(step=11)
         return self.result
@@ -1,13 +1,15 @@
-import pandas as pd
 import re
 
 from fdms.config.variable_groups import NA_IS_VA
+from fdms.utils.memo import memoize
 from fdms.utils.mixins import SumAndSpliceMixin
-from fdms.utils.series import export_to_excel
 
 
 # STEP 5
+# TODO: Compute with the formulas of 'National Accounts (Value) - additional variables, and contribution to %change in
+#       cost' like GDPComponents (step 3), the 6 of them compile
 class NationalAccountsValue(SumAndSpliceMixin):
+    @memoize(step=5)
     def perform_computation(self, df, ameco_db_df, ovgd1):
         addends = {
             'UVGN.1.0.0.0': ['UVGD.1.0.0.0', 'UBRA.1.0.0.0'],
@@ -26,9 +28,7 @@ class NationalAccountsValue(SumAndSpliceMixin):
         series_meta = self.get_meta(variable)
         series_data = (self.get_data(df, total_employment) * self.get_data(df, compensation) / self.get_data(
             df, real_compensation))
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
+        self.result.add(series_meta, series_data)
 
         for variable in NA_IS_VA:
             variable_1 = variable + '.1.0.0.0'
@@ -43,11 +43,9 @@ class NationalAccountsValue(SumAndSpliceMixin):
                 series_data = self.get_data(self.result, variable_1) / self.get_data(df, 'UVGD.1.0.0.0') * pch
             except (IndexError, KeyError):
                 series_data = self.get_data(df, variable_1) / self.get_data(df, 'UVGD.1.0.0.0') * pch
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, series_data)
 
-        self.result.set_index(['Country Ameco', 'Variable Code'], drop=True, inplace=True)
+        self.result = self.result.to_frame()
         self.apply_scale()
-        export_to_excel(self.result, step=5, country=self.country)
+        self.export_result(step=5)
         return self.result
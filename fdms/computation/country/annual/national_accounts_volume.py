@@ -1,5 +1,6 @@
 import logging
 
+from fdms.utils.memo import memoize
 from fdms.utils.mixins import StepMixin
 
 logging.basicConfig(filename='error.log',
@@ -13,11 +14,16 @@ import re
 from fdms.config.variable_groups import NA_VO, T_VO
 from fdms.config.country_groups import FCWVACP
 from fdms.utils.splicer import Splicer
+from fdms.utils.transforms import Transforms
 from fdms.config import BASE_PERIOD
-from fdms.utils.series import export_to_excel
 
 
 # STEP 4
+# TODO: Compute with the formulas of 'National Accounts (Volume) - splice AMECO Historical data...', 'Contribution to
+#       percent change in GDP (calculation for additional variables)' and 'Set up OVGD.6.1.212.0 for World GDP volume
+#       table' like GDPComponents (step 3). read_formulas flattens the If branches on the country groups (the last
+#       formula of a series wins), OMGS, OXGS, OIGNR, OUTT and OITT use level() and the formulas of OBGN, OBSN, OBGS,
+#       OIGP, OUNF and OUNT are cut short in country_calculation.txt (lines of at most 255 characters)
 class NationalAccountsVolume(StepMixin):
     splicer = Splicer()
 
@@ -32,9 +38,7 @@ class NationalAccountsVolume(StepMixin):
                 logger.error('Missing data for variable {} in national accounts volume'.format(variable))
                 return
         series_meta = self.get_meta(variable)
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
+        self.result.add(series_meta, series_data)
 
     def _get_data(self, variable, components, df=None, ameco_df=None):
         splice_series_2 = None
@@ -58,6 +62,7 @@ class NationalAccountsVolume(StepMixin):
                 splice_series_2 = (splice_series_1 / u_series.shift(1) - 1) * 100
         return base_series, splice_series_1, splice_series_2
 
+    @memoize(step=4)
     def perform_computation(self, df, ameco_df):
         for variable in NA_VO:
             new_variable = variable + '.1.0.0.0'
@@ -70,9 +75,7 @@ class NationalAccountsVolume(StepMixin):
                 except KeyError:
                     logger.error('Failed to calculate {} (national accounts volume).'.format(variable))
                     continue
-                new_meta = pd.Series(self.get_meta(new_variable))
-                new_series = new_meta.append(new_data)
-                self.result = self.result.append(new_series, ignore_index=True)
+                self.result.add(self.get_meta(new_variable), new_data)
             else:
                 try:
                     series = self.get_data(df, variable)
@@ -89,9 +92,7 @@ class NationalAccountsVolume(StepMixin):
                 splice_series = (series / u_series.shift(1) - 1) * 100
                 # RatioSplice(base, level(series)) = base * (1 + 0,01 * series)
                 new_data = self.splicer.splice_and_level_forward(series11, splice_series)
-                new_meta = pd.Series(self.get_meta(new_variable))
-                new_series = new_meta.append(new_data)
-                self.result = self.result.append(new_series, ignore_index=True)
+                self.result.add(self.get_meta(new_variable), new_data)
 
         # Imports / exports of goods and services
         omgs, oxgs, obgn, obsn, oigp = 'OMGS.1.0.0.0', 'OXGS.1.0.0.0', 'OBGN.1.0.0.0', 'OBSN.1.0.0.0', 'OIGP.1.0.0.0'
@@ -205,11 +206,10 @@ class NationalAccountsVolume(StepMixin):
 
             # TODO: Review this
             new_vars = ['OXGS.1.0.0.0', 'OVGE.1.0.0.0']
-            if new_variable in self.result['Variable Code'].values.tolist() + new_vars:
+            if (self.country, new_variable) in self.result or new_variable in new_vars:
                 if new_variable not in new_vars:
                     result_series_index = self.get_index(new_variable)
-                    series_orig = self.result.loc[result_series_index]
-                    data_orig = pd.to_numeric(series_orig.filter(regex=r'[0-9]{4}'), errors='coerce')
+                    data_orig = self.get_data(self.result, new_variable)
                 else:
                     logger.error('Missing data for variable {} in national accounts volume'.format(u1_variable))
 
@@ -219,9 +219,7 @@ class NationalAccountsVolume(StepMixin):
                     u1_series = self.get_data(df, u1_variable)
                     value_to_rebase = data_orig[BASE_PERIOD] / u1_series[BASE_PERIOD]
                     series_data = data_orig * value_to_rebase
-                    series = pd.Series(series_meta)
-                    series = series.append(series_data)
-                    self.result.iloc[result_series_index] = series
+                    self.result.replace(result_series_index, series_meta, series_data)
                 else:
                     logger.error('Missing data for variable {} in national accounts volume'.format(u1_variable))
 
@@ -229,9 +227,7 @@ class NationalAccountsVolume(StepMixin):
                 variable_6 = var + '.6.0.0.0'
                 series_meta = self.get_meta(variable_6)
                 series_data = data_orig.pct_change() * 100
-                series = pd.Series(series_meta)
-                series = series.append(series_data)
-                self.result = self.result.append(series, ignore_index=True, sort=True)
+                self.result.add(series_meta, series_data)
 
                 # Contribution to percent change in GDP
                 variable_c1 = re.sub('^.', 'C', var) + '.1.0.0.0'
@@ -258,28 +254,19 @@ class NationalAccountsVolume(StepMixin):
                 except KeyError:
                     logger.error('Missing data for variable {} in national accounts volume'.format(new_variable))
                     continue
-                series = pd.Series(series_meta)
-                series = series.append(series_data)
                 # if variable_c1 == 'CMGS.1.0.0.0':
                 #     import code;code.interact(local=locals())
-                self.result = self.result.append(series, ignore_index=True, sort=True)
+                self.result.add(series_meta, series_data)
 
             else:
                 logger.error('Missing data for variable {} in national accounts volume'.format(new_variable))
-            r = self.result.copy()
             if new_variable == 'OVGD.1.0.0.0':
                 ovgd1 = self.get_data(self.result, 'OVGD.1.0.0.0')
             # if variable_c1 == 'CMGS.1.0.0.0':
             #     import code;code.interact(local=locals())
 
         # Contribution to percent change in GDP (calculation for additional variables)
-        var = 'CMGS.1.0.0.0'
-        series_meta = self.get_meta(var)
-        series_data = -self.get_data(self.result, var)
-        index = self.get_index(var)
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result.iloc[index] = series
+        Transforms([('CMGS.1.0.0.0', 'neg', 'CMGS.1.0.0.0')]).apply(self)
         var = 'CBGS.1.0.0.0'
         exports = 'CXGS.1.0.0.0'
         imports = 'CMGS.1.0.0.0'
@@ -287,9 +274,7 @@ class NationalAccountsVolume(StepMixin):
         series_meta['Variable Code'] = var
         series_data = self.get_data(self.result, exports) + self.get_data(self.result, imports)
         index = self.get_index(var)
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
+        self.result.add(series_meta, series_data)
         # TODO: If Country in group 'Forecast: Countries with volumes at constant prices' line 202 country calc
 
         # Per-capita GDP
@@ -301,18 +286,12 @@ class NationalAccountsVolume(StepMixin):
         total_population = 'NPTD.1.0.0.0'
         potential_gdp = 'OVGD.1.0.0.0'
         series_meta = self.get_meta(new_variable)
-        series_6_meta = self.get_meta(variable_6)
         ameco_series = self.get_data(ameco_df, ameco_variable)
         splice_series = ovgd1 / self.get_data(df, total_population)
         splicer = Splicer()
         series_data = splicer.ratio_splice(ameco_series, splice_series, kind='forward')
-        series_6_data = series_data.pct_change() * 100
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
-        series_6 = pd.Series(series_6_meta)
-        series_6 = series_6.append(series_6_data)
-        self.result = self.result.append(series_6, ignore_index=True, sort=True)
+        self.result.add(series_meta, series_data)
+        Transforms([(new_variable, 'pch', variable_6)]).apply(self)
         # TODO: Do not add series if they're alreade there, i.e. df.loc['BE','UMGS'] is repeated
 
         # Terms of trade
@@ -321,27 +300,22 @@ class NationalAccountsVolume(StepMixin):
         exports_2 = ['OXGN.1.0.0.0', 'OXSN.1.0.0.0', 'OXGS.1.0.0.0']
         imports_1 = ['UMGN.1.0.0.0', 'UMSN.1.0.0.0', 'UMGS.1.0.0.0']
         imports_2 = ['OMGN.1.0.0.0', 'OMSN.1.0.0.0', 'OMGS.1.0.0.0']
+        terms_of_trade = {}
         for index, variable in enumerate(variables):
-            series_meta = self.get_meta(variable)
-            series_data = (self.get_data(df, exports_1[index]) / self.get_data(self.result, exports_2[index]) / (
-                    self.get_data(df, imports_1[index]) / self.get_data(self.result, imports_2[index]))) * 100
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
-            variable_6 = re.sub('3', '6', variable)
-            series_meta = self.get_meta(variable_6)
-            series_data = series_data.pct_change() * 100
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            terms_of_trade[variable] = (self.get_data(df, exports_1[index]) / self.get_data(
+                self.result, exports_2[index]) / (self.get_data(df, imports_1[index]) / self.get_data(
+                    self.result, imports_2[index]))) * 100
+        transforms = Transforms([(variable, 'pch', re.sub('3', '6', variable)) for variable in variables])
+        terms_of_trade_6 = transforms.evaluate(self, sources=terms_of_trade)
+        for variable, variable_6 in zip(variables, terms_of_trade_6):
+            self.result.add(self.get_meta(variable), terms_of_trade[variable])
+            self.result.add(self.get_meta(variable_6), terms_of_trade_6[variable_6])
 
         # Set up OVGD.6.1.212.0 for World GDP volume table
         variable = 'OVGD.6.1.212.0'
         series_meta = self.get_meta(variable)
         series_data = self.get_data(self.result, 'OVGD.6.0.0.0')
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
+        self.result.add(series_meta, series_data)
 
         # Convert percent change of trade variables (volume) from national currency to USD
         for variable in T_VO:
@@ -349,16 +323,12 @@ class NationalAccountsVolume(StepMixin):
             variable_6 = variable + '.6.0.0.0'
             series_meta = self.get_meta(new_variable)
             series_data = self.get_data(self.result, variable_6)
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            self.result.add(series_meta, series_data)
 
         series_meta = self.get_meta('OVGD.1.0.0.0')
-        series = pd.Series(series_meta)
         # TODO: This shouldn't be needed... Check what's going on
-        series = series.append(ovgd1)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
-        self.result.set_index(['Country Ameco', 'Variable Code'], drop=True, inplace=True)
+        self.result.add(series_meta, ovgd1)
+        self.result = self.result.to_frame()
         self.apply_scale()
-        export_to_excel(self.result, step=4, country=self.country)
+        self.export_result(step=4)
         return self.result, ovgd1
@@ -1,15 +1,17 @@
-import pandas as pd
 import re
 
 from fdms.config import BASE_PERIOD
 from fdms.config.variable_groups import PD
+from fdms.utils.memo import memoize
 from fdms.utils.mixins import StepMixin
-from fdms.utils.series import export_to_excel
-from fdms.utils.operators import Operators
+from fdms.utils.transforms import Transforms
 
 
 # STEP 7
+# TODO: Compute with the formulas of 'Prices - splice AMECO Historical data...' and 'GNI (GDP deflator)' like
+#       GDPComponents (step 3), ZCPIH.6.0.0.0 uses iif()
 class Prices(StepMixin):
+    @memoize(step=7)
     def perform_computation(self, df):
         '''splice AMECO Historical data with forecast data and calculate percent change, and GNI (GDP deflator)'''
         zcpih, zcpih_6, zcpin = 'ZCPIH', 'ZCPIH.6.0.0.0', 'ZCPIN'
@@ -20,20 +22,14 @@ class Prices(StepMixin):
             series_data = self.get_data(df, zcpih)
         except KeyError:
             series_data = self.get_data(df, zcpin)
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
-        operators = Operators()
+        self.result.add(series_meta, series_data)
+        ratios = {}
         for variable in PD:
             variable_u1 = re.sub('^P', 'U', re.sub('.3.1.0.0', '.1.0.0.0', variable))
             variable_o1 = re.sub('^P', 'O', re.sub('.3.1.0.0', '.1.0.0.0', variable))
-            # series_meta = self.get_meta(variable_o1)
-            # series_meta['Variable Code'] = variable
-            series_meta = self.get_meta(variable)
-            series_data = operators.rebase(self.get_data(df, variable_u1) / self.get_data(df, variable_o1), BASE_PERIOD)
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+            ratios[variable] = self.get_data(df, variable_u1) / self.get_data(df, variable_o1)
+        Transforms([(variable, 'rebase', variable) for variable in PD], base_period=BASE_PERIOD).apply(
+            self, sources=ratios)
 
         # GNI (GDP deflator)
         variable = 'OVGN.1.0.0.0'
@@ -42,16 +38,10 @@ class Prices(StepMixin):
         gross_domestic_product = 'PVGD.3.1.0.0'
         series_meta = self.get_meta(variable)
         series_data = self.get_data(df, gross_income) / self.get_data(self.result, gross_domestic_product) * 100
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
-        series_meta = self.get_meta(variable_6)
-        series_data = series_data.copy().pct_change() * 100
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
+        self.result.add(series_meta, series_data)
+        Transforms([(variable, 'pch', variable_6)]).apply(self)
 
-        self.result.set_index(['Country Ameco', 'Variable Code'], drop=True, inplace=True)
+        self.result = self.result.to_frame()
         self.apply_scale()
-        export_to_excel(self.result, step=7, country=self.country)
+        self.export_result(step=7)
         return self.result
@@ -1,14 +1,16 @@
-import pandas as pd
 import re
 
 from fdms.config.variable_groups import NA_IS_VA
+from fdms.utils.memo import memoize
 from fdms.utils.mixins import StepMixin
-from fdms.utils.series import export_to_excel
 from fdms.utils.splicer import Splicer
 
 
 # STEP 6
+# TODO: Compute with the formulas of 'Recalculate UVGDH.1.0.0.0 and pull KNP.1.0.212.0 from AMECO' like GDPComponents
+#       (step 3), UVGDH.1.0.0.0 uses iif()
 class RecalculateUvgdh(StepMixin):
+    @memoize(step=6)
     def perform_computation(self, df, ameco_df):
         uvgdh, uvgdh_1, knp = 'UVGDH', 'UVGDH.1.0.0.0', 'KNP.1.0.212.0'
         series_meta = self.get_meta(uvgdh)
@@ -18,17 +20,13 @@ class RecalculateUvgdh(StepMixin):
             series_data = splicer.ratio_splice(series_data, self.get_data(df, uvgdh_1), type='forward')
         except KeyError:
             series_data = self.get_data(df, uvgdh)
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
+        self.result.add(series_meta, series_data)
 
         series_meta = self.get_meta(knp)
         series_data = self.get_data(ameco_df, knp)
-        series = pd.Series(series_meta)
-        series = series.append(series_data)
-        self.result = self.result.append(series, ignore_index=True, sort=True)
-        self.result.set_index(['Country Ameco', 'Variable Code'], drop=True, inplace=True)
+        self.result.add(series_meta, series_data)
+        self.result = self.result.to_frame()
         self.apply_scale()
-        export_to_excel(self.result, step=6, country=self.country)
+        self.export_result(step=6)
 
         return self.result
@@ -1,3 +1,4 @@
+import collections
 import logging
 
 logging.basicConfig(filename='error.log',
@@ -5,64 +6,72 @@ logging.basicConfig(filename='error.log',
                     level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-import pandas as pd
+import numpy as np
 
 from fdms.config.variable_groups import TM, NA_VO, TM_TBBO, TM_TBM
+from fdms.utils.block import YEAR_REGEX, year_labels, years_frame
+from fdms.utils.memo import memoize
 from fdms.utils.mixins import StepMixin
 from fdms.utils.splicer import Splicer
 from fdms.utils.operators import Operators
-from fdms.utils.series import export_to_excel
+
+# All transfer matrix variables are converted to 1.0.0.0, except National Account (volume)
+TRANSFERRED = set(TM) - set(NA_VO)
 
 
 # STEP 1
 class TransferMatrix(StepMixin):
+    @memoize(step=1)
     def perform_computation(self, df, ameco_df):
-        for index, row in df.iterrows():
-            variable = index[1]
-            if variable in TM:
-                # Convert all transfer matrix variables to 1.0.0.0 (except National Account (volume)) and splice in
-                # country desk forecast
-                if variable not in NA_VO:
-                    splicer = Splicer()
-                    operators = Operators()
-                    meta = self.get_meta(variable)
-                    new_variable = variable + '.1.0.0.0'
-                    meta1000 = self.get_meta(new_variable)
-                    meta['Variable Code'] = variable
-                    meta1000['Variable Code'] = new_variable
-                    splice_series = self.get_data(df, variable)
-                    base_series = None
-                    try:
-                        base_series = self.get_data(ameco_df, new_variable)
-                    except KeyError:
-                        logger.warning('Missing Ameco data for variable {} (transfer matrix)'.format(new_variable))
-                    orig_series = splice_series.copy()
-                    orig_series.name = None
-                    new_meta = pd.Series(meta)
-                    orig_series = new_meta.append(orig_series)
-                    if variable in TM_TBBO:
-                        new_series = splicer.butt_splice(base_series, splice_series, kind='forward')
-                        new_series.name = None
-                        new_meta = pd.Series(meta1000)
-                        new_series = new_meta.append(new_series)
-                        self.result = self.result.append(new_series, ignore_index=True)
-                    elif variable in TM_TBM:
-                        df_to_be_merged = pd.DataFrame([splice_series, base_series])
-                        new_series = operators.merge(df_to_be_merged)
-                        new_series.name = None
-                        new_meta = pd.Series(meta1000)
-                        new_series = new_meta.append(new_series)
-                        self.result = self.result.append(new_series, ignore_index=True)
-                    else:
-                        new_series = splicer.butt_splice(splicer.ratio_splice(
-                            base_series, splice_series, kind='forward'), splice_series, kind='forward')
-                        new_series.name = None
-                        new_meta = pd.Series(meta1000)
-                        new_series = new_meta.append(new_series)
-                        self.result = self.result.append(new_series, ignore_index=True)
-                    self.result = self.result.append(orig_series, ignore_index=True)
+        '''
+        The transfer matrix variables of df are spliced with the AMECO series of their 1.0.0.0 codes all at once:
+        butt spliced (TM_TBBO), merged (TM_TBM) or ratio and then butt spliced (the others). Every variable adds its
+        1.0.0.0 series and its forecast series to the result, in the order of the rows of df.
+        '''
+        codes = df.index.get_level_values('Variable Code')
+        selected = [code for code in codes if code in TRANSFERRED]
+        variables = list(collections.OrderedDict.fromkeys(selected))
+        keys = [(self.country, variable) for variable in variables]
+        missing = [key for key in keys if key not in df.index]
+        if missing:
+            raise KeyError(missing[0])
+        years = sorted(set(column for column in list(df.columns) + year_labels(ameco_df)
+                           if YEAR_REGEX.search(str(column)) is not None))
+        splice_df = years_frame(df, keys, years)
+        ameco_keys = [(self.country, variable + '.1.0.0.0') for variable in variables]
+        base_df = years_frame(ameco_df, ameco_keys, years)
+        for country, variable in ameco_keys:
+            if (country, variable) not in ameco_df.index:
+                logger.warning('Missing Ameco data for variable {} (transfer matrix)'.format(variable))
+
+        splicer = Splicer()
+        groups = np.array([1 if variable in TM_TBBO else 2 if variable in TM_TBM else 0 for variable in variables])
+        result = splice_df.values.copy()
+        for group in [0, 1, 2]:
+            rows = np.flatnonzero(groups == group)
+            if len(rows) == 0:
+                continue
+            base, splice = base_df.iloc[rows], splice_df.iloc[rows]
+            if group == 1:
+                spliced = splicer.splice_block(base, splice, method='butt', kind='forward')
+            elif group == 2:
+                spliced = Operators().merge_block([splice, base])
+            else:
+                spliced = splicer.splice_block(splicer.splice_block(base, splice, method='ratio', kind='forward'),
+                                               splice, method='butt', kind='forward')
+            result[rows] = spliced.values
+        # Without AMECO series the forecast is used as is
+        available = np.array([key in ameco_df.index for key in ameco_keys], dtype=bool)
+        result[~available] = splice_df.values[~available]
+
+        positions = {variable: position for position, variable in enumerate(variables)}
+        metas, values = [], []
+        for variable in selected:
+            metas.extend([self.get_meta(variable + '.1.0.0.0'), self.get_meta(variable)])
+            values.extend([result[positions[variable]], splice_df.values[positions[variable]]])
+        self.result.add_rows(metas, np.array(values).reshape(len(metas), len(years)), years)
 
-        self.result.set_index(['Country Ameco', 'Variable Code'], drop=True, inplace=True)
+        self.result = self.result.to_frame()
         self.apply_scale()
-        export_to_excel(self.result, step=1, country=self.country)
+        self.export_result(step=1)
         return self.result
@@ -0,0 +1,181 @@
+'''
+Runs the steps of a computation as a dependency graph.
+
+Every Task declares the names of the values it consumes (input dataframes, results of other steps, settings...) and
+the ones it produces. The scheduler links each consumed name to the task producing it and starts a task as soon as
+all its inputs are there, on a thread or a process pool, so a run takes as long as its longest chain of dependent
+tasks instead of the sum of all of them.
+
+Tasks must not change the values they consume in place, they are shared with the tasks running at the same time
+(with the process pool every task gets its own copy, and changes are lost).
+'''
+import logging
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(filename='error.log',
+                    format='{%(pathname)s:%(lineno)d} - %(asctime)s %(module)s %(levelname)s: %(message)s',
+                    level=logging.INFO)
+
+import collections
+import concurrent.futures
+
+from fdms.utils import profiler
+
+
+class Task:
+    '''
+    name     -- Unique name of the task.
+    function -- Called with the consumed values as keyword arguments, returns the produced value, or a tuple with
+                one value per produced name.
+    consumes -- Names of the values the task needs.
+    produces -- Names of the values the task returns, [name] by default.
+    '''
+    def __init__(self, name, function, consumes=(), produces=None):
+        self.name = name
+        self.function = function
+        self.consumes = list(consumes)
+        self.produces = [name] if produces is None else list(produces)
+
+    def __repr__(self):
+        return 'Task({})'.format(self.name)
+
+
+def _run_task(task, inputs):
+    '''Module level, so that tasks can be sent to a process pool'''
+    values = task.function(**inputs)
+    if len(task.produces) == 1:
+        return {task.produces[0]: values}
+    if len(values) != len(task.produces):
+        raise ValueError('Task {} returned {} values, {} expected'.format(task.name, len(values), len(task.produces)))
+    return dict(zip(task.produces, values))
+
+
+def _run_profiled_task(task, inputs):
+    '''_run_task on a process pool with profiling on, returns what the process recorded too (profiler.collect)'''
+    return _run_task(task, inputs), profiler.collect()
+
+
+class Scheduler:
+    EXECUTORS = {'thread': concurrent.futures.ThreadPoolExecutor, 'process': concurrent.futures.ProcessPoolExecutor}
+
+    def __init__(self, tasks=()):
+        self.tasks = collections.OrderedDict()
+        self.producers = {}
+        for task in tasks:
+            self.add(task)
+
+    def add(self, task):
+        if task.name in self.tasks:
+            raise ValueError('Duplicated task {}'.format(task.name))
+        for name in task.produces:
+            if name in self.producers:
+                raise ValueError('{} is produced by {} and {}'.format(name, self.producers[name].name, task.name))
+        self.tasks[task.name] = task
+        for name in task.produces:
+            self.producers[name] = task
+        return task
+
+    def dependencies(self, task):
+        '''Names of the tasks producing the values consumed by task'''
+        return [self.producers[name].name for name in task.consumes if name in self.producers]
+
+    def required(self, targets, values=()):
+        '''Names of the tasks that must run to produce targets when values are given, walking back the consumed
+        values from the targets'''
+        unknown = [name for name in targets if name not in values and name not in self.producers]
+        if unknown:
+            raise KeyError('No task produces {}'.format(', '.join(unknown)))
+        required = set()
+        pending = [name for name in targets if name not in values]
+        while pending:
+            task = self.producers[pending.pop()]
+            if task.name not in required:
+                required.add(task.name)
+                # The inputs nobody produces are checked by run
+                pending.extend(name for name in task.consumes if name not in values and name in self.producers)
+        return [name for name in self.tasks if name in required]
+
+    def order(self):
+        '''Task names in an order that respects the dependencies, the order they were added in otherwise'''
+        waiting = collections.OrderedDict((name, set(self.dependencies(task))) for name, task in self.tasks.items())
+        order = []
+        while waiting:
+            ready = [name for name, dependencies in waiting.items() if not dependencies]
+            if not ready:
+                raise ValueError('Circular dependencies between tasks {}'.format(', '.join(waiting)))
+            for name in ready:
+                del waiting[name]
+                order.append(name)
+            for dependencies in waiting.values():
+                dependencies.difference_update(ready)
+        return order
+
+    def _check_inputs(self, values):
+        missing = sorted(set(name for task in self.tasks.values() for name in task.consumes
+                             if name not in self.producers and name not in values))
+        if missing:
+            raise KeyError('Missing inputs {}'.format(', '.join(missing)))
+
+    def run(self, values=None, executor='thread', workers=None, targets=None):
+        '''
+        Runs all the tasks and returns a dict with the input values and the values produced by the tasks.
+
+        values   -- Values consumed by the tasks but not produced by any of them. The tasks whose values are all
+                    given are not run.
+        executor -- 'thread', 'process' or None to run the tasks one after the other, in self.order().
+        workers  -- Size of the pool, the concurrent.futures default if None.
+        targets  -- Names of the values wanted, only the tasks they need are run (all of them if None).
+        '''
+        values = dict(values or {})
+        if targets is not None:
+            required = self.required(targets, values)
+            scheduler = Scheduler([task for name, task in self.tasks.items() if name in required])
+            return scheduler.run(values, executor=executor, workers=workers)
+        skipped = [task for task in self.tasks.values() if all(name in values for name in task.produces)]
+        if skipped:
+            # The values were given, no need to compute them
+            scheduler = Scheduler([task for task in self.tasks.values() if task not in skipped])
+            return scheduler.run(values, executor=executor, workers=workers)
+        self._check_inputs(values)
+        order = self.order()
+        if executor is None or workers == 1:
+            for name in order:
+                task = self.tasks[name]
+                values.update(_run_task(task, {key: values[key] for key in task.consumes}))
+            return values
+        if executor not in self.EXECUTORS:
+            raise ValueError('Unknown executor {}'.format(executor))
+
+        # The processes of the pool hand what they profiled back with their values
+        profiled = executor == 'process' and profiler.is_enabled()
+        run_task = _run_profiled_task if profiled else _run_task
+        waiting = collections.OrderedDict((name, set(self.dependencies(self.tasks[name]))) for name in order)
+        with self.EXECUTORS[executor](max_workers=workers) as pool:
+            running = {}
+            error = None
+            while waiting or running:
+                if error is None:
+                    for name in [name for name, dependencies in waiting.items() if not dependencies]:
+                        task = self.tasks[name]
+                        del waiting[name]
+                        running[pool.submit(run_task, task, {key: values[key] for key in task.consumes})] = name
+                if not running:
+                    break
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                        if profiled:
+                            result, events = result
+                            profiler.merge(events)
+                        values.update(result)
+                    except Exception as e:
+                        logger.error('Task {} failed: {}'.format(name, e))
+                        error = error or e
+                        continue
+                    for dependencies in waiting.values():
+                        dependencies.discard(name)
+            if error is not None:
+                raise error
+        return values
@@ -9,7 +9,22 @@ COUNTRY = os.environ.get('DMS_COUNTRY') or DEFAULT_COUNTRY
 AMECO = os.path.join(BASE_DIR, 'sample_data/AMECO_H.TXT')
 FORECAST = os.path.join(BASE_DIR, 'sample_data/{}.Forecast.SF2018.xlsm'.format(COUNTRY))
 AMECO_SHEET = COUNTRY
-COUNTRY_CALCULATION_TXT = 'fdms/utils/country_calculation.txt'
+# Double export weights of the partner groups of the effective exchange rates. No weights ship with the sample data:
+# unless DMS_TRADE_WEIGHTS names a workbook, the effective rates are not computed and are copied from AMECO DB
+TRADE_WEIGHTS = os.environ.get('DMS_TRADE_WEIGHTS') or os.path.join(BASE_DIR, 'sample_data/TRADE_WEIGHTS.xlsx')
+COUNTRY_CALCULATION_TXT = os.path.join(BASE_DIR, 'utils/country_calculation.txt')
+
+# Parsed copies of the input workbooks, set DMS_CACHE=0 to always read the original files
+CACHE_DIR = os.environ.get('DMS_CACHE_DIR') or os.path.join(PROJECT_ROOT, '.fdms_cache')
+USE_CACHE = os.environ.get('DMS_CACHE', '1') != '0'
+STORE_DIR = os.path.join(CACHE_DIR, 'store')
+# Variable codes produced by every step in the last runs of each country, see fdms.computation.annual_series
+CATALOG_DIR = os.path.join(CACHE_DIR, 'variables')
+# Results of the steps by the hash of their inputs, see fdms.utils.memo: DMS_MEMO=0 to always compute them, the least
+# recently used are removed above DMS_MEMO_SIZE megabytes
+MEMO_DIR = os.path.join(CACHE_DIR, 'steps')
+USE_MEMO = USE_CACHE and os.environ.get('DMS_MEMO', '1') != '0'
+MEMO_SIZE = int(os.environ.get('DMS_MEMO_SIZE') or 256) * 1024 * 1024
 
 BASE_PERIOD = 2010
 
@@ -20,6 +35,16 @@ SHEET_NAME_COUNTRYGROUPS = 'countrygroups'
 
 VARS_FILENAME = 'output/outputvars.txt'
 EXCEL_FILENAME = 'output/output.xlsx'
+# Results of the steps, see fdms.utils.output: DMS_DUMP_STEPS=0 to skip them, DMS_OUTPUT_FORMATS=xlsx,csv,npz and
+# DMS_OUTPUT_BACKGROUND=1 to write them in a thread while the next steps run
+OUTPUT_DIR = os.path.join(PROJECT_ROOT, 'output')
+DUMP_STEPS = os.environ.get('DMS_DUMP_STEPS', '1') != '0'
+OUTPUT_FORMATS = (os.environ.get('DMS_OUTPUT_FORMATS') or 'xlsx').split(',')
+OUTPUT_BACKGROUND = os.environ.get('DMS_OUTPUT_BACKGROUND', '0') != '0'
+# Timings and memory of the steps and of the primitives they use, see fdms.utils.profiler: DMS_PROFILE=1 to record
+# them in DMS_PROFILE_DIR
+PROFILE = os.environ.get('DMS_PROFILE', '0') != '0'
+PROFILE_DIR = os.environ.get('DMS_PROFILE_DIR') or os.path.join(OUTPUT_DIR, 'profile')
 COLUMN_ORDER = ['Country Ameco', 'Variable Code', 'Frequency', 'Scale', 1993, 1994, 1995, 1996, 1997, 1998, 1999, 2000,
                 2001, 2002, 2003, 2004, 2005, 2006, 2007, 2008, 2009, 2010, 2011, 2012, 2013, 2014, 2015, 2016, 2017,
                 2018, 2019]
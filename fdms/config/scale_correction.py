@@ -149,4 +149,6 @@ factors = {
 
 def fix_scales(df, country='BE'):
     for variable, factor in factors.items():
+        if (country, variable) not in df.index:
+            continue
         df.loc[(country, variable), YEARS] = df.loc[(country, variable), YEARS] * factor
@@ -0,0 +1,34 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from fdms.utils.addends import compile_addends
+
+
+class TestAddendTable(unittest.TestCase):
+    def test_evaluate(self):
+        table = compile_addends({'A': ['X', '-Y', 'Z'], 'B': ['Y']})
+        self.assertIs(table, compile_addends({'A': ['X', '-Y', 'Z'], 'B': ['Y']}))
+        self.assertEqual(table.sources, ['X', 'Y', 'Z'])
+        sources = {'X': pd.Series([1.5, np.nan, np.nan, 0.1]), 'Y': pd.Series([2.0, 3.0, np.nan, 0.2]),
+                   'Z': pd.Series([np.nan, 4.0, np.nan, 0.3])}
+        values = np.array([sources[source].values for source in table.sources])
+        factors = np.ones(table.positions.shape)
+        factors[0, 2] = 1000
+        result = table.evaluate(['A', 'B'], values, factors=factors)
+
+        # Same values as adding the series one after the other, ignoring missing values
+        expected = pd.Series().add(sources['X'], fill_value=0).add(-sources['Y'], fill_value=0).add(
+            1000 * sources['Z'], fill_value=0)
+        np.testing.assert_array_equal(result[0], expected.values)
+        np.testing.assert_array_equal(result[1], sources['Y'].values)
+
+    def test_batches(self):
+        table = compile_addends({'C': ['A', 'B'], 'A': ['X'], 'B': ['Y'], 'D': ['X']})
+        self.assertEqual(table.batches(), [['C', 'A', 'B', 'D']])
+        # A and B are only known once computed
+        self.assertEqual(table.batches(chained={'A', 'B'}), [['A', 'B'], ['C', 'D']])
+        self.assertEqual(table.batches(chained={'A', 'B'}, barriers=['D']), [['A', 'B'], ['C'], ['D']])
+        with self.assertRaises(ValueError):
+            compile_addends({'A': ['B'], 'B': ['A']}).batches(chained={'A', 'B'})
@@ -0,0 +1,76 @@
+import collections
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from fdms.computation.aggregates import compute_aggregates, membership
+
+
+class TestAggregates(unittest.TestCase):
+    def setUp(self):
+        years = [2010, 2011, 2012]
+        rows = [
+            ('BE', 'UVGD.1.0.0.0', 'Billions', [100.0, 110.0, 120.0]),
+            ('BE', 'XNE.1.0.99.0', 'Units', [1.0, 1.0, 1.0]),
+            ('BE', 'NUTN.1.0.0.0', 'Thousands', [10.0, 10.0, 10.0]),
+            ('BE', 'NLTN.1.0.0.0', 'Thousands', [100.0, 100.0, 100.0]),
+            ('EE', 'UVGD.1.0.0.0', 'Millions', [2000.0, 3000.0, 4000.0]),
+            ('EE', 'XNE.1.0.99.0', 'Units', [2.0, 1.0, 1.0]),
+            ('EE', 'NUTN.1.0.0.0', 'Thousands', [30.0, np.nan, 30.0]),
+            ('EE', 'NLTN.1.0.0.0', 'Thousands', [100.0, 100.0, 100.0]),
+        ]
+        self.result = pd.DataFrame([['Annual', scale] + values for _, _, scale, values in rows],
+                                   columns=['Frequency', 'Scale'] + years,
+                                   index=pd.MultiIndex.from_tuples([row[:2] for row in rows],
+                                                                   names=['Country Ameco', 'Variable Code']))
+        self.groups = collections.OrderedDict([('EA', ['BE', 'EE']), ('EU', ['BE', 'EE'])])
+
+    def test_membership(self):
+        mask = membership(self.groups, ['BE', 'EE', 'US'], [2010, 2011])
+        # EE is a member of the EA since 2011
+        self.assertEqual(mask[0].tolist(), [[True, True], [False, True], [False, False]])
+        self.assertEqual(mask[1].tolist(), [[True, True], [True, True], [False, False]])
+
+    def test_aggregates(self):
+        aggregates = compute_aggregates(self.result, groups=self.groups)
+        self.assertEqual(aggregates.loc[('EA', 'UVGD.1.0.99.0'), 'Scale'], 'Billions')
+        self.assertEqual(aggregates.loc[('EA', 'UVGD.1.0.99.0'), [2010, 2011, 2012]].tolist(), [100.0, 113.0, 124.0])
+        # Converted to euro
+        self.assertEqual(aggregates.loc[('EU', 'UVGD.1.0.99.0'), [2010, 2011, 2012]].tolist(), [101.0, 113.0, 124.0])
+        # A missing member value makes the group value missing
+        unemployment = aggregates.loc[('EU', 'ZUTN.1.0.0.0'), [2010, 2011, 2012]]
+        self.assertEqual(unemployment[[2010, 2012]].tolist(), [20.0, 20.0])
+        self.assertTrue(np.isnan(unemployment[2011]))
+        self.assertEqual(aggregates.loc[('EA', 'ZUTN.1.0.0.0'), [2010, 2012]].tolist(), [10.0, 20.0])
+        self.assertNotIn(('EA', 'XNE.1.0.99.0'), aggregates.index)
+
+    def test_absent_member(self):
+        groups = collections.OrderedDict([('EA', ['BE', 'EE', 'DE']), ('EU', ['BE', 'EE'])])
+        aggregates = compute_aggregates(self.result, groups=groups)
+        # DE has no results, the EA is missing in all the years
+        self.assertNotIn('EA', aggregates.index.get_level_values('Country Ameco'))
+        self.assertEqual(aggregates.loc[('EU', 'UVGD.1.0.99.0'), [2010, 2011, 2012]].tolist(), [101.0, 113.0, 124.0])
+        # Default groups, only BE computed
+        be = compute_aggregates(self.result.loc[['BE']])
+        self.assertEqual(len(be), 0)
+
+    def test_chain_link(self):
+        volumes = [
+            ('BE', 'OVGD.6.0.0.0', 'Units', [np.nan, 2.0, 4.0]),
+            ('BE', 'OVGD.1.0.0.0', 'Billions', [100.0, 102.0, 106.08]),
+            ('EE', 'OVGD.6.0.0.0', 'Units', [np.nan, 10.0, 1.0]),
+        ]
+        frame = pd.DataFrame([['Annual', scale] + values for _, _, scale, values in volumes],
+                             columns=self.result.columns, index=pd.MultiIndex.from_tuples(
+                                 [row[:2] for row in volumes], names=self.result.index.names))
+        aggregates = compute_aggregates(pd.concat([self.result, frame]), groups=self.groups, base_period=2011)
+        # Weights of the year before, in euro: 100 and 1 in 2010, 110 and 3 in 2011
+        growth = aggregates.loc[('EU', 'OVGD.6.0.0.0'), [2011, 2012]]
+        np.testing.assert_allclose(growth.tolist(), [(100 * 2.0 + 1 * 10.0) / 101, (110 * 4.0 + 3 * 1.0) / 113])
+        # The growth of a year is the one of the members of the year, EE is in the EA since 2011
+        self.assertEqual(aggregates.loc[('EA', 'OVGD.6.0.0.0'), 2011], growth[2011])
+        levels = aggregates.loc[('EU', 'OVGD.1.0.99.0'), [2010, 2011, 2012]]
+        np.testing.assert_allclose(levels.tolist(), [113 / (1 + growth[2011] / 100), 113,
+                                                     113 * (1 + growth[2012] / 100)])
+        self.assertEqual(aggregates.loc[('EU', 'OVGD.1.0.99.0'), 'Scale'], 'Billions')
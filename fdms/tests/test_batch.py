@@ -0,0 +1,28 @@
+import unittest
+
+import pandas as pd
+
+from fdms.computation.annual_series import Compute
+from fdms.computation.batch import SHARED_INPUTS, load_shared_inputs, run_batch
+
+
+class TestBatch(unittest.TestCase):
+    def test_shared_inputs(self):
+        inputs = load_shared_inputs()
+        self.assertEqual(sorted(inputs), sorted(SHARED_INPUTS))
+        self.assertIn(('BE', 'UVGD.1.0.0.0'), inputs['ameco_h'].index)
+
+    def test_failures(self):
+        # Countries without input files are reported, the batch is not interrupted
+        result, errors = run_batch(['XX', 'YY'], workers=2)
+        self.assertEqual(len(result), 0)
+        self.assertEqual(sorted(errors), ['XX', 'YY'])
+        self.assertIn('Error', errors['XX'])
+
+    def test_same_as_compute(self):
+        # Only BE has all the sample data, the other country fails on a worker of its own
+        result, errors = run_batch(['BE', 'DE'], workers=2)
+        self.assertEqual(sorted(errors), ['DE'])
+        self.assertEqual(result.index.get_level_values('Country Ameco').unique().tolist(), ['BE'])
+        expected = Compute(country='BE').perform_computation()
+        pd.testing.assert_frame_equal(result, expected)
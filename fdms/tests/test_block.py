@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from fdms.utils.block import SeriesBlock
+from fdms.utils.mixins import StepMixin
+from fdms.utils.series import remove_duplicates
+
+
+class TestSeriesBlock(unittest.TestCase):
+    def setUp(self):
+        self.frame = pd.DataFrame([['BE', 'UVGD.1.0.0.0', 'Annual', 'Billions', 1.0, '2.5'],
+                                   ['BE', 'OVGD.1.0.0.0', 'Annual', 'Billions', np.nan, 'n.a.'],
+                                   ['BE', 'UVGD.1.0.0.0', 'Annual', 'Millions', 3.0, 4.0]],
+                                  columns=['Country Ameco', 'Variable Code', 'Frequency', 'Scale', 2016, 2017])
+        self.frame.set_index(['Country Ameco', 'Variable Code'], inplace=True)
+
+    def test_from_frame(self):
+        block = SeriesBlock.from_frame(self.frame)
+        self.assertEqual(block.values.dtype, np.float64)
+        self.assertTrue(block.values.flags['C_CONTIGUOUS'])
+        self.assertEqual(block.years, [2016, 2017])
+        self.assertEqual(list(block.meta.columns), ['Frequency', 'Scale'])
+        self.assertEqual(block.index.levels[1].dtype, 'category')
+        self.assertEqual(block.values[0].tolist(), [1.0, 2.5])
+        self.assertTrue(np.isnan(block.values[1]).all())
+
+        # The last row of a series wins, like get_data
+        step = StepMixin(country='BE')
+        self.assertEqual(step.get_data(block, 'UVGD.1.0.0.0').tolist(), [3.0, 4.0])
+        self.assertEqual(step.get_index('UVGD.1.0.0.0', dataframe=block), ('BE', 'UVGD.1.0.0.0'))
+        with self.assertRaises(KeyError):
+            block.get('BE', 'UIGT.1.0.0.0')
+
+        frame = block.to_frame()
+        self.assertEqual(list(frame.columns), list(self.frame.columns))
+        self.assertEqual(frame.index.tolist(), self.frame.index.tolist())
+        self.assertEqual(frame[2017].dtype, np.float64)
+
+    def test_duplicates_and_compare(self):
+        block = remove_duplicates(SeriesBlock.from_frame(self.frame))
+        self.assertEqual(block.index.tolist(), [('BE', 'OVGD.1.0.0.0'), ('BE', 'UVGD.1.0.0.0')])
+        self.assertEqual(block.meta['Scale'].tolist(), ['Billions', 'Millions'])
+        frame = remove_duplicates(self.frame)
+        self.assertEqual(frame.index.tolist(), block.index.tolist())
+
+        other = block.take([0, 1])
+        other.values[1, 0] = 5.0
+        diff = block.compare(other)
+        self.assertEqual(diff[2016].tolist(), [True, False])
+        self.assertTrue(diff['Scale'].all())
+        with self.assertRaises(ValueError):
+            block.compare(block.take([1, 0]))
+
+        both = SeriesBlock.concat([block, SeriesBlock.from_frame(self.frame[[2017]])])
+        self.assertEqual(len(both), 5)
+        self.assertEqual(both.years, [2016, 2017])
+        self.assertTrue(np.isnan(both.values[2:, 0]).all())
@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+
+from fdms.utils.capital_stock import initial_positions, perpetual_inventory
+
+
+class TestPerpetualInventory(unittest.TestCase):
+    def setUp(self):
+        # Two countries, 6 years, the second one has no GDP in the first year
+        nan = np.nan
+        self.ameco_db = {
+            'OVGD.1.0.0.0': np.array([[10.0, 11.0, 12.0, 13.0, 14.0, 15.0], [nan, 20.0, 21.0, 22.0, 23.0, 24.0]]),
+            'OIGT.1.0.0.0': np.array([[2.0, 2.0, 2.0, 2.0, 2.0, 2.0], [nan, nan, nan, 4.0, 4.0, 4.0]]),
+            'OINT.1.0.0.0': np.array([[1.0, 1.0, 1.0, 1.0, 1.0, 1.0], [2.0, 2.0, 2.0, 2.0, 2.0, 2.0]]),
+        }
+        okct = np.array([[nan, nan, 1.0, 1.0, nan, nan], [nan, nan, 2.0, 2.0, nan, nan]])
+        self.series = {
+            'OKCT.1.0.0.0': okct, 'OINT.1.0.0.0': 2 - okct, 'UKCT.1.0.0.0': okct * 1.5,
+            'OIGT.1.0.0.0': np.full((2, 6), 2.0), 'UIGT.1.0.0.0': np.full((2, 6), 3.0),
+            'OVGD.1.0.0.0': np.full((2, 6), 100.0), 'NLHT9.1.0.0.0': np.full((2, 6), 5.0),
+        }
+
+    def test_initial_positions(self):
+        self.assertEqual(initial_positions(self.ameco_db['OVGD.1.0.0.0'], self.ameco_db['OIGT.1.0.0.0']).tolist(),
+                         [0, 2])
+
+    def test_countries(self):
+        blocks = perpetual_inventory(self.ameco_db, self.series, 3)
+        okn = blocks['OKND.1.0.0.0']
+        self.assertEqual(okn[0, :4].tolist(), [30.0, 31.0, 32.0, 33.0])
+        self.assertTrue(np.isnan(okn[1, :2]).all())
+        self.assertEqual(okn[1, 2:4].tolist(), [63.0, 65.0])
+        # After the first estimates, the consumption of fixed capital grows with the capital stock
+        self.assertEqual(blocks['OKCT.1.0.0.0'][0, 4], 33.0 * 1.0 / 32.0)
+        self.assertEqual(okn[0, 4], 33.0 + 2.0 - 33.0 / 32.0)
+        self.assertEqual(blocks['UKCT.1.0.0.0'][0, 4], 33.0 / 32.0 * 3.0 / 2.0)
+        self.assertEqual(blocks['OINT.1.0.0.0'][1, 3], 0.0)
+
+        # Same results country by country
+        for row in range(2):
+            single = perpetual_inventory({key: values[[row]] for key, values in self.ameco_db.items()},
+                                         {key: values[[row]] for key, values in self.series.items()}, 3)
+            for variable, values in blocks.items():
+                np.testing.assert_array_equal(single[variable][0], values[row])
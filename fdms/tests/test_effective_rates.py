@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from fdms.computation.country.annual.exchange_rates import ExchangeRates
+from fdms.utils.effective_rates import effective_rates
+from fdms.utils import interfaces
+from fdms.utils.interfaces import read_trade_weights_xls
+from fdms.utils.transforms import pch
+
+
+class TestEffectiveRates(unittest.TestCase):
+    def setUp(self):
+        self.years = [2009, 2010, 2011]
+        # BE, DE and US, BE trades with DE and US, DE with BE only
+        self.xne = np.array([[1.0, 1.0, 1.0], [1.0, 1.0, 1.0], [1.2, 1.25, 1.5]])
+        self.plcd = np.array([[98.0, 100.0, 103.0], [99.0, 100.0, 101.0], [100.0, 100.0, 100.0]])
+        self.weights = np.array([[[0.0, 0.75, 0.25], [1.0, 0.0, 0.0], [0.0, 0.0, 0.0]]])
+
+    def test_effective_rates(self):
+        rates = effective_rates(['437'], self.xne, self.plcd, self.weights, self.years, base_period=2010)
+        self.assertEqual(list(rates)[:4], ['XUNNQ.3.0.30', 'PLCDQ.3.0.0', 'XUNRQ.3.0.30', 'PLCDQ.3.0.30'])
+        nominal = rates['XUNNQ.3.0.30'][0, 0]
+        # Weighted geometric mean of the currencies of the partners, 100 in the base period
+        expected = (self.xne[2] / 1.25) ** 0.25 * 100
+        np.testing.assert_allclose(nominal, expected)
+        costs = rates['PLCDQ.3.0.0'][0, 0]
+        np.testing.assert_allclose(costs, self.plcd[0] / (self.plcd[1] ** 0.75 * self.plcd[2] ** 0.25) * 100)
+        np.testing.assert_allclose(rates['XUNRQ.3.0.30'][0, 0], nominal * costs / 100)
+        np.testing.assert_array_equal(rates['XUNNQ.6.0.30'][0], pch(rates['XUNNQ.3.0.30'][0]))
+        # No partners
+        self.assertTrue(np.isnan(rates['XUNNQ.3.0.30'][0, 2]).all())
+
+    def test_missing_partner(self):
+        self.xne[2, 0] = np.nan
+        rates = effective_rates(['437'], self.xne, self.plcd, self.weights, self.years, base_period=2010)
+        self.assertTrue(np.isnan(rates['XUNNQ.3.0.30'][0, 0, 0]))
+        # DE doesn't trade with the US
+        np.testing.assert_allclose(rates['XUNNQ.3.0.30'][0, 1], [100.0, 100.0, 100.0])
+
+    def test_missing_growth(self):
+        self.xne[2, 2] = np.nan
+        rates = effective_rates(['437'], self.xne, self.plcd, self.weights, self.years, base_period=2010)
+        # The growth of a missing index is missing, not 0
+        self.assertTrue(np.isnan(rates['XUNNQ.3.0.30'][0, 0, 2]))
+        self.assertTrue(np.isnan(rates['XUNNQ.6.0.30'][0, 0, 2]))
+        self.assertFalse(np.isnan(rates['XUNNQ.6.0.30'][0, 0, 1]))
+
+
+class TestExchangeRates(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        for name, value in [('CACHE_DIR', os.path.join(self.tmp_dir, 'cache')), ('USE_CACHE', True)]:
+            patcher = mock.patch.object(interfaces, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Group codes are numbers in the workbook, the partners are not in the order of the reporters
+        filename = os.path.join(self.tmp_dir, 'TRADE_WEIGHTS.xlsx')
+        weights = pd.DataFrame({'Group': [437, 437], 'Country': ['BE', 'DE'], 'US': [0.25, None],
+                                'DE': [0.75, None], 'BE': [None, 1.0]}, columns=['Group', 'Country', 'US', 'DE', 'BE'])
+        weights.to_excel(filename, sheet_name='trade_weights', index=False)
+        self.filename = filename
+        self.trade_weights = read_trade_weights_xls(filename)
+        index = pd.MultiIndex.from_tuples(
+            [('BE', 'XNE.1.0.99.0'), ('DE', 'XNE.1.0.99.0'), ('US', 'XNE.1.0.99.0'), ('BE', 'PLCD.3.1.0.0'),
+             ('DE', 'PLCD.3.1.0.0'), ('US', 'PLCD.3.1.0.0')], names=['Country Ameco', 'Variable Code'])
+        # The last year of the US dollar comes from XR_IR
+        self.ameco_h = pd.DataFrame([[1.0, 1.0, 1.0], [1.0, 1.0, 1.0], [1.2, 1.25, np.nan], [98.0, 100.0, 103.0],
+                                     [99.0, 100.0, 101.0], [100.0, 100.0, 100.0]], index=index,
+                                    columns=[2009, 2010, 2011])
+        self.xr = pd.DataFrame([[1.3, 1.5]], index=index[2:3], columns=[2010, 2011])
+
+    def test_effective_rates(self):
+        rates = ExchangeRates(country='BE')._effective_rates(self.ameco_h, self.xr, self.trade_weights)
+        self.assertEqual(len(rates), 8)
+        nominal = rates['XUNNQ.3.0.30.437']
+        self.assertEqual(nominal.index.tolist(), [2009, 2010, 2011])
+        # AMECO first, XR_IR where AMECO is missing
+        np.testing.assert_allclose(nominal.values, (np.array([1.2, 1.25, 1.5]) / 1.25) ** 0.25 * 100)
+        plcd = self.ameco_h.values[3:]
+        np.testing.assert_allclose(rates['PLCDQ.3.0.0.437'].values,
+                                   plcd[0] / (plcd[1] ** 0.75 * plcd[2] ** 0.25) * 100)
+        self.assertTrue(np.isnan(rates['XUNNQ.6.0.30.437'][2009]))
+
+    def test_not_a_reporter(self):
+        self.assertEqual(ExchangeRates(country='US')._effective_rates(self.ameco_h, self.xr, self.trade_weights), {})
+        self.assertEqual(ExchangeRates(country='BE')._effective_rates(self.ameco_h, self.xr, None), {})
+
+    def test_cached_weights(self):
+        # The second read comes from the cache of read_excel_cached
+        cached = read_trade_weights_xls(self.filename)
+        pd.testing.assert_frame_equal(cached, self.trade_weights)
+        self.assertEqual(cached.index.get_level_values('Group').tolist(), ['437', '437'])
+        self.assertTrue(os.listdir(os.path.join(self.tmp_dir, 'cache')))
@@ -0,0 +1,64 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from fdms.utils.formulas import Formulas, FormulaError, parse_formula, get_formulas
+
+
+class TestFormulas(unittest.TestCase):
+    def setUp(self):
+        years = [2015, 2016, 2017, 2018]
+        self.inputs = {
+            'A': pd.Series([1.0, 2.0, np.nan, 4.0], index=years),
+            'B': pd.Series([10.0, np.nan, np.nan, 40.0], index=years),
+        }
+
+    def resolve(self, database, code):
+        return self.inputs[code]
+
+    def test_parse(self):
+        target, expression = parse_formula(
+            '{Country}|C[t] = AMECO Historical!{Country}|A[t-1] + 2 * {Country}|B[t], 1')
+        self.assertEqual(target, 'C')
+        self.assertEqual(expression, ('+', ('shift', 1, ('ref', 'AMECO Historical', 'A')),
+                                      ('*', ('const', 2.0), ('ref', None, 'B'))))
+        with self.assertRaises(FormulaError):
+            parse_formula('{Country}|C[t] = level({Country}|A[t])')
+
+    def test_evaluate(self):
+        formulas = Formulas([('C', '{Country}|A[t] + {Country}|B[t]'),
+                             ('D', 'ignoremissingsum({Country}|A[t], {Country}|B[t])'),
+                             ('E', '({Country}|A[t] + {Country}|B[t]) / {Country}|C[t]'),
+                             ('A', '{Country}|A[t] * 2'),
+                             ('F', 'pch({Country}|A[t])')])
+        # A + B is computed once
+        self.assertEqual(formulas.roots['C'], formulas.graph.nodes[formulas.roots['E']][1])
+        series = formulas.evaluate(self.resolve)
+        self.assertEqual(list(series), ['C', 'D', 'E', 'A', 'F'])
+        self.assertEqual(series['C'].tolist()[::3], [11.0, 44.0])
+        self.assertTrue(series['C'][2016:2017].isnull().all())
+        self.assertEqual(series['D'].fillna(0).tolist(), [11.0, 2.0, 0.0, 44.0])
+        # A is the input series before its formula and the computed one after
+        self.assertEqual(series['A'].fillna(0).tolist(), [2.0, 4.0, 0.0, 8.0])
+        expected = (self.inputs['A'] * 2).pct_change() * 100
+        np.testing.assert_array_equal(series['F'].values, expected.values)
+
+    def test_country_calculation(self):
+        formulas = get_formulas(['National Accounts - Calculate additional GDP components'])
+        self.assertIs(formulas, get_formulas(['National Accounts - Calculate additional GDP components']))
+        self.assertIn('UBGS', formulas.targets)
+        # UXGS and UMGS are computed by the section too
+        self.assertEqual(sorted(formulas.inputs(['UBGS'])), [(None, 'UMGN'), (None, 'UMSN'), (None, 'UXGN'),
+                                                             (None, 'UXSN')])
+
+    def test_left_out(self):
+        # The formulas the steps can't be computed with yet, see the TODO of each step in fdms.computation.country
+        formulas = Formulas.from_file()
+        self.assertEqual(sorted(formulas.skipped), [
+            'EATSG.1.0.0.0', 'EATTG.1.0.0.0', 'EATYG.1.0.0.0', 'FTSG.1.0.0.0', 'FTTG.1.0.0.0', 'FTYG.1.0.0.0',
+            'NUTN.1.0.0.0', 'OBGN.1.0.0.0', 'OBGS.1.0.0.0', 'OBSN.1.0.0.0', 'OIGNR.1.0.0.0', 'OIGP.1.0.0.0',
+            'OITT.1.0.0.0', 'OKND.1.0.0.0', 'OMGS.1.0.0.0', 'OUNF.1.0.0.0', 'OUNT.1.0.0.0', 'OUTT.1.0.0.0',
+            'OXGS.1.0.0.0', 'UCRG.1.0.0.0', 'UOGC.1.0.0.0', 'USGC.1.0.0.0', 'USGH.1.0.0.0', 'UTAT.1.0.0.0',
+            'UTCGCP.1.0.319.0', 'UUCG.1.0.0.0', 'UUCGCP.1.0.319.0', 'UUCGI.1.0.0.0', 'UVGDH.1.0.0.0', 'UVGH.1.0.0.0',
+            'XNEF.1.0.99.0', 'ZCPIH.12.0.0.0', 'ZCPIH.6.0.0.0', 'ZVGDFA3.3.0.0.0'])
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from fdms.utils import interfaces
+from fdms.utils.interfaces import read_ameco_txt, read_excel_cached
+
+
+class TestExcelCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'BE.Forecast.xlsx')
+        self._write_workbook(2.5)
+        for name, value in [('CACHE_DIR', os.path.join(self.tmp_dir, 'cache')), ('USE_CACHE', True)]:
+            patcher = mock.patch.object(interfaces, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_workbook(self, value):
+        # A year header typed as text
+        columns = ['Country', 'Variable', 'Scale', 2017, 2018, '2019']
+        df = pd.DataFrame({'Country': ['BE', 'BE'], 'Variable': ['UVGD', 'OVGD'], 'Scale': ['billions', 'billions'],
+                           2017: [1.5, 'n.a.'], 2018: [value, 3.0], '2019': ['n.a.', 4]}, columns=columns)
+        df.to_excel(self.filename, sheet_name='Transfer FDMS+ A', index=False)
+
+    def test_cached_sheet_matches_workbook(self):
+        df = read_excel_cached(self.filename, 'Transfer FDMS+ A', index_col=[0, 1])
+        with mock.patch.object(interfaces.pd, 'read_excel') as read_excel:
+            cached = read_excel_cached(self.filename, 'Transfer FDMS+ A', index_col=[0, 1])
+            read_excel.assert_not_called()
+        pd.testing.assert_frame_equal(df, cached)
+        self.assertEqual(list(cached.index), [('BE', 'UVGD'), ('BE', 'OVGD')])
+        self.assertEqual(cached.loc[('BE', 'UVGD'), 'Scale'], 'billions')
+        self.assertTrue(pd.isna(cached.loc[('BE', 'OVGD'), 2017]))
+        self.assertEqual(cached[2018].dtype, 'float64')
+
+    def test_uncached_sheet_matches_cached(self):
+        with mock.patch.object(interfaces, 'USE_CACHE', False):
+            df = read_excel_cached(self.filename, 'Transfer FDMS+ A', index_col=[0, 1])
+        read_excel_cached(self.filename, 'Transfer FDMS+ A', index_col=[0, 1])
+        cached = read_excel_cached(self.filename, 'Transfer FDMS+ A', index_col=[0, 1])
+        pd.testing.assert_frame_equal(df, cached)
+        self.assertEqual(list(df.columns), ['Scale', 2017, 2018, 2019])
+        self.assertEqual(df[2019].dtype, 'float64')
+
+    def test_cache_is_refreshed_when_workbook_changes(self):
+        read_excel_cached(self.filename, 'Transfer FDMS+ A', index_col=[0, 1])
+        self._write_workbook(7.0)
+        os.utime(self.filename, (0, 0))
+        df = read_excel_cached(self.filename, 'Transfer FDMS+ A', index_col=[0, 1])
+        self.assertEqual(df.loc[('BE', 'UVGD'), 2018], 7.0)
+
+
+class TestReadAmecoTxt(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'AMECO_H.TXT')
+        with open(self.filename, 'w') as f:
+            f.write('CODE,Country/Aggregate,Unit of the series,Title,Unit indication,2016,2017\n')
+            f.write('BEL.1.0.0.0.UVGD,Belgium,Billions,Gross domestic product,Mrd EUR,422.9,NA\n')
+            f.write('BEL.1.1.0.0.OVGD,Belgium,Billions,Gross domestic product,Mrd EUR,395.1,402.0\n')
+            f.write('DEU.1.0.0.0.UVGD,Germany,Billions,Gross domestic product,Mrd EUR,3134.1,3263.4\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_codes_and_values(self):
+        df = read_ameco_txt(self.filename)
+        self.assertEqual(list(df.index), [('BE', 'UVGD.1.0.0.0'), ('BE', 'OVGD.1.1.0.0'), ('DE', 'UVGD.1.0.0.0')])
+        self.assertEqual(df.loc[('BE', 'UVGD.1.0.0.0'), 'CODE'], 'BEL.1.0.0.0.UVGD')
+        self.assertEqual(df[2016].dtype, 'float64')
+        self.assertEqual(df.loc[('DE', 'UVGD.1.0.0.0'), 2017], 3263.4)
+        self.assertTrue(pd.isna(df.loc[('BE', 'UVGD.1.0.0.0'), 2017]))
+
+    def test_filters(self):
+        df = read_ameco_txt(self.filename, countries=['BE'], variables=['UVGD.1.0.0.0'])
+        self.assertEqual(list(df.index), [('BE', 'UVGD.1.0.0.0')])
+        df = read_ameco_txt(self.filename, variables=['UVGD.1.0.0.0'])
+        self.assertEqual(list(df.index), [('BE', 'UVGD.1.0.0.0'), ('DE', 'UVGD.1.0.0.0')])
@@ -0,0 +1,80 @@
+import unittest
+
+import pandas as pd
+
+from fdms.config import COLUMN_ORDER
+from fdms.utils.availability import Availability
+from fdms.utils.lookup import get_series_index
+from fdms.utils.mixins import StepMixin
+
+
+class TestGetData(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame([['BE', 'UVGD.1.0.0.0', 'Units', 1.0, 'n.a.'],
+                                ['BE', 'OVGD.1.0.0.0', 'Units', 3.0, 4.0]],
+                               columns=['Country Ameco', 'Variable Code', 'Scale', 2016, 2017])
+        self.df.set_index(['Country Ameco', 'Variable Code'], inplace=True)
+        self.step = StepMixin(country='BE')
+
+    def append(self, variable, values):
+        series = pd.Series(self.step.get_meta(variable)).append(pd.Series(values))
+        self.step.result = self.step.result.append(series, ignore_index=True, sort=True)
+
+    def test_input(self):
+        series = self.step.get_data(self.df, 'UVGD.1.0.0.0')
+        self.assertEqual(series[2016], 1.0)
+        self.assertTrue(pd.isna(series[2017]))
+        self.assertEqual(self.df.index.get_level_values(1).tolist(), ['OVGD.1.0.0.0', 'UVGD.1.0.0.0'])
+        # Lookups return new series every time
+        series[2016] = 10
+        self.assertEqual(self.step.get_data(self.df, 'UVGD.1.0.0.0')[2016], 1.0)
+        with self.assertRaises(KeyError):
+            self.step.get_data(self.df, 'UIGT.1.0.0.0')
+
+    def test_in_place(self):
+        self.assertEqual(self.step.get_data(self.df, 'OVGD.1.0.0.0')[2017], 4.0)
+        # Changes made in place are seen by the next lookups
+        self.df.loc[('BE', 'OVGD.1.0.0.0'), 2017] = 99.0
+        self.assertEqual(self.step.get_data(self.df, 'OVGD.1.0.0.0')[2017], 99.0)
+        # Unless the dataframe was indexed as read only, its values are converted once
+        get_series_index(self.df, read_only=True)
+        self.assertEqual(self.step.get_data(self.df, 'OVGD.1.0.0.0')[2017], 99.0)
+        self.df.loc[('BE', 'OVGD.1.0.0.0'), 2017] = 4.0
+        self.assertEqual(self.step.get_data(self.df, 'OVGD.1.0.0.0')[2017], 99.0)
+
+    def test_result(self):
+        # Results kept as dataframes, appended to row by row
+        self.step.result = pd.DataFrame(columns=COLUMN_ORDER)
+        self.append('UIGT.1.0.0.0', {2016: 5.0, 2017: 6.0})
+        self.append('OVGD.1.0.0.0', {2016: 7.0, 2017: 8.0})
+        # The input is looked up first, then the result
+        self.assertEqual(self.step.get_data(self.df, 'OVGD.1.0.0.0')[2016], 3.0)
+        self.assertEqual(self.step.get_data(self.df, 'UIGT.1.0.0.0')[2017], 6.0)
+        self.append('UIGT.1.0.0.0', {2016: 9.0, 2017: 10.0})
+        self.assertEqual(self.step.get_data(self.step.result, 'UIGT.1.0.0.0')[2016], 9.0)
+        self.assertEqual(self.step.get_index('UIGT.1.0.0.0'), 2)
+        # In place changes of the result are seen by the next lookups
+        self.step.result.loc[self.step.result['Variable Code'] == 'OVGD.1.0.0.0', 2017] = 0.0
+        self.assertEqual(self.step.get_data(self.step.result, 'OVGD.1.0.0.0')[2017], 0.0)
+        with self.assertRaises(KeyError):
+            self.step.get_data(self.df, 'UKCT.1.0.0.0')
+
+    def test_availability(self):
+        self.step.result = pd.DataFrame(columns=COLUMN_ORDER)
+        self.append('UIGT.1.0.0.0', {2016: 5.0})
+        self.assertTrue(self.step.has_data(self.df, 'UIGT.1.0.0.0'))
+        self.assertFalse(self.step.has_data(self.df, 'UIGT.1.0.0.0', result=False))
+        self.assertEqual(self.step.first_available(['FETD.1.0.0.0', 'OVGD.1.0.0.0', 'UVGD.1.0.0.0'], self.df),
+                         'OVGD.1.0.0.0')
+        self.assertEqual(self.step.first_available(['OVGD.1.0.0.0', 'UIGT.1.0.0.0']), 'UIGT.1.0.0.0')
+        self.assertIsNone(self.step.first_available(['FETD.1.0.0.0', 'NETD.1.0.0.0'], self.df))
+
+        other = pd.DataFrame([['BE', 'UIGT.1.0.0.0', 1.0], ['DE', 'OVGD.1.0.0.0', 2.0]],
+                             columns=['Country Ameco', 'Variable Code', 2016])
+        availability = Availability([('ameco', self.df), ('forecast', other), ('scales', {})])
+        self.assertEqual(availability.bitmap.shape, (4, 3))
+        self.assertEqual(availability.sources_of('BE', 'UIGT.1.0.0.0'), ['forecast'])
+        self.assertFalse(availability.available('BE', 'UIGT.1.0.0.0', sources=['ameco']))
+        self.assertEqual(availability.first_available(['NETD.1.0.0.0', 'UIGT.1.0.0.0', 'OVGD.1.0.0.0'], 'BE'),
+                         'UIGT.1.0.0.0')
+        self.assertEqual(availability.missing('DE', ['UIGT.1.0.0.0', 'OVGD.1.0.0.0']), ['UIGT.1.0.0.0'])
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+import uuid
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from fdms.utils import memo
+from fdms.utils.memo import evict, get_key, load, memoize, store
+from fdms.utils.mixins import StepMixin, record_reads
+from fdms.utils.output import OutputWriter
+
+
+class DoubleStep(StepMixin):
+    calls = 0
+
+    @memoize(step=99)
+    def perform_computation(self, df):
+        DoubleStep.calls += 1
+        self.result.add(self.get_meta('DOUBLE'), self.get_data(df, 'UVGD.1.0.0.0') * 2)
+        self.result = self.result.to_frame()
+        self.export_result(step=99)
+        return self.result
+
+
+class TestMemo(unittest.TestCase):
+    def setUp(self):
+        # A series no other run has, so that the first computation is not memoized yet
+        self.df = pd.DataFrame([['BE', 'UVGD.1.0.0.0', uuid.uuid4().int % 1000, 2.0]],
+                               columns=['Country Ameco', 'Variable Code', 2016, 2017])
+        self.df.set_index(['Country Ameco', 'Variable Code'], inplace=True)
+
+    def test_key(self):
+        step = StepMixin(country='BE')
+        key = get_key(step, [self.df])
+        self.assertEqual(key, get_key(StepMixin(country='BE'), [self.df.copy()]))
+        self.assertNotEqual(key, get_key(StepMixin(country='DE'), [self.df]))
+        changed = self.df.copy()
+        changed.iloc[0, 1] = np.nan
+        self.assertNotEqual(key, get_key(step, [changed]))
+
+    def test_store(self):
+        with tempfile.TemporaryDirectory() as memo_dir:
+            for key in ['a', 'b', 'c']:
+                store(key, (key, np.zeros(1000)), memo_dir=memo_dir)
+                os.utime(os.path.join(memo_dir, key + '.pkl'), (0, {'a': 1, 'b': 3, 'c': 2}[key]))
+            self.assertEqual(load('a', memo_dir=memo_dir)[0], 'a')
+            self.assertIsNone(load('d', memo_dir=memo_dir))
+            # a was just used, c is the least recently used
+            evict(memo_dir, max_size=os.path.getsize(os.path.join(memo_dir, 'a.pkl')) * 2)
+            self.assertEqual(sorted(os.listdir(memo_dir)), ['a.pkl', 'b.pkl'])
+
+    def test_unreadable(self):
+        with tempfile.TemporaryDirectory() as memo_dir:
+            filename = os.path.join(memo_dir, 'a.pkl')
+            # A pickle of a class that doesn't exist (anymore), like the ones of other pandas versions
+            with open(filename, 'wb') as f:
+                f.write(b'\x80\x03cfdms.utils.memo\nFrozenNDArray\nq\x00.')
+            self.assertIsNone(load('a', memo_dir=memo_dir))
+            self.assertFalse(os.path.exists(filename))
+
+    def test_memoize(self):
+        output = OutputWriter(dump_steps=False)
+        calls = DoubleStep.calls
+        results = []
+        with tempfile.TemporaryDirectory() as memo_dir, mock.patch.object(memo, 'MEMO_DIR', memo_dir), \
+                mock.patch.object(memo, 'USE_MEMO', True):
+            for _ in range(2):
+                with record_reads() as reads:
+                    results.append(DoubleStep(country='BE', output=output).perform_computation(self.df))
+                # Also when memoized, the step looked up UVGD.1.0.0.0
+                self.assertIn('UVGD.1.0.0.0', reads)
+            self.assertEqual(len(os.listdir(memo_dir)), 1)
+        self.assertEqual(DoubleStep.calls, calls + 1)
+        self.assertTrue(results[0].equals(results[1]))
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from fdms.config import COLUMN_ORDER, YEARS
+from fdms.utils.output import OutputWriter, get_step_filename
+
+
+class TestOutputWriter(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.result = pd.DataFrame([['BE', 'UVGD.1.0.0.0', 'Annual', 'Billions'] + [1.5] * len(YEARS),
+                                    ['BE', 'OVGD.1.0.0.0', 'Annual', np.nan] + [np.nan] * len(YEARS)],
+                                   columns=COLUMN_ORDER).set_index(['Country Ameco', 'Variable Code'])
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_deferred(self):
+        writer = OutputWriter(output_dir=self.output_dir, formats=['xlsx', 'csv', 'npz'])
+        writer.add_step(self.result, step=1, country='BE')
+        self.result.iloc[0, 2] = 0.0
+        filename = get_step_filename(1, 'BE', 'xlsx', self.output_dir)
+        self.assertEqual(filename, os.path.join(self.output_dir, 'BE', 'output1.xlsx'))
+        self.assertFalse(os.path.exists(filename))
+        writer.flush()
+
+        # The result is written as it was when it was added
+        df = pd.read_excel(filename)
+        self.assertEqual(list(df.columns), COLUMN_ORDER)
+        self.assertEqual(df[1993].tolist()[0], 1.5)
+        self.assertTrue(df.loc[1, YEARS].isnull().all())
+        df = pd.read_csv(get_step_filename(1, 'BE', 'csv', self.output_dir))
+        self.assertEqual(df['Variable Code'].tolist(), ['UVGD.1.0.0.0', 'OVGD.1.0.0.0'])
+        with np.load(get_step_filename(1, 'BE', 'npz', self.output_dir)) as npz:
+            self.assertEqual(npz['values'].shape, (2, len(YEARS)))
+        with open(get_step_filename(1, 'BE', 'txt', self.output_dir)) as f:
+            self.assertEqual(f.read(), 'UVGD.1.0.0.0\nOVGD.1.0.0.0')
+
+    def test_background(self):
+        writer = OutputWriter(output_dir=self.output_dir, formats=['csv'], background=True)
+        writer.add_step(self.result, step=2, country='BE')
+        writer.flush()
+        self.assertTrue(os.path.exists(get_step_filename(2, 'BE', 'csv', self.output_dir)))
+
+        writer = OutputWriter(output_dir=self.output_dir, formats=['csv'], dump_steps=False)
+        writer.add_step(self.result, step=3, country='BE')
+        writer.flush()
+        self.assertFalse(os.path.exists(get_step_filename(3, 'BE', 'csv', self.output_dir)))
+        with self.assertRaises(ValueError):
+            OutputWriter(formats=['xls'])
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from fdms.computation.annual_series import Compute
+from fdms.computation.scheduler import Scheduler, Task
+from fdms.utils import profiler
+from fdms.utils.splicer import Splicer
+
+
+@profiler.profiled('square')
+def square(value):
+    return [value] * value
+
+
+def square_step(value):
+    with profiler.step('square_step'):
+        return len(square(value))
+
+
+class TestProfiler(unittest.TestCase):
+    def tearDown(self):
+        profiler.disable()
+
+    def test_disabled(self):
+        self.assertFalse(profiler.is_enabled())
+        with profiler.step('step_1'):
+            self.assertEqual(square(2), [2, 2])
+        self.assertIsNone(profiler.write('BE'))
+
+    def test_write(self):
+        profiler.enable()
+        with profiler.step('step_1'):
+            square(1000)
+            square(3)
+        Splicer().butt_splice(pd.Series([1.0, None]), pd.Series([1.0, 2.0]))
+        with tempfile.TemporaryDirectory() as profile_dir:
+            summary = profiler.write('BE', profile_dir=profile_dir)
+            with open(os.path.join(profile_dir, 'BE.json')) as f:
+                self.assertEqual(json.load(f), json.loads(json.dumps(summary)))
+            with open(os.path.join(profile_dir, 'BE.trace.json')) as f:
+                events = json.load(f)['traceEvents']
+            # Recorded since the last write
+            self.assertEqual(profiler.write('BE', profile_dir=profile_dir)['calls'], {})
+        self.assertEqual(summary['calls']['square']['count'], 2)
+        self.assertEqual(summary['calls']['Splicer.butt_splice']['count'], 1)
+        self.assertEqual(summary['steps']['step_1']['count'], 1)
+        self.assertGreater(summary['steps']['step_1']['peak_memory'], 1000 * 8)
+        self.assertEqual([event['name'] for event in events], ['square', 'square', 'step_1', 'Splicer.butt_splice'])
+        step = events[2]
+        self.assertTrue(all(step['ts'] <= event['ts'] and event['ts'] + event['dur'] <= step['ts'] + step['dur']
+                            for event in events[:2]))
+
+    def test_process_pool(self):
+        profiler.enable()
+        with profiler.step('main'):
+            pass
+        scheduler = Scheduler([Task('a', square_step, consumes=['value']), Task('b', square_step, consumes=['value'])])
+        values = scheduler.run({'value': 3}, executor='process', workers=2)
+        self.assertEqual((values['a'], values['b']), (3, 3))
+        with tempfile.TemporaryDirectory() as profile_dir:
+            summary = profiler.write('BE', profile_dir=profile_dir)
+        # What the process of the pool recorded, the events of the main process are not counted twice
+        self.assertEqual(summary['steps']['main']['count'], 1)
+        self.assertEqual(summary['steps']['square_step']['count'], 2)
+        self.assertEqual(summary['calls']['square']['count'], 2)
+
+    def test_sequential_steps(self):
+        self.assertEqual(Compute(executor='thread')._executor(), 'thread')
+        profiler.enable()
+        self.assertIsNone(Compute(executor='thread')._executor())
+        self.assertEqual(Compute(executor='process')._executor(), 'process')
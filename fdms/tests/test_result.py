@@ -0,0 +1,72 @@
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from fdms.computation.annual_series import get_country_tasks
+from fdms.computation.scheduler import Scheduler
+from fdms.config import AMECO, BASE_DIR, BASE_PERIOD, COLUMN_ORDER
+from fdms.utils import memo
+from fdms.utils.mixins import StepMixin
+
+
+class TestResultBuilder(unittest.TestCase):
+    def setUp(self):
+        self.step = StepMixin(country='BE')
+
+    def test_add(self):
+        result = self.step.result
+        result.add(self.step.get_meta('UVGD.1.0.0.0'), pd.Series({2016: 1.0, 2017: 2.0}))
+        result.add(self.step.get_meta('OVGD.1.0.0.0'), pd.Series({2016: 3.0, 1960: 4.0, 2020: 5.0}))
+        result.add(self.step.get_meta('UVGD.1.0.0.0'), pd.Series({2016: 6.0}))
+        self.assertEqual(self.step.get_data(result, 'UVGD.1.0.0.0')[2016], 6.0)
+        self.assertEqual(self.step.get_data(result, 'OVGD.1.0.0.0')[1960], 4.0)
+        with self.assertRaises(KeyError):
+            self.step.get_data(result, 'UIGT.1.0.0.0')
+
+        frame = result.to_frame()
+        self.assertEqual(list(frame.columns), COLUMN_ORDER[2:] + [1960, 2020])
+        self.assertEqual(frame.index.tolist(), [('BE', 'UVGD.1.0.0.0'), ('BE', 'OVGD.1.0.0.0'),
+                                                ('BE', 'UVGD.1.0.0.0')])
+        self.assertEqual(frame[2016].dtype, 'float64')
+        self.assertEqual(frame[2016].tolist(), [1.0, 3.0, 6.0])
+        self.assertTrue(pd.isna(frame.iloc[0][2020]))
+
+    def test_update(self):
+        result = self.step.result
+        result.add(self.step.get_meta('UVGD.1.0.0.0'), pd.Series({2016: 1.0, 2017: 2.0}))
+        result.add(self.step.get_meta('OVGD.1.0.0.0'), pd.Series({2016: 3.0}))
+        result.set_value('BE', 'UVGD.1.0.0.0', 2017, 7.0)
+        self.assertEqual(self.step.get_data(result, 'UVGD.1.0.0.0')[2017], 7.0)
+        # Replacing a row by position can change its variable code
+        result.replace(self.step.get_index('UVGD.1.0.0.0'), self.step.get_meta('UIGT.1.0.0.0'), pd.Series({2016: 8.0}))
+        self.assertNotIn(('BE', 'UVGD.1.0.0.0'), result)
+        series = self.step.get_data(result, 'UIGT.1.0.0.0')
+        self.assertEqual(series[2016], 8.0)
+        self.assertTrue(pd.isna(series[2017]))
+
+    def test_add_rows(self):
+        result = self.step.result
+        result.add(self.step.get_meta('UVGD.1.0.0.0'), pd.Series({2016: 1.0}))
+        result.add_rows([self.step.get_meta('OVGD.1.0.0.0'), self.step.get_meta('UVGD.1.0.0.0')],
+                        np.array([[2.0, 3.0], [4.0, np.nan]]), [2017, 2016])
+        self.assertEqual(self.step.get_data(result, 'OVGD.1.0.0.0')[[2016, 2017]].tolist(), [3.0, 2.0])
+        self.assertEqual(self.step.get_data(result, 'UVGD.1.0.0.0')[2017], 4.0)
+        self.assertTrue(pd.isna(self.step.get_data(result, 'UVGD.1.0.0.0')[2016]))
+        self.assertEqual(len(result), 3)
+
+
+class TestNationalAccountsVolume(unittest.TestCase):
+    def test_replace(self):
+        # Step 4 replaces the volumes in its result by position and reads them back, it used to stop on a KeyError
+        # (OVGD.1.0.0.0) with pandas >= 1.0
+        values = {'country': 'BE', 'forecast_filename': os.path.join(BASE_DIR, 'sample_data/BE.Forecast.SF2018.xlsm'),
+                  'ameco_filename': AMECO}
+        with mock.patch.object(memo, 'USE_MEMO', False):
+            values = Scheduler(get_country_tasks()).run(values, executor=None, targets=['result_4', 'ovgd1'])
+        self.assertIn(('BE', 'OVGD.6.0.0.0'), values['result_4'].index)
+        # Rebased to the value at current prices in the base period
+        uvgd = StepMixin(country='BE').get_data(values['result_1'], 'UVGD.1.0.0.0')
+        self.assertAlmostEqual(values['ovgd1'][BASE_PERIOD], uvgd[BASE_PERIOD])
@@ -0,0 +1,66 @@
+import threading
+import unittest
+
+from fdms.computation.scheduler import Scheduler, Task
+
+
+def _add(a, b):
+    return a + b
+
+
+def _total(b, c):
+    return b + c
+
+
+def _split(c):
+    return c - 1, c + 1
+
+
+def _fail(a):
+    raise ZeroDivisionError(a)
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = Scheduler([
+            Task('sum', _total, consumes=['b', 'c']),
+            Task('c', _add, consumes=['a', 'b']),
+            Task('split', _split, consumes=['c'], produces=['d', 'e']),
+        ])
+
+    def test_order(self):
+        self.assertEqual(self.scheduler.order(), ['c', 'sum', 'split'])
+        self.assertEqual(self.scheduler.dependencies(self.scheduler.tasks['sum']), ['c'])
+        self.scheduler.add(Task('a', _total, consumes=['b', 'c']))
+        with self.assertRaises(ValueError):
+            self.scheduler.order()
+        with self.assertRaises(ValueError):
+            self.scheduler.add(Task('other', _add, produces=['d']))
+
+    def test_run(self):
+        for executor in [None, 'thread']:
+            values = self.scheduler.run({'a': 1, 'b': 2}, executor=executor)
+            self.assertEqual([values[name] for name in ['c', 'sum', 'd', 'e']], [3, 5, 2, 4])
+        with self.assertRaises(KeyError):
+            self.scheduler.run({'a': 1})
+
+    def test_targets(self):
+        self.assertEqual(self.scheduler.required(['sum']), ['sum', 'c'])
+        self.assertEqual(self.scheduler.required(['sum'], values={'c': 3}), ['sum'])
+        values = self.scheduler.run({'a': 1, 'b': 2}, targets=['d'])
+        self.assertEqual(values['d'], 2)
+        self.assertNotIn('sum', values)
+        with self.assertRaises(KeyError):
+            self.scheduler.run({'a': 1, 'b': 2}, targets=['f'])
+
+    def test_concurrent(self):
+        # Both tasks only finish if they run at the same time
+        barrier = threading.Barrier(2, timeout=5)
+        scheduler = Scheduler([Task('x', barrier.wait), Task('y', barrier.wait)])
+        values = scheduler.run(workers=2)
+        self.assertEqual(sorted([values['x'], values['y']]), [0, 1])
+
+    def test_error(self):
+        self.scheduler.add(Task('fail', _fail, consumes=['a']))
+        with self.assertRaises(ZeroDivisionError):
+            self.scheduler.run({'a': 1, 'b': 2})
@@ -0,0 +1,163 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from fdms.utils.splicer import Splicer
+
+
+class LoopSplicer(Splicer):
+    '''The splices as they were computed before the accumulate kernels, one year after the other'''
+
+    def ratio_splice(self, base_series, splice_series, kind='forward', variable=None, period=None, bp=False):
+        result = None
+        if kind == 'forward' or kind == 'both':
+            stripped_base, stripped_splice, start_splice_loc = self._strip_and_get_forward_splice_boundaries(
+                base_series, splice_series)
+            if start_splice_loc is not None:
+                pct_change = stripped_splice.iloc[start_splice_loc - 1:].pct_change()[1:]
+                new_data = pct_change[1:].copy()
+                new_data.iloc[0] = float(stripped_base.iloc[-1]) * (new_data.iloc[0] + 1)
+                for index, item in list(pct_change.items())[2:]:
+                    new_data.loc[index] = new_data.loc[index - 1] * (item + 1)
+                result = pd.concat([stripped_base, new_data, splice_series.iloc[splice_series.index.get_loc(
+                    stripped_splice.index[-1]) + 1:]], sort=True)
+            elif kind == 'forward':
+                return base_series
+        if kind == 'backward' or kind == 'both':
+            stripped_base, stripped_splice, greater_splice_loc = self._strip_and_get_backward_splice_boundaries(
+                base_series, splice_series)
+            stripped_result = stripped_base
+            if result is not None:
+                stripped_result = result.iloc[result.index.get_loc(stripped_base.index[0]):]
+            if greater_splice_loc is not None:
+                pct_change = stripped_splice.iloc[:greater_splice_loc + 2].pct_change()[:-1]
+                new_data = pct_change[:-1].copy()
+                new_data.iloc[-1] = stripped_base.iloc[0] / (pct_change.iloc[-1] + 1)
+                for index, item in list(reversed(list(pct_change.items())))[1:-1]:
+                    new_data.loc[index - 1] = new_data.loc[index] / (item + 1)
+                result = pd.concat([splice_series.iloc[:splice_series.index.get_loc(
+                    stripped_splice.index[0])], new_data, stripped_result], sort=True)
+            elif kind == 'backward':
+                return base_series
+        return result
+
+    def level_splice(self, base_series, splice_series, kind='forward', period=None):
+        result = None
+        if kind == 'forward' or kind == 'both':
+            stripped_base, stripped_splice, start_splice_loc = self._strip_and_get_forward_splice_boundaries(
+                base_series, splice_series)
+            if start_splice_loc is not None:
+                diff = (stripped_splice.iloc[
+                        start_splice_loc - 1:] - stripped_splice.iloc[start_splice_loc - 1:].shift(1))[1:]
+                new_data = diff[1:].copy()
+                new_data.iloc[0] = stripped_base.iloc[-1] + new_data.iloc[0]
+                for index, item in list(diff.items())[2:]:
+                    new_data.loc[index] = new_data.loc[index - 1] + item
+                result = pd.concat([stripped_base, new_data, splice_series.iloc[splice_series.index.get_loc(
+                    stripped_splice.index[-1]) + 1:]], sort=True)
+        if kind == 'backward' or kind == 'both':
+            stripped_base, stripped_splice, greater_splice_loc = self._strip_and_get_backward_splice_boundaries(
+                base_series, splice_series)
+            stripped_result = stripped_base
+            if result is not None:
+                stripped_result = result.iloc[result.index.get_loc(stripped_base.index[0]):]
+            if greater_splice_loc is not None:
+                diff = (stripped_splice.iloc[
+                        :greater_splice_loc + 2] - stripped_splice.iloc[:greater_splice_loc + 2].shift(1))[:-1]
+                new_data = diff[:-1].copy()
+                new_data.iloc[-1] = stripped_base.iloc[0] - diff.iloc[-1]
+                for index, item in list(reversed(list(diff.items())))[1:-1]:
+                    new_data.loc[index - 1] = new_data.loc[index] - item
+                result = pd.concat([splice_series.iloc[:splice_series.index.get_loc(
+                    stripped_splice.index[0])], new_data, stripped_result], sort=True)
+        return result
+
+    def splice_and_level_forward(self, base_series, splice_series, kind='forward', variable=None, scales=None):
+        result = None
+        if kind == 'forward' or kind == 'both':
+            stripped_base, stripped_splice, start_splice_loc = self._strip_and_get_forward_splice_boundaries(
+                base_series, splice_series)
+            if start_splice_loc is not None:
+                new_data = stripped_splice.iloc[start_splice_loc - 1:][1:].copy()
+                new_data.iloc[0] = stripped_base.iloc[-1]
+                for index, item in list(new_data.items())[1:]:
+                    new_data.loc[index] = float(new_data.loc[index - 1]) * (1 + 0.01 * float(item))
+                result = pd.concat([stripped_base, new_data[1:]], sort=True)
+        return result
+
+
+class TestSpliceKernels(unittest.TestCase):
+    def test_same_as_loops(self):
+        years = list(range(2010, 2022))
+        nan = np.nan
+        # Missing values at the ends and inside the base and splice series
+        bases = [[nan, nan, 3.0, 4.0, 5.0, 6.0, 7.0, nan, nan, nan, nan, nan],
+                 [nan, nan, nan, 2.0, nan, 4.0, 5.0, 6.0, nan, nan, nan, nan],
+                 [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 11.0, 12.0]]
+        splices = [[1.0, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0, nan, 6.0, 6.5, 7.0],
+                   [nan, 1.5, 2.0, 2.5, nan, 3.0, 3.5, 4.0, 4.5, 5.0, 5.5, nan],
+                   [2.0, 2.0, 2.0, 2.0, 2.0, 2.0, 2.0, 2.0, 2.0, 2.0, nan, nan]]
+        splicer, loop_splicer = Splicer(), LoopSplicer()
+        for method in ['ratio_splice', 'level_splice', 'splice_and_level_forward']:
+            for kind in ['forward', 'backward', 'both']:
+                for base in bases:
+                    for splice in splices:
+                        base_series = pd.Series(base, index=years, name=('BE', 'A'))
+                        splice_series = pd.Series(splice, index=years, name=('BE', 'A'))
+                        with self.subTest(method=method, kind=kind, base=base, splice=splice):
+                            result = getattr(splicer, method)(base_series.copy(), splice_series.copy(), kind=kind)
+                            expected = getattr(loop_splicer, method)(base_series.copy(), splice_series.copy(),
+                                                                     kind=kind)
+                            if expected is None:
+                                self.assertIsNone(result)
+                            else:
+                                pd.testing.assert_series_equal(result.astype(float), expected.astype(float),
+                                                               check_names=False)
+
+
+class TestSpliceBlock(unittest.TestCase):
+    def setUp(self):
+        self.splicer = Splicer()
+        years = list(range(2010, 2020))
+        nan = np.nan
+        self.base_df = pd.DataFrame([[nan, nan, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, nan, nan],
+                                     [nan, nan, 1.0, 2.0, nan, 4.0, 5.0, nan, nan, nan],
+                                     [nan] * 10,
+                                     [2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 11.0],
+                                     [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, nan, nan, nan, nan]], columns=years,
+                                    index=[('BE', 'A'), ('BE', 'B'), ('BE', 'C'), ('BE', 'D'), ('BE', 'E')])
+        # E starts before its splice series, it can't be spliced backward and goes through the per-series method
+        self.splice_df = pd.DataFrame([[1.5, 2.0, 3.5, 4.0, 4.5, 5.0, 6.0, 7.0, 9.0, 8.0],
+                                       [nan, 3.0, 4.0, 6.0, 7.0, nan, 9.0, 12.0, 11.0, 13.0],
+                                       [1.0] * 10,
+                                       [1.0] * 10,
+                                       [nan, nan, 3.0, 4.0, 4.0, 5.0, 6.0, 6.5, 7.0, 8.0]], columns=years,
+                                      index=self.base_df.index)
+
+    def test_same_as_series(self):
+        functions = {'butt': self.splicer.butt_splice, 'ratio': self.splicer.ratio_splice,
+                     'level': self.splicer.level_splice}
+        for method in functions:
+            for kind in ['forward', 'backward', 'both']:
+                with mock.patch.object(self.splicer, method + '_splice', wraps=functions[method]) as per_series:
+                    result = self.splicer.splice_block(self.base_df, self.splice_df, method=method, kind=kind)
+                if kind != 'forward':
+                    self.assertIn(('BE', 'E'), [call[0][0].name for call in per_series.call_args_list])
+                self.assertEqual(result.index.tolist(), self.base_df.index.tolist())
+                for position in range(len(self.base_df)):
+                    expected = functions[method](self.base_df.iloc[position], self.splice_df.iloc[position],
+                                                 kind=kind)
+                    if expected is None:
+                        self.assertTrue(result.iloc[position].isnull().all())
+                    else:
+                        # butt_splice backward may repeat years, the last value is kept
+                        expected = expected[~expected.index.duplicated(keep='last')]
+                        expected = expected.reindex(self.base_df.columns).astype(float)
+                        pd.testing.assert_series_equal(result.iloc[position], expected, check_names=False,
+                                                       check_index_type=False)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            self.splicer.splice_block(self.base_df, self.splice_df, method='pch')
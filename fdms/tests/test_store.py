@@ -0,0 +1,82 @@
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from fdms.utils.block import years_frame
+from fdms.utils.mixins import StepMixin
+from fdms.utils.store import AmecoStore
+
+
+class TestAmecoStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'AMECO_H.TXT')
+        with open(self.filename, 'w') as f:
+            f.write('CODE,Country/Aggregate,Unit of the series,Title,Unit indication,2016,2017\n')
+            f.write('BEL.1.0.0.0.UVGD,Belgium,Billions,Gross domestic product,Mrd EUR,422.9,NA\n')
+            f.write('DEU.1.0.0.0.UVGD,Germany,Billions,Gross domestic product,Mrd EUR,3134.1,3263.4\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lookup(self):
+        store = AmecoStore.open('ameco_h', [self.filename], store_dir=self.tmp_dir)
+        self.assertIsInstance(store.values, np.memmap)
+        self.assertIn(('DE', 'UVGD.1.0.0.0'), store)
+        series = store.get('DE', 'UVGD.1.0.0.0')
+        self.assertEqual(series.tolist(), [3134.1, 3263.4])
+        self.assertEqual(series.index.tolist(), [2016, 2017])
+        self.assertEqual(store.get_metadata('BE', 'UVGD.1.0.0.0'),
+                         {'Unit': 'Mrd EUR', 'Scale': 'Billions', 'Title': 'Gross domestic product'})
+        with self.assertRaises(KeyError):
+            store.get('FR', 'UVGD.1.0.0.0')
+
+    def test_get_data(self):
+        store = AmecoStore.open('ameco_h', [self.filename], store_dir=self.tmp_dir)
+        step = StepMixin(country='BE')
+        series = step.get_data(store, 'UVGD.1.0.0.0')
+        self.assertEqual(series[2016], 422.9)
+        self.assertTrue(pd.isna(series[2017]))
+        # The returned series is a copy, the store is read only
+        series[2016] = 0
+        self.assertEqual(store.get('BE', 'UVGD.1.0.0.0')[2016], 422.9)
+
+    def test_pickle(self):
+        store = AmecoStore.open('ameco_h', [self.filename], store_dir=self.tmp_dir)
+        # Opened again from its files, the values are not copied
+        data = pickle.dumps(store)
+        self.assertLess(len(data), 1000)
+        copy = pickle.loads(data)
+        self.assertIsInstance(copy.values, np.memmap)
+        self.assertEqual(copy.keys, store.keys)
+
+    def test_years_frame(self):
+        store = AmecoStore.open('ameco_h', [self.filename], store_dir=self.tmp_dir)
+        frame = years_frame(store, [('DE', 'UVGD.1.0.0.0'), ('FR', 'UVGD.1.0.0.0')], [2015, 2016, 2017])
+        np.testing.assert_array_equal(frame.values, [[np.nan, 3134.1, 3263.4], [np.nan, np.nan, np.nan]])
+        self.assertEqual(list(frame.columns), [2015, 2016, 2017])
+
+    def test_rebuild(self):
+        store = AmecoStore.open('ameco_h', [self.filename], store_dir=self.tmp_dir)
+        meta_filename = os.path.join(self.tmp_dir, 'ameco_h.json')
+        with open(meta_filename) as f:
+            meta = json.load(f)
+        # The json names the values of its build, the ones of the previous build are removed
+        with open(self.filename, 'a') as f:
+            f.write('FRA.1.0.0.0.UVGD,France,Billions,Gross domestic product,Mrd EUR,2228.9,2291.7\n')
+        rebuilt = AmecoStore.open('ameco_h', [self.filename], store_dir=self.tmp_dir)
+        self.assertIn(('FR', 'UVGD.1.0.0.0'), rebuilt)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, store.values.filename)))
+        self.assertEqual(store.get('DE', 'UVGD.1.0.0.0').tolist(), [3134.1, 3263.4])
+        # Values that don't match the keys and years are rejected and the store is built again
+        with open(meta_filename) as f:
+            new_meta = json.load(f)
+        np.save(os.path.join(self.tmp_dir, new_meta['values']), np.zeros((len(meta['keys']), 2)))
+        reopened = AmecoStore.open('ameco_h', [self.filename], store_dir=self.tmp_dir)
+        self.assertEqual(reopened.get('FR', 'UVGD.1.0.0.0').tolist(), [2228.9, 2291.7])
@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from fdms.utils.operators import Operators
+from fdms.utils.transforms import Transforms
+
+
+class Step:
+    def __init__(self, series):
+        self.result = series
+
+    def get_data(self, dataframe, variable):
+        return dataframe[variable]
+
+
+class TestTransforms(unittest.TestCase):
+    def setUp(self):
+        years = list(range(2008, 2020))
+        self.series = {
+            'A': pd.Series([1.0, 2.0, np.nan, 4.0, 5.0, 5.5, 6.0, 6.5, 7.0, 7.5, 8.0, 8.5], index=years),
+            'B': pd.Series([np.nan, 10.0, 12.0, 11.0, 13.0, 14.0, 15.0, 16.0, 17.0, 18.0, 19.0, 20.0], index=years),
+        }
+
+    def test_evaluate(self):
+        transforms = Transforms([('A', 'pch', 'A6'), ('B', 'pch', 'B6'), ('A', 'rebase', 'A3'), ('B', 'rebase', 'B3'),
+                                 ('A', 'shift', 'A1'), ('B', 'neg', 'B')], base_period=2010)
+        series = transforms.evaluate(Step(self.series))
+        self.assertEqual(list(series), ['A6', 'B6', 'A3', 'B3', 'A1', 'B'])
+        for target, source in [('A6', 'A'), ('B6', 'B')]:
+            np.testing.assert_array_equal(series[target].values, (self.series[source].pct_change() * 100).values)
+        for target, source in [('A3', 'A'), ('B3', 'B')]:
+            expected = Operators().rebase(self.series[source], 2010)
+            # Divided by the base period value instead of chaining the ratios
+            np.testing.assert_allclose(series[target].values, expected.reindex(series[target].index).values,
+                                       rtol=1e-13)
+        np.testing.assert_array_equal(series['A1'].values, self.series['A'].shift(1).values)
+        np.testing.assert_array_equal(series['B'].values, (-self.series['B']).values)
+
+    def test_missing(self):
+        transforms = Transforms([('A', 'pch', 'A6'), ('C', 'pch', 'C6')])
+        with self.assertRaises(KeyError):
+            transforms.evaluate(Step(self.series))
+        missing = []
+        series = transforms.evaluate(Step({}), sources=self.series, missing=missing)
+        self.assertEqual(list(series), ['A6'])
+        self.assertEqual(missing, ['C6'])
+        with self.assertRaises(ValueError):
+            Transforms([('A', 'log', 'A1')])
+
+    def test_operators(self):
+        operators = Operators()
+        frame = pd.DataFrame(self.series).T
+        np.testing.assert_array_equal(operators.pch_block(frame).values,
+                                      np.array([operators.pch(self.series[code]).values for code in 'AB']))
+        # Missing values in the base period and after it, base period on the last value
+        years = [2008, 2009, 2010, 2011, 2012]
+        frame_c = pd.DataFrame([[np.nan, 1.0, np.nan, 4.0, 5.0], [np.nan, 1.0, 3.0, 4.0, np.nan]], columns=years)
+        for base_period in [2010, 2011]:
+            rebased = operators.rebase_block(frame_c, base_period)
+            for row in range(2):
+                expected = operators.rebase(frame_c.iloc[row], base_period).reindex(years)
+                np.testing.assert_allclose(rebased.iloc[row].values, expected.values, rtol=1e-13)
+        other = pd.DataFrame({'B': self.series['A'] * 10, 'A': self.series['B']}).T
+        merged = operators.merge_block([frame, other])
+        for code in 'AB':
+            expected = operators.merge(pd.DataFrame([self.series[code], other.loc[code]]))
+            np.testing.assert_array_equal(merged.loc[code].values, expected.values)
+        np.testing.assert_array_equal(operators.iin_block(frame, 0, 1).values,
+                                      np.array([operators.iin(self.series[code], 0, 1).values for code in 'AB']))
@@ -0,0 +1,36 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from fdms.computation.annual_series import VariableCatalog
+from fdms.utils.availability import Availability
+
+
+class TestVariableCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.seed_filename = os.path.join(self.tmp_dir, 'seed.json')
+        with open(self.seed_filename, 'w') as f:
+            json.dump({'result_2': ['NLTN.1.0.0.0'], 'reads_2': ['NETN', 'NLTN.1.0.0.0', 'NECN']}, f)
+        index = pd.MultiIndex.from_tuples([('BE', 'NETN')], names=['Country Ameco', 'Variable Code'])
+        self.availability = Availability([('ameco_h', pd.DataFrame({2016: [1.0]}, index=index))])
+
+    def test_first_run(self):
+        # No catalog of the country yet, the reads of the seed are checked
+        catalog = VariableCatalog('BE', catalog_dir=self.tmp_dir, seed_filename=self.seed_filename)
+        self.assertEqual(catalog.missing(self.availability, 'BE'), {'result_2': ['NECN']})
+        # The catalog of the country wins once it exists
+        catalog.update({'result_2': pd.DataFrame(index=pd.MultiIndex.from_tuples(
+            [('BE', 'NLTN.1.0.0.0')], names=['Country Ameco', 'Variable Code'])), 'reads_2': {'NETN'}})
+        catalog = VariableCatalog('BE', catalog_dir=self.tmp_dir, seed_filename=self.seed_filename)
+        self.assertEqual(catalog.missing(self.availability, 'BE'), {})
+
+    def test_no_catalog(self):
+        catalog = VariableCatalog('BE', catalog_dir=self.tmp_dir, seed_filename=os.path.join(self.tmp_dir, 'no.json'))
+        with self.assertLogs('fdms.computation.annual_series', level='WARNING'):
+            self.assertEqual(catalog.missing(self.availability, 'BE'), {})
@@ -0,0 +1,113 @@
+'''
+Addend tables of SumAndSpliceMixin, {target: [source, '-source', ...]}: every target is the sum of its sources, the
+ones starting with '-' are subtracted.
+
+compile_addends parses a table once into an AddendTable:
+
+    - `sources`: the distinct source codes, without their sign.
+    - `positions`: targets x terms matrix with the position in `sources` of every term of every target, -1 after the
+      last term of a target.
+    - `signs`: the sign of every term, 0 after the last one.
+
+The targets are summed all at once (AddendTable.evaluate) over a float64 matrix with one row per source, with the
+*ignoremissingsum* semantics of `Series.add(fill_value=0)`: missing values are ignored, a year with no values is NaN.
+The terms are added in the order they appear in the table so that the sums round exactly like the series additions
+they replace. Targets that are sources of other targets are summed first (AddendTable.batches).
+'''
+import collections
+
+import numpy as np
+
+
+class AddendTable:
+    def __init__(self, addends):
+        self.targets = list(addends)
+        self.sources = []
+        self.terms = collections.OrderedDict()
+        for target, sources in addends.items():
+            terms = []
+            for source in sources:
+                sign = 1
+                if source.startswith('-'):
+                    source = source[1:]
+                    sign = -1
+                if source not in self.sources:
+                    self.sources.append(source)
+                terms.append((source, sign))
+            self.terms[target] = terms
+        width = max([len(terms) for terms in self.terms.values()] + [0])
+        self.positions = np.full((len(self.targets), width), -1, dtype=np.intp)
+        self.signs = np.zeros((len(self.targets), width))
+        for row, terms in enumerate(self.terms.values()):
+            for column, (source, sign) in enumerate(terms):
+                self.positions[row, column] = self.sources.index(source)
+                self.signs[row, column] = sign
+
+    def dependencies(self, target, chained):
+        '''Targets that must be computed before target, chained are the targets read as sources once computed'''
+        return [source for source, _ in self.terms[target] if source in chained and source != target]
+
+    def batches(self, chained=(), barriers=()):
+        '''
+        Splits the targets in lists that can be summed at once, in a topological order that keeps the order of the
+        table when it already respects the dependencies.
+
+        chained  -- Targets that are sources of other targets and have to be computed before them.
+        barriers -- Targets that must be computed once all the targets before them in the order are done.
+        '''
+        waiting = collections.OrderedDict((target, set(self.dependencies(target, chained)))
+                                          for target in self.targets)
+        order = []
+        while waiting:
+            ready = [target for target, dependencies in waiting.items() if not dependencies]
+            if not ready:
+                raise ValueError('Circular addends {}'.format(', '.join(waiting)))
+            # One at a time, the first one in the table
+            target = ready[0]
+            del waiting[target]
+            order.append(target)
+            for dependencies in waiting.values():
+                dependencies.discard(target)
+
+        batches = []
+        for target in order:
+            depends = set(self.dependencies(target, chained))
+            if not batches or target in barriers or depends.intersection(batches[-1]):
+                batches.append([])
+            batches[-1].append(target)
+        return batches
+
+    def evaluate(self, targets, values, factors=None):
+        '''
+        Returns a len(targets) x years float64 matrix with the sums of the targets.
+
+        values  -- Sources x years matrix, in the order of self.sources (rows of sources not used can be anything).
+        factors -- Optional targets x terms matrix multiplying every term, the scale corrections (signs are applied
+                   anyway).
+        '''
+        rows = [self.targets.index(target) for target in targets]
+        positions, coefficients = self.positions[rows], self.signs[rows]
+        if factors is not None:
+            coefficients = coefficients * factors[rows]
+        result = np.full((len(rows), values.shape[1]), np.nan)
+        for column in range(positions.shape[1]):
+            used = positions[:, column] >= 0
+            term = coefficients[used, column][:, None] * values[positions[used, column]]
+            total = result[used]
+            missing = np.isnan(total)
+            total[missing] = term[missing]
+            present = ~missing & ~np.isnan(term)
+            total[present] = total[present] + term[present]
+            result[used] = total
+        return result
+
+
+_TABLES = {}
+
+
+def compile_addends(addends):
+    '''AddendTable of addends, built once per table'''
+    key = tuple((target, tuple(sources)) for target, sources in addends.items())
+    if key not in _TABLES:
+        _TABLES[key] = AddendTable(addends)
+    return _TABLES[key]
@@ -0,0 +1,78 @@
+'''
+Which series the inputs of a country have, to route the look ups without catching KeyError and to report the missing
+data before anything is computed (Compute.preflight).
+
+The (country, variable code) keys of all the sources are numbered once and an availability bitmap keys x sources
+tells in which sources every series is. Sources are the inputs as read: dataframes indexed by (Country Ameco, Variable
+Code) or with those columns, AmecoStore and SeriesBlock. Nothing is sorted or converted, the forecast is read in the
+order of its rows by the transfer matrix.
+'''
+import collections
+
+import numpy as np
+
+from fdms.utils.block import KEY_COLUMNS, SeriesBlock
+from fdms.utils.store import AmecoStore
+
+
+def source_keys(source):
+    '''(country, variable code) keys of the series of source, an empty list for anything else (None, dicts...)'''
+    if isinstance(source, AmecoStore):
+        return source.keys
+    if isinstance(source, SeriesBlock):
+        return list(zip(source.countries, source.variables))
+    index = getattr(source, 'index', None)
+    if getattr(index, 'nlevels', 1) == 2:
+        return list(index)
+    columns = getattr(source, 'columns', ())
+    if all(column in columns for column in KEY_COLUMNS):
+        return list(zip(source['Country Ameco'].values, source['Variable Code'].values))
+    return []
+
+
+class Availability:
+    '''
+    Availability bitmap of the series of sources, an OrderedDict (or list of pairs) name -> source. Lookups take the
+    names of the sources to look in, all of them by default, in their order.
+    '''
+    def __init__(self, sources):
+        sources = collections.OrderedDict(sources)
+        self.sources = list(sources)
+        self.index = {}
+        rows = []
+        for column, source in enumerate(sources.values()):
+            for key in source_keys(source):
+                row = self.index.setdefault(key, len(self.index))
+                rows.append((row, column))
+        self.bitmap = np.zeros((len(self.index), len(self.sources)), dtype=bool)
+        if rows:
+            rows = np.array(rows, dtype=np.intp)
+            self.bitmap[rows[:, 0], rows[:, 1]] = True
+
+    def _columns(self, sources):
+        if sources is None:
+            return slice(None)
+        return [self.sources.index(source) for source in sources if source in self.sources]
+
+    def available(self, country, variable, sources=None):
+        '''True if the series is in any of sources'''
+        row = self.index.get((country, variable))
+        return row is not None and bool(self.bitmap[row, self._columns(sources)].any())
+
+    def sources_of(self, country, variable):
+        '''Names of the sources with the series'''
+        row = self.index.get((country, variable))
+        if row is None:
+            return []
+        return [source for source, available in zip(self.sources, self.bitmap[row]) if available]
+
+    def first_available(self, variables, country, sources=None):
+        '''The first of variables in any of sources, None if none is'''
+        for variable in variables:
+            if self.available(country, variable, sources=sources):
+                return variable
+        return None
+
+    def missing(self, country, variables, sources=None):
+        '''variables that are in none of sources, in their order'''
+        return [variable for variable in variables if not self.available(country, variable, sources=sources)]
@@ -0,0 +1,203 @@
+'''
+Dual-block layout of a set of series, the year values apart from the metadata:
+
+    - `index`: (Country Ameco, Variable Code) MultiIndex with categorical levels, every country and variable code is
+      stored once.
+    - `values`: contiguous float64 matrix of series x years, NaN where a value is missing.
+    - `years`: the year labels of the columns of `values`.
+    - `meta`: dataframe with the other columns (Frequency, Scale...), one row per row of `values`.
+
+SeriesBlock.from_frame converts the year columns of a dataframe to float64 once, the lookups (SeriesBlock.get,
+StepMixin.get_data) return rows of the matrix without converting anything. Dataframes with the metadata and the years
+side by side are only built to be exported, with SeriesBlock.to_frame.
+'''
+import re
+
+import numpy as np
+import pandas as pd
+
+YEAR_REGEX = re.compile('[0-9]{4}')
+KEY_COLUMNS = ['Country Ameco', 'Variable Code']
+
+
+def _categorical_index(countries, variables):
+    return pd.MultiIndex.from_arrays([pd.Categorical(countries), pd.Categorical(variables)], names=KEY_COLUMNS)
+
+
+def year_values(frame, positions):
+    '''float64 matrix with the columns of frame at positions, converted with pd.to_numeric(errors='coerce')'''
+    values = np.empty((len(frame), len(positions)), dtype=np.float64)
+    for i, position in enumerate(positions):
+        column = frame.iloc[:, position]
+        values[:, i] = column.values if column.dtype == np.float64 else pd.to_numeric(column, errors='coerce')
+    return values
+
+
+def year_labels(dataframe):
+    '''Labels of the year columns of dataframe, the years of an AmecoStore'''
+    from fdms.utils.store import AmecoStore
+    if isinstance(dataframe, AmecoStore):
+        return list(dataframe.years)
+    return [column for column in dataframe.columns if YEAR_REGEX.search(str(column)) is not None]
+
+
+def years_frame(dataframe, keys, years):
+    '''
+    Year values of the rows of dataframe (indexed by (Country Ameco, Variable Code), or an AmecoStore) with the keys, as
+    a keys x years float64 dataframe, NaN rows for the keys dataframe doesn't have
+    '''
+    from fdms.utils.store import AmecoStore
+    if isinstance(dataframe, AmecoStore):
+        return dataframe.frame(keys, years)
+    rows = dataframe.reindex(pd.MultiIndex.from_tuples(keys, names=dataframe.index.names))
+    positions = [i for i, column in enumerate(rows.columns) if YEAR_REGEX.search(str(column)) is not None]
+    frame = pd.DataFrame(year_values(rows, positions), columns=rows.columns[positions])
+    return frame.reindex(columns=years)
+
+
+def as_block(result):
+    '''result as a SeriesBlock, dataframes are converted with SeriesBlock.from_frame'''
+    return result if isinstance(result, SeriesBlock) else SeriesBlock.from_frame(result)
+
+
+def _null_equal(a, b):
+    '''Element-wise a == b, with NaN equal to NaN'''
+    return (a == b) | (a != a) & (b != b)
+
+
+class SeriesBlock:
+    '''
+    countries, variables -- Keys of the rows.
+    values               -- float64 matrix of rows x years.
+    years                -- Labels of the columns of values.
+    meta                 -- Optional dataframe with the metadata columns, in the order of the rows.
+    columns              -- Order of the metadata and year columns in the dataframes built by to_frame, the metadata
+                            columns and then the years by default.
+    '''
+    def __init__(self, countries, variables, values, years, meta=None, columns=None):
+        self.index = _categorical_index(countries, variables)
+        self.values = np.ascontiguousarray(values, dtype=np.float64).reshape(len(self.index), len(years))
+        self.years = list(years)
+        meta = pd.DataFrame(index=range(len(self.index))) if meta is None else meta
+        self.meta = pd.DataFrame({column: meta[column].values.copy() for column in meta.columns}, columns=meta.columns,
+                                 index=self.index)
+        self.columns = list(self.meta.columns) + self.years if columns is None else list(columns)
+        self._positions = None
+
+    @classmethod
+    def from_frame(cls, frame):
+        '''frame -- Dataframe indexed by (Country Ameco, Variable Code) or with those columns'''
+        if frame.index.nlevels != 2:
+            frame = frame.set_index(KEY_COLUMNS)
+        year_positions = [i for i, column in enumerate(frame.columns) if YEAR_REGEX.search(str(column)) is not None]
+        meta_positions = [i for i in range(len(frame.columns)) if i not in set(year_positions)]
+        values = year_values(frame, year_positions)
+        return cls(frame.index.get_level_values(0), frame.index.get_level_values(1), values,
+                   [frame.columns[i] for i in year_positions], meta=frame.iloc[:, meta_positions],
+                   columns=list(frame.columns))
+
+    @classmethod
+    def concat(cls, blocks):
+        '''Rows of all the blocks, the years and metadata columns missing in a block are NaN'''
+        blocks = list(blocks)
+        years = []
+        for block in blocks:
+            years.extend(year for year in block.years if year not in years)
+        columns = []
+        for block in blocks:
+            columns.extend(column for column in block.columns if column not in columns)
+        values = np.full((sum(len(block) for block in blocks), len(years)), np.nan)
+        start = 0
+        for block in blocks:
+            positions = [years.index(year) for year in block.years]
+            values[start:start + len(block), positions] = block.values
+            start += len(block)
+        meta = pd.concat([block.meta.reset_index(drop=True) for block in blocks], ignore_index=True, sort=False)
+        countries = np.concatenate([block.countries for block in blocks]) if blocks else []
+        variables = np.concatenate([block.variables for block in blocks]) if blocks else []
+        return cls(countries, variables, values, years, meta=meta, columns=columns)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    @property
+    def countries(self):
+        return np.asarray(self.index.get_level_values(0), dtype=object)
+
+    @property
+    def variables(self):
+        return np.asarray(self.index.get_level_values(1), dtype=object)
+
+    @property
+    def positions(self):
+        '''(country, variable code) -> position of the last row of the series'''
+        if self._positions is None:
+            self._positions = {key: position for position, key in enumerate(zip(self.countries, self.variables))}
+        return self._positions
+
+    def find(self, country, variable):
+        '''Returns the row position of the series or None'''
+        return self.positions.get((country, variable))
+
+    def get(self, country, variable):
+        '''Returns the year values of the series as a new pd.Series, raises KeyError if it's missing'''
+        position = self.find(country, variable)
+        if position is None:
+            raise KeyError((country, variable))
+        return pd.Series(self.values[position].copy(), index=pd.Index(self.years, dtype=object),
+                         name=(country, variable))
+
+    def take(self, positions):
+        '''Block with the rows at positions'''
+        positions = np.asarray(positions, dtype=np.intp)
+        return SeriesBlock(self.countries[positions], self.variables[positions], self.values[positions], self.years,
+                           meta=self.meta.iloc[positions], columns=self.columns)
+
+    def drop_duplicates(self, keep='last'):
+        '''Block with one row per (Country Ameco, Variable Code), in the order of the rows kept'''
+        return self.take(np.flatnonzero(~self.index.duplicated(keep=keep)))
+
+    def column_values(self, column):
+        '''Values of a key, metadata or year column as a list'''
+        if column == KEY_COLUMNS[0]:
+            return self.countries.tolist()
+        if column == KEY_COLUMNS[1]:
+            return self.variables.tolist()
+        if column in self.meta.columns:
+            return self.meta[column].tolist()
+        try:
+            position = self.years.index(column)
+        except ValueError:
+            raise KeyError(column)
+        return self.values[:, position].tolist()
+
+    def compare(self, other):
+        '''
+        Dataframe of booleans with the columns of to_frame, True where both blocks have the same value (or both are
+        NaN). Both blocks must have the same rows, in the same order.
+        '''
+        if not (len(self) == len(other) and (self.countries == other.countries).all() and
+                (self.variables == other.variables).all()):
+            raise ValueError('Can only compare blocks with the same series')
+        data = {}
+        for column in self.columns:
+            if column in self.meta.columns:
+                a, b = self.meta[column].values, other.meta[column].values
+            else:
+                a, b = self.values[:, self.years.index(column)], other.values[:, other.years.index(column)]
+            data[column] = _null_equal(a, b)
+        return pd.DataFrame(data, columns=self.columns, index=self.frame_index())
+
+    def frame_index(self):
+        '''(Country Ameco, Variable Code) MultiIndex of the rows, with the plain object levels of the input frames'''
+        return pd.MultiIndex.from_arrays([self.countries, self.variables], names=KEY_COLUMNS)
+
+    def to_frame(self):
+        '''Returns the metadata and the years in a dataframe indexed by (Country Ameco, Variable Code)'''
+        data = {column: self.meta[column].values for column in self.meta.columns}
+        for position, year in enumerate(self.years):
+            data[year] = self.values[:, position]
+        return pd.DataFrame(data, columns=self.columns, index=self.frame_index())
@@ -0,0 +1,75 @@
+'''
+Perpetual inventory of the net capital stock (OKND), the kernel of the capital stock step (CapitalStock).
+
+Every input is a countries x years float64 matrix over the same consecutive years, going back to the first year of
+AMECO DB (1960, see read_ameco_db_xls(all_data=True)). The recursion runs year by year, each year computed for all
+the countries at once:
+
+    - the capital stock starts at 3 times the GDP (OVGD) of the first year with data, and grows with the net
+      investment (OINT) of AMECO DB;
+    - after the last year of the first estimates of the consumption of fixed capital (OKCT), the consumption of fixed
+      capital grows with the capital stock and the net investment is the investment (OIGT) minus it.
+
+The operations are the ones the step did on single series, in the same order, so the results are the same.
+'''
+import collections
+
+import numpy as np
+
+VARIABLES = ['OKND.1.0.0.0', 'OKCT.1.0.0.0', 'OINT.1.0.0.0', 'UKCT.1.0.0.0', 'ZVGDFA3.3.0.0.0']
+
+
+def _first_valid(values):
+    '''Column of the first value of every row that is not NaN, -1 for the rows without values'''
+    valid = ~np.isnan(values)
+    return np.where(valid.any(axis=1), valid.argmax(axis=1), -1)
+
+
+def initial_positions(ovgd, oigt):
+    '''
+    Column the capital stock starts at for every country: the first year with GDP (AMECO DB OVGD), or the year
+    before the first investment (AMECO DB OIGT) if it starts more than one year later. -1 for the countries without
+    GDP.
+    '''
+    first_ovgd, first_oigt = _first_valid(ovgd), _first_valid(oigt)
+    positions = np.where(first_ovgd + 1 < first_oigt, first_oigt - 1, first_ovgd)
+    return np.where(first_ovgd < 0, -1, positions)
+
+
+def perpetual_inventory(ameco_db, series, recursion_start):
+    '''
+    Returns an OrderedDict with the countries x years matrices of VARIABLES.
+
+    ameco_db        -- {'OVGD.1.0.0.0': ..., 'OIGT.1.0.0.0': ..., 'OINT.1.0.0.0': ...} from AMECO DB.
+    series          -- First estimates of 'OKCT.1.0.0.0', 'OINT.1.0.0.0' and 'UKCT.1.0.0.0' (used up to
+                       recursion_start), and the 'OIGT.1.0.0.0', 'UIGT.1.0.0.0', 'OVGD.1.0.0.0' and 'NLHT9.1.0.0.0' of
+                       the country.
+    recursion_start -- Column of the last first estimate of OKCT of every country.
+    '''
+    oint_db = ameco_db['OINT.1.0.0.0']
+    columns = oint_db.shape[1]
+    countries = np.arange(oint_db.shape[0])
+    start = initial_positions(ameco_db['OVGD.1.0.0.0'], ameco_db['OIGT.1.0.0.0'])
+    recursion_start = np.broadcast_to(np.asarray(recursion_start), start.shape)
+
+    okn = np.full(oint_db.shape, np.nan)
+    started = start >= 0
+    okn[countries[started], start[started]] = 3 * ameco_db['OVGD.1.0.0.0'][countries[started], start[started]]
+    # The last year is left to the recursion
+    for column in range(start[started].min() + 1 if started.any() else columns, columns - 1):
+        rows = started & (start < column)
+        okn[rows, column] = okn[rows, column - 1] + oint_db[rows, column]
+
+    okct, oint, ukct = [series[variable].copy() for variable in ['OKCT.1.0.0.0', 'OINT.1.0.0.0', 'UKCT.1.0.0.0']]
+    oigt, uigt = series['OIGT.1.0.0.0'], series['UIGT.1.0.0.0']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for column in range(recursion_start.min() + 1, columns):
+            rows = recursion_start < column
+            okct[rows, column] = okn[rows, column - 1] * okct[rows, column - 1] / okn[rows, column - 2]
+            okn[rows, column] = okn[rows, column - 1] + oigt[rows, column] - okct[rows, column]
+            oint[rows, column] = oigt[rows, column] - okct[rows, column]
+            ukct[rows, column] = okct[rows, column] * uigt[rows, column] / oigt[rows, column]
+
+        # Total factor productivity
+        zvgdfa3 = np.log(series['OVGD.1.0.0.0'] / (pow(series['NLHT9.1.0.0.0'] * 1000, 0.65) * pow(okn, 0.35)))
+    return collections.OrderedDict(zip(VARIABLES, [okn, okct, oint, ukct, zvgdfa3]))
@@ -0,0 +1,69 @@
+'''
+Effective exchange rates and relative unit labour costs against the partner groups (.414, .435, .437...), the kernel
+of the exchange rates step (ExchangeRates).
+
+Every country is compared with its partners of the group with double export weights (read_trade_weights_xls, the rows
+of a group sum to 1), as weighted geometric means computed with one matrix product per series for all the countries
+and all the groups at once:
+
+    - XUNNQ.3.0.30.g: nominal effective exchange rate, the value of the currency (1 / XNE.1.0.99.0) against the ones
+      of the partners;
+    - PLCDQ.3.0.0.g: nominal unit labour costs (PLCD.3.1.0.0) against the ones of the partners, in national currency;
+    - XUNRQ.3.0.30.g and PLCDQ.3.0.30.g: real effective exchange rate, the relative unit labour costs in a common
+      currency.
+
+The series are indexes, 100 in the base period (missing if the base period is), and come with their percent changes
+(the .6 variants, missing where the index is). A value is missing when the one of the country or of one of its partners
+is.
+'''
+import collections
+
+import numpy as np
+
+from fdms.config import BASE_PERIOD
+from fdms.utils.transforms import pch
+
+# Code of the index -> code of its percent change, the group is appended to both
+SERIES = collections.OrderedDict([('XUNNQ.3.0.30', 'XUNNQ.6.0.30'), ('PLCDQ.3.0.0', 'PLCDQ.6.0.0'),
+                                  ('XUNRQ.3.0.30', 'XUNRQ.6.0.30'), ('PLCDQ.3.0.30', 'PLCDQ.6.0.30')])
+
+
+def relative(values, weights):
+    '''
+    groups x countries x years logarithm of values (countries x years) minus its weighted mean over the partners of
+    every country (weights, groups x countries x partners on the same countries)
+    '''
+    with np.errstate(invalid='ignore', divide='ignore'):
+        logs = np.log(values)
+    means = np.einsum('gcp,py->gcy', weights, np.nan_to_num(logs))
+    missing = np.einsum('gcp,py->gcy', (weights != 0).astype(int), np.isnan(logs).astype(int)) > 0
+    means[missing] = np.nan
+    # Countries without partners in the group
+    means[~(weights != 0).any(axis=2)] = np.nan
+    return logs[None] - means
+
+
+def effective_rates(groups, xne, plcd, weights, years, base_period=BASE_PERIOD):
+    '''
+    Returns an OrderedDict code -> groups x countries x years, for the codes of SERIES and their percent changes
+    (without the group).
+
+    groups  -- Partner group codes, i.e. ['414', '437'].
+    xne     -- countries x years national currency per euro.
+    plcd    -- countries x years nominal unit labour costs.
+    weights -- groups x countries x partners double export weights, on the same countries.
+    '''
+    nominal = -relative(xne, weights)
+    costs = relative(plcd, weights)
+    logs = collections.OrderedDict(zip(SERIES, [nominal, costs, nominal + costs, nominal + costs]))
+    column = list(years).index(base_period)
+    result = collections.OrderedDict()
+    for code, values in logs.items():
+        result[code] = np.exp(values - values[:, :, [column]]) * 100
+    shape = (len(groups) * xne.shape[0], len(years))
+    for code, growth_code in SERIES.items():
+        growth = pch(result[code].reshape(shape)).reshape(result[code].shape)
+        # pch pads the missing values, the growth of a missing index is missing, not 0
+        growth[np.isnan(result[code])] = np.nan
+        result[growth_code] = growth
+    return result
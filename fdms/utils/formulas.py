@@ -0,0 +1,427 @@
+'''
+Formulas of the FDMS+ country calculation (fdms/utils/country_calculation.txt), compiled to a graph of vectorized
+operations.
+
+    {Country}|UBGN[t] = {Country}|UXGN[t] - {Country}|UMGN[t]
+    {Country}|NLTN.1.0.0.0[t] = ratiosplice(AMECO Historical!{Country}|NLTN.1.0.0.0[t], {Country}|NUTN.1.0.0.0[t] +
+                                            {Country}|NETN.1.0.0.0[t], MsSpliceDirection.Forward)
+
+The expressions can use + - * / and parentheses, numbers, series of the country ({Country}|CODE[t], or
+DATABASE!{Country}|CODE[t] for the series of another database, [t-1] for the value of the year before) and the
+functions in FUNCTIONS. The formulas that use anything else (text values, dates, other functions...) are left out.
+
+Formulas compiles a set of formulas into one graph: identical subexpressions are a single node (so they are computed
+once), and a series that is the target of a formula is replaced by the expression of that formula. Formulas.evaluate
+computes the graph level by level over a nodes x years float64 matrix, every level with one array operation per kind
+of node (all the additions of the level at once, all the ratio splices with Splicer.splice_block...).
+'''
+import collections
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(filename='error.log',
+                    format='{%(pathname)s:%(lineno)d} - %(asctime)s %(module)s %(levelname)s: %(message)s',
+                    level=logging.INFO)
+
+import numpy as np
+import pandas as pd
+
+from fdms.config import COUNTRY_CALCULATION_TXT
+from fdms.utils.splicer import Splicer
+from fdms.utils.transforms import pch, shift
+
+# Functions and their number of arguments (None for any), the splices take an optional direction too
+FUNCTIONS = {
+    'sum': None, 'ignoremissingsum': None, 'ignoremissingsubtract': None, 'merge': None, 'iin': (2, 3), 'pch': (1, 1),
+    'rebase': (2, 2), 'ratiosplice': (2, 2), 'buttsplice': (2, 2), 'levelsplice': (2, 2),
+}
+SPLICES = {'ratiosplice': 'ratio', 'buttsplice': 'butt', 'levelsplice': 'level'}
+DIRECTIONS = {'forward': 'forward', 'backward': 'backward', 'both': 'both'}
+
+FORMULA_REGEX = re.compile(r'^\{Country\}\|(?P<target>[A-Za-z0-9_.]+)\[t\]\s*=\s*(?P<expression>.+)$')
+TOKEN_REGEX = re.compile(r'''
+    \s*(?:
+        (?P<reference>(?:(?P<database>[A-Za-z][A-Za-z ]*)!)?(?:\{Country\}\|)?(?P<code>[A-Za-z0-9_.]+)
+                      \[t(?P<lag>[+-]\d+)?\])|
+        (?P<direction>MsSpliceDirection\.(?:Forward|Backward|Both))|
+        (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)|
+        (?P<string>"[^"]*")|
+        (?P<name>[A-Za-z_][A-Za-z0-9_]*)|
+        (?P<symbol>[-+*/(),])
+    )''', re.VERBOSE)
+
+
+class FormulaError(ValueError):
+    pass
+
+
+def tokenize(expression):
+    tokens, position = [], 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_REGEX.match(expression, position)
+        if match is None or match.end() == position:
+            raise FormulaError('Unexpected {!r} in {}'.format(expression[position:position + 20], expression))
+        position = match.end()
+        kind = match.lastgroup
+        if match.group('reference'):
+            tokens.append(('reference', (match.group('database'), match.group('code'), int(match.group('lag') or 0))))
+        elif kind == 'direction':
+            tokens.append(('direction', match.group('direction').split('.')[1].lower()))
+        elif kind == 'number':
+            tokens.append(('number', float(match.group('number'))))
+        else:
+            tokens.append((kind, match.group(kind)))
+    return tokens
+
+
+class Parser:
+    '''Recursive descent parser of an expression, returns nested tuples (see FormulaGraph.add)'''
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind is not None and token[0] != kind) or (value is not None and token[1] != value):
+            raise FormulaError('Expected {} in {}'.format(value or kind, self.expression))
+        self.position += 1
+        return token
+
+    def parse(self):
+        expression = self.sum()
+        # The calculation period that follows some formulas, i.e. ', (Now-5)-(Now+5)', is ignored
+        if self.peek() != (None, None) and self.peek() != ('symbol', ','):
+            raise FormulaError('Unexpected {} in {}'.format(self.peek()[1], self.expression))
+        return expression
+
+    def sum(self):
+        node = self.product()
+        while self.peek() in [('symbol', '+'), ('symbol', '-')]:
+            operator = self.take()[1]
+            node = (operator, node, self.product())
+        return node
+
+    def product(self):
+        node = self.unary()
+        while self.peek() in [('symbol', '*'), ('symbol', '/')]:
+            operator = self.take()[1]
+            node = (operator, node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek() == ('symbol', '-'):
+            self.take()
+            return ('neg', self.unary())
+        return self.primary()
+
+    def primary(self):
+        kind, value = self.peek()
+        if kind == 'number':
+            self.take()
+            return ('const', value)
+        if kind == 'reference':
+            self.take()
+            database, code, lag = value
+            node = ('ref', database, code)
+            return ('shift', -lag, node) if lag else node
+        if kind == 'symbol' and value == '(':
+            self.take()
+            node = self.sum()
+            self.take('symbol', ')')
+            return node
+        if kind == 'name':
+            return self.call()
+        if kind == 'string':
+            raise FormulaError('Text values are not supported: {}'.format(self.expression))
+        raise FormulaError('Unexpected {} in {}'.format(value, self.expression))
+
+    def call(self):
+        name = self.take('name')[1].lower()
+        if name not in FUNCTIONS:
+            raise FormulaError('Unknown function {} in {}'.format(name, self.expression))
+        self.take('symbol', '(')
+        arguments, direction, first = [], 'forward', True
+        while self.peek() != ('symbol', ')'):
+            if not first:
+                self.take('symbol', ',')
+            first = False
+            if self.peek()[0] == 'direction':
+                direction = DIRECTIONS[self.take()[1]]
+            else:
+                arguments.append(self.sum())
+        self.take('symbol', ')')
+        count = FUNCTIONS[name]
+        if count is not None and not count[0] <= len(arguments) <= count[1]:
+            raise FormulaError('Wrong number of arguments for {} in {}'.format(name, self.expression))
+        if name in SPLICES:
+            return ('splice', SPLICES[name], direction) + tuple(arguments)
+        if name == 'rebase':
+            if arguments[1][0] != 'const':
+                raise FormulaError('rebase needs a year in {}'.format(self.expression))
+            return ('rebase', int(arguments[1][1]), arguments[0])
+        return (name,) + tuple(arguments)
+
+
+def parse_formula(line):
+    '''Returns tuple(target, expression) of a formula line, raises FormulaError if the line is not supported'''
+    match = FORMULA_REGEX.match(line.strip())
+    if match is None:
+        raise FormulaError('Not a formula: {}'.format(line))
+    return match.group('target'), Parser(match.group('expression')).parse()
+
+
+def read_formulas(filename=COUNTRY_CALCULATION_TXT, sections=None):
+    '''
+    Returns a list of (section, target, expression text) with the formulas of the country calculation for a single
+    series of the country, the ones of the variable groups ({Variable}...) and the metadata ones (.Source, .Scale)
+    are left out.
+
+    sections -- Optional list of section titles (i.e. 'Labour Market') to read the formulas of.
+    '''
+    formulas, section = [], None
+    with open(filename) as f:
+        for line in f:
+            line = line.strip()
+            match = FORMULA_REGEX.match(line)
+            if match is None:
+                if line and '=' not in line and not re.match(r'^(If|Then|Else|Group|//)', line, re.IGNORECASE):
+                    section = line
+                continue
+            target = match.group('target')
+            if re.search(r'\.(Source|Scale)$', target) or '{' in match.group('expression').replace('{Country}', ''):
+                continue
+            if sections is None or section in sections:
+                formulas.append((section, target, match.group('expression')))
+    return formulas
+
+
+class FormulaGraph:
+    '''Nodes of a set of expressions, identical subexpressions are stored once'''
+    def __init__(self):
+        self.nodes = []
+        self.ids = {}
+
+    def add(self, expression, targets=None):
+        '''
+        Adds an expression (as returned by Parser.parse), returns the id of its node.
+        targets -- dict code -> node id, references to these series of the country are replaced by their node
+        '''
+        kind = expression[0]
+        if kind == 'ref':
+            _, database, code = expression
+            if database is None and targets is not None and code in targets:
+                return targets[code]
+            key = expression
+        elif kind == 'const':
+            key = expression
+        elif kind in ('shift', 'rebase'):
+            key = (kind, expression[1], self.add(expression[2], targets))
+        elif kind == 'splice':
+            key = expression[:3] + tuple(self.add(argument, targets) for argument in expression[3:])
+        else:
+            key = (kind,) + tuple(self.add(argument, targets) for argument in expression[1:])
+        if key not in self.ids:
+            self.ids[key] = len(self.nodes)
+            self.nodes.append(key)
+        return self.ids[key]
+
+    def children(self, node):
+        key = self.nodes[node]
+        if key[0] in ('ref', 'const'):
+            return []
+        if key[0] in ('shift', 'rebase'):
+            return [key[2]]
+        if key[0] == 'splice':
+            return list(key[3:])
+        return list(key[1:])
+
+    def levels(self, roots):
+        '''Lists of the nodes the roots depend on, every node after all its children'''
+        depths = {}
+        for root in roots:
+            stack = [(root, False)]
+            visiting = set()
+            while stack:
+                node, expanded = stack.pop()
+                if node in depths:
+                    continue
+                children = self.children(node)
+                if expanded:
+                    visiting.discard(node)
+                    depths[node] = 1 + max([depths[child] for child in children] + [-1])
+                    continue
+                if node in visiting:
+                    raise FormulaError('Circular formulas')
+                visiting.add(node)
+                stack.append((node, True))
+                stack.extend((child, False) for child in children if child not in depths)
+        levels = collections.defaultdict(list)
+        for node, depth in depths.items():
+            levels[depth].append(node)
+        return [sorted(levels[depth]) for depth in sorted(levels)]
+
+
+def _fold(arguments, function):
+    result = arguments[0].copy()
+    for argument in arguments[1:]:
+        result = function(result, argument)
+    return result
+
+
+def _ignore_missing(sign):
+    def function(total, values):
+        missing = np.isnan(total)
+        result = np.where(missing, sign * values, total + sign * values)
+        return np.where(~missing & np.isnan(values), total, result)
+    return function
+
+
+class Formulas:
+    '''
+    Compiled formulas, they run in the order they are given like in FDMS+: a formula sees the series computed by the
+    formulas before it, a series used before its formula (or by its own formula) is the input series.
+
+    formulas -- list of (target, expression text) or of (section, target, expression text) as returned by
+                read_formulas. A later formula for the same target replaces the earlier one from then on.
+    strict   -- False to leave out the formulas that can't be parsed (they are in self.skipped), raise FormulaError
+                otherwise.
+    '''
+    def __init__(self, formulas, strict=True):
+        self.graph = FormulaGraph()
+        self.roots = collections.OrderedDict()
+        self.skipped = collections.OrderedDict()
+        for formula in formulas:
+            target, text = formula[-2:]
+            try:
+                expression = Parser(text).parse()
+            except FormulaError as e:
+                if strict:
+                    raise
+                logger.info('Formula for {} left out: {}'.format(target, e))
+                self.skipped[target] = str(e)
+                continue
+            self.roots[target] = self.graph.add(expression, targets=self.roots)
+
+    @classmethod
+    def from_file(cls, sections=None, filename=COUNTRY_CALCULATION_TXT, strict=False):
+        return cls(read_formulas(filename, sections=sections), strict=strict)
+
+    @property
+    def targets(self):
+        return list(self.roots)
+
+    def inputs(self, targets=None):
+        '''(database, code) of the series needed to compute targets (all of them by default), database is None for
+        the series of the country'''
+        roots = [self.roots[target] for target in (targets or self.roots)]
+        nodes = [node for level in self.graph.levels(roots) for node in level]
+        return [self.graph.nodes[node][1:] for node in nodes if self.graph.nodes[node][0] == 'ref']
+
+    def evaluate(self, resolve, years=None, targets=None):
+        '''
+        Returns an OrderedDict target -> pd.Series indexed by years.
+
+        resolve -- function(database, code) returning the pd.Series of an input, raising KeyError if it's missing
+                   (it's NaN then).
+        years   -- Consecutive years the formulas are computed for, the years of the inputs by default.
+        targets -- Targets to compute, all of them by default.
+        '''
+        targets = list(targets or self.roots)
+        levels = self.graph.levels([self.roots[target] for target in targets])
+        inputs = {}
+        for node in [node for level in levels for node in level if self.graph.nodes[node][0] == 'ref']:
+            _, database, code = self.graph.nodes[node]
+            try:
+                series = resolve(database, code)
+            except KeyError:
+                continue
+            inputs[node] = series[~series.index.duplicated(keep='last')]
+        if years is None:
+            years = sorted(set(year for series in inputs.values() for year in series.index))
+        years = list(years)
+
+        values = np.full((len(self.graph.nodes), len(years)), np.nan)
+        for node, series in inputs.items():
+            values[node] = pd.to_numeric(series.reindex(years), errors='coerce').values
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for level in levels:
+                groups = collections.OrderedDict()
+                for node in level:
+                    key = self.graph.nodes[node]
+                    if key[0] == 'splice':
+                        group = key[:3]
+                    elif key[0] in ('shift', 'rebase'):
+                        group = key[:2]
+                    else:
+                        # The functions with any number of arguments are computed together when they have as many
+                        group = (key[0], len(key))
+                    groups.setdefault(group, []).append(node)
+                for group, nodes in groups.items():
+                    if group[0] != 'ref':
+                        self._evaluate_group(group, nodes, values, years)
+        return collections.OrderedDict((target, pd.Series(values[self.roots[target]], index=years))
+                                       for target in targets)
+
+    def _evaluate_group(self, group, nodes, values, years):
+        kind = group[0]
+        keys = [self.graph.nodes[node] for node in nodes]
+        if kind == 'const':
+            values[nodes] = np.array([key[1] for key in keys])[:, None]
+            return
+        if kind == 'shift':
+            values[nodes] = shift(values[[key[2] for key in keys]], group[1])
+            return
+        if kind == 'rebase':
+            if group[1] in years:
+                children = values[[key[2] for key in keys]]
+                values[nodes] = children / children[:, [years.index(group[1])]] * 100
+            return
+        if kind == 'splice':
+            base = pd.DataFrame(values[[key[3] for key in keys]], columns=years)
+            splice = pd.DataFrame(values[[key[4] for key in keys]], columns=years)
+            values[nodes] = Splicer().splice_block(base, splice, method=group[1], kind=group[2]).values
+            return
+        arguments = [values[[key[i] for key in keys]] for i in range(1, len(keys[0]))]
+        if kind == '+':
+            values[nodes] = arguments[0] + arguments[1]
+        elif kind == '-':
+            values[nodes] = arguments[0] - arguments[1]
+        elif kind == '*':
+            values[nodes] = arguments[0] * arguments[1]
+        elif kind == '/':
+            values[nodes] = arguments[0] / arguments[1]
+        elif kind == 'neg':
+            values[nodes] = -arguments[0]
+        elif kind == 'sum':
+            values[nodes] = _fold(arguments, np.add)
+        elif kind == 'ignoremissingsum':
+            values[nodes] = _fold(arguments, _ignore_missing(1))
+        elif kind == 'ignoremissingsubtract':
+            values[nodes] = _fold(arguments, _ignore_missing(-1))
+        elif kind == 'merge':
+            values[nodes] = _fold(arguments, lambda merged, other: np.where(np.isnan(merged), other, merged))
+        elif kind == 'iin':
+            value_if_not_null = arguments[2] if len(arguments) == 3 else arguments[0]
+            values[nodes] = np.where(np.isnan(arguments[0]), arguments[1], value_if_not_null)
+        elif kind == 'pch':
+            # Like Series.pct_change, missing values take the previous one
+            values[nodes] = pch(arguments[0])
+        else:
+            raise FormulaError('Unknown node {}'.format(kind))
+
+
+_FORMULAS = {}
+
+
+def get_formulas(sections):
+    '''Formulas of these sections of the country calculation, compiled once'''
+    key = tuple(sections)
+    if key not in _FORMULAS:
+        _FORMULAS[key] = Formulas.from_file(sections=key)
+    return _FORMULAS[key]
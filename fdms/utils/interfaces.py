@@ -9,8 +9,16 @@ Naming conventions:
     - Output Gap database: `OUTPUT_GAP.xlsx`
     - Exchange rates database: `XR_IR.xlsx`
     - Cycolical Adjustment: `CYCLICAL_ADJUSTMENT.xlsx`
+
+Parsing the forecast workbooks with openpyxl is slow, so the sheets are cached in `CACHE_DIR` as `.npz` files holding
+the numeric year block and the metadata columns. A cached sheet is used while the mtime of the workbook is unchanged, or
+while its content hash matches if the file was touched. Set `DMS_CACHE=0` to disable the cache.
 '''
+import hashlib
+import json
 import logging
+import os
+import zipfile
 
 
 logger = logging.getLogger(__name__)
@@ -19,20 +27,28 @@ logging.basicConfig(filename='error.log',
                     level=logging.INFO)
 
 
+import numpy as np
 import pandas as pd
 import re
 
-from fdms.config import AMECO, FORECAST, COLUMN_ORDER
+from fdms.config import AMECO, FORECAST, COLUMN_ORDER, CACHE_DIR, TRADE_WEIGHTS, USE_CACHE
 from fdms.config.countries import COUNTRIES
 from fdms.config.country_groups import ALL_COUNTRIES
+from fdms.utils.profiler import profiled
 
 
 def _get_iso(ameco_code):
     return COUNTRIES['ameco_code']
 
 
+# Reverse ISO map, from the ISO code used in AMECO series codes to the AMECO country code
+_AMECO_CODES = {}
+for _ameco_code, _iso_code in COUNTRIES.items():
+    _AMECO_CODES.setdefault(_iso_code, _ameco_code)
+
+
 def _get_ameco(iso_code):
-    return COUNTRIES[COUNTRIES == iso_code].index[0]
+    return _AMECO_CODES[iso_code]
 
 
 def _get_from_series_code(series_code, param='variable'):
@@ -42,31 +58,189 @@ def _get_from_series_code(series_code, param='variable'):
     return '.'.join([parts[-1], *parts[1:-1]])
 
 
+def _file_digest(filename, block_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _get_cache_filename(filename, **options):
+    key = json.dumps([os.path.abspath(filename), options], sort_keys=True)
+    return os.path.join(CACHE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.npz')
+
+
+def _is_year(column):
+    return re.match('^[0-9]{4}$', str(column)) is not None
+
+
+def _to_json_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+def _from_json_value(value):
+    return np.nan if value is None else value
+
+
+def _convert_years(df):
+    '''The year columns of df as float64 ("n.a." becomes NaN) labelled by int years, like the cached sheets'''
+    df = df.copy()
+    for column in df.columns:
+        if _is_year(column):
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(np.float64)
+    df.columns = [int(column) if _is_year(column) else column for column in df.columns]
+    return df
+
+
+def _write_cache_file(cache_filename, values, meta):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Write to a temporary file first so that concurrent readers never see a partial cache entry
+    tmp_filename = '{}.{}.tmp'.format(cache_filename, os.getpid())
+    with open(tmp_filename, 'wb') as f:
+        np.savez(f, values=values, meta=np.array(json.dumps(meta)))
+    os.replace(tmp_filename, cache_filename)
+
+
+def _store_cached_sheet(cache_filename, df, source):
+    years = [column for column in df.columns if _is_year(column)]
+    values = df[years].apply(pd.to_numeric, errors='coerce').values.astype(np.float64) if years else np.empty(
+        (df.shape[0], 0))
+    meta = {
+        'source': source,
+        'columns': [[column, _is_year(column)] for column in df.columns],
+        'index_names': list(df.index.names),
+        'index': [[_to_json_value(v) for v in (key if isinstance(key, tuple) else (key,))] for key in df.index],
+        'metadata': {str(column): [_to_json_value(v) for v in df[column]] for column in df.columns
+                     if not _is_year(column)},
+    }
+    _write_cache_file(cache_filename, values, meta)
+
+
+def _load_cached_sheet(cache_filename, filename):
+    '''Returns the cached sheet or None if there is no valid cache entry for the current content of filename'''
+    if not os.path.exists(cache_filename):
+        return None
+    with np.load(cache_filename) as cached:
+        values = cached['values']
+        meta = json.loads(str(cached['meta']))
+    stat = os.stat(filename)
+    source = meta['source']
+    if (source['mtime'], source['size']) != (stat.st_mtime, stat.st_size):
+        if source['size'] != stat.st_size or source['sha1'] != _file_digest(filename):
+            return None
+        # Same content with a new mtime (i.e. the file was copied or touched), remember the new mtime
+        source['mtime'] = stat.st_mtime
+        _write_cache_file(cache_filename, values, meta)
+    index = [tuple(_from_json_value(v) for v in key) for key in meta['index']]
+    if len(meta['index_names']) > 1:
+        index = pd.MultiIndex.from_tuples(index, names=meta['index_names'])
+    else:
+        index = pd.Index([key[0] for key in index], name=meta['index_names'][0])
+    data, year_position = {}, 0
+    columns = []
+    for column, is_year in meta['columns']:
+        if is_year:
+            column = int(column) if isinstance(column, str) else column
+            data[column] = values[:, year_position]
+            year_position += 1
+        else:
+            data[column] = [_from_json_value(v) for v in meta['metadata'][str(column)]]
+        columns.append(column)
+    return pd.DataFrame(data, index=index, columns=columns)
+
+
+@profiled()
+def read_excel_cached(filename, sheet_name, header=0, index_col=None):
+    '''
+    Same as pd.read_excel but the parsed sheet is kept in CACHE_DIR, keyed by the path of the workbook, its mtime and
+    its content hash. Values in the year columns are converted to float64 ("n.a." becomes NaN) and labelled by int
+    years, with DMS_CACHE=0 too.
+    '''
+    if not USE_CACHE:
+        return _convert_years(pd.read_excel(filename, sheet_name=sheet_name, header=header, index_col=index_col))
+    cache_filename = _get_cache_filename(filename, sheet_name=sheet_name, header=header, index_col=index_col)
+    try:
+        df = _load_cached_sheet(cache_filename, filename)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        logger.warning('Ignoring corrupt cache file {} for {}: {}'.format(cache_filename, filename, e))
+        df = None
+    if df is not None:
+        return df
+    stat = os.stat(filename)
+    df = pd.read_excel(filename, sheet_name=sheet_name, header=header, index_col=index_col)
+    source = {'filename': os.path.abspath(filename), 'mtime': stat.st_mtime, 'size': stat.st_size,
+              'sha1': _file_digest(filename)}
+    try:
+        _store_cached_sheet(cache_filename, df, source)
+    except OSError as e:
+        logger.warning('Could not cache {}: {}'.format(filename, e))
+        return _convert_years(df)
+    return _load_cached_sheet(cache_filename, filename)
+
+
+@profiled()
 def read_country_forecast_excel(country_forecast_filename=FORECAST, frequency='annual', country=None):
     if country in ALL_COUNTRIES:
         country_forecast_filename = '{}.Forecast.xlsm'.format(country)
     sheet_name = 'Transfer FDMS+ Q' if frequency == 'quarterly' else 'Transfer FDMS+ A'
-    df = pd.read_excel(country_forecast_filename, sheet_name=sheet_name, header=10, index_col=[1, 3])
+    df = read_excel_cached(country_forecast_filename, sheet_name=sheet_name, header=10, index_col=[1, 3])
     df = df.reset_index()
     df.rename(columns={'Variable': 'Variable Code', 'Country': 'Country Ameco'}, inplace=True)
     df = df.set_index(['Country Ameco', 'Variable Code'])
     return df
 
 
-def read_ameco_txt(ameco_filename=AMECO):
+@profiled()
+def read_ameco_txt(ameco_filename=AMECO, countries=None, variables=None):
+    '''
+    Read the AMECO historical data extract (`AMECO_H.TXT`)
+
+    ameco_filename -- Comma separated file with a CODE column (i.e. `BEL.1.0.0.0.UVGD`), four description columns and
+                      one column per year.
+    countries      -- Optional list of AMECO country codes (i.e. `['BE', 'DE']`), only those rows are loaded.
+    variables      -- Optional list of variable codes (i.e. `['UVGD.1.0.0.0']`), only those rows are loaded.
+
+    returns        -- pd.DataFrame indexed by (Country Ameco, Variable Code) with float64 year columns
+    '''
     with open(ameco_filename, 'r') as f:
-        lines = [line.strip() for line in f.readlines()]
-    ameco_df = pd.DataFrame.from_records([line.split(',') for line in lines[1:]], columns=lines[0].split(','))
-    ameco_df = ameco_df.set_index('CODE')
-    ameco_df['Country Ameco'] = ameco_df.apply(lambda row: _get_ameco(_get_from_series_code(row.name, 'country')),
-                                               axis=1)
-    ameco_df['Variable Code'] = ameco_df.apply(lambda row: _get_from_series_code(row.name, 'variable'), axis=1)
-    ameco_df.rename(columns={c: int(c) for c in ameco_df.columns if re.match('^[0-9]+$', c)}, inplace=True)
-    ameco_df = ameco_df.reset_index()
+        header = f.readline().strip().split(',')
+        lines = pd.Series(f.read().splitlines())
+    lines = lines[lines.str.strip() != ''].str.strip()
+    codes = lines.str.split(',', n=1).str[0]
+    parts = codes.str.extract(r'^(?P<iso>[^.]*)(?:\.(?P<tail>.*))?\.(?P<name>[^.]*)$', expand=True)
+    country_codes = parts['iso'].map(_AMECO_CODES)
+    unknown = parts['iso'].notna() & country_codes.isna()
+    if unknown.any():
+        logger.warning('Unknown AMECO country codes in {}: {}'.format(ameco_filename, ', '.join(
+            sorted(parts.loc[unknown, 'iso'].unique()))))
+    country_codes = country_codes.fillna(parts['iso']).fillna(codes)
+    variable_codes = (parts['name'] + ('.' + parts['tail']).fillna('')).fillna(codes)
+    mask = pd.Series(True, index=lines.index)
+    if countries is not None:
+        mask &= country_codes.isin(countries)
+    if variables is not None:
+        mask &= variable_codes.isin(variables)
+
+    ameco_df = lines[mask].str.split(',', expand=True)
+    ameco_df = ameco_df.reindex(columns=range(len(header)))
+    ameco_df.columns = header
+    years = [c for c in header if re.match('^[0-9]+$', c)]
+    ameco_df[years] = ameco_df[years].apply(pd.to_numeric, errors='coerce').astype('float64')
+    ameco_df.rename(columns={c: int(c) for c in years}, inplace=True)
+    ameco_df['Country Ameco'] = country_codes[mask].values
+    ameco_df['Variable Code'] = variable_codes[mask].values
     ameco_df = ameco_df.set_index(['Country Ameco', 'Variable Code'])
     return ameco_df
 
 
+@profiled()
 def read_expected_result(xls_export='fdms/sample_data/BE.exp.xlsx', country=None):
     if country in ALL_COUNTRIES:
         xls_export = 'fdms/sample_data/{}.exp.xlsx'.format(country)
@@ -78,6 +252,7 @@ def read_expected_result(xls_export='fdms/sample_data/BE.exp.xlsx', country=None
     return df
 
 
+@profiled()
 def read_expected_result_be(xls_export='fdms/sample_data/BE_expected_scale.xlsx'):
     df = pd.read_excel(xls_export, sheet_name='BE', index_col=[0, 1])
     df = df.reset_index()
@@ -88,9 +263,10 @@ def read_expected_result_be(xls_export='fdms/sample_data/BE_expected_scale.xlsx'
     return df
 
 
+@profiled()
 def read_raw_data(country_forecast_filename, ameco_filename, ameco_sheet_name, frequency='annual'):
     sheet_name = 'Transfer FDMS+ Q' if frequency == 'quarterly' else 'Transfer FDMS+ A'
-    df = pd.read_excel(country_forecast_filename, sheet_name=sheet_name, header=10, index_col=[1, 3])
+    df = read_excel_cached(country_forecast_filename, sheet_name=sheet_name, header=10, index_col=[1, 3])
     ameco_df = pd.read_excel(ameco_filename, sheet_name=ameco_sheet_name, index_col=[0, 1])
     ameco_df.rename(columns={c: int(c) for c in ameco_df.columns if re.match('^[0-9]+$', c)}, inplace=True)
     return df, ameco_df
@@ -98,9 +274,9 @@ def read_raw_data(country_forecast_filename, ameco_filename, ameco_sheet_name, f
 
 # TODO: check if we're using ameco historic instead of this one in some places by mistake
 # TODO: We need either our own database or a uniway to get data from the existing one,
+@profiled()
 def read_ameco_db_xls(ameco_db_excel='fdms/sample_data/AMECO_DB_BE.xlsx', frequency='annual', country=None,
-                      all_data=False):
-    sheet_name = 'BE'
+                      all_data=False, sheet_name='BE'):
     if country in ALL_COUNTRIES:
         ameco_db_excel = 'fdms/sample_data/AMECO_DB_{}.xlsx'.format(country)
         sheet_name = country
@@ -118,6 +294,7 @@ def read_ameco_db_xls(ameco_db_excel='fdms/sample_data/AMECO_DB_BE.xlsx', freque
     return df
 
 
+@profiled()
 def read_output_gap_xls(output_gap_excel='fdms/sample_data/OUTPUT_GAP.xlsx', frequency='annual'):
     sheet_name = 'output_gap'
     df = pd.read_excel(output_gap_excel, sheet_name=sheet_name, index_col=[0, 1])
@@ -129,6 +306,7 @@ def read_output_gap_xls(output_gap_excel='fdms/sample_data/OUTPUT_GAP.xlsx', fre
     return df
 
 
+@profiled()
 def read_xr_ir_xls(output_gap_excel='fdms/sample_data/XR_IR.xlsx', frequency='annual'):
     sheet_name = 'xr-ir'
     df = pd.read_excel(output_gap_excel, sheet_name=sheet_name, index_col=[0, 1])
@@ -140,6 +318,7 @@ def read_xr_ir_xls(output_gap_excel='fdms/sample_data/XR_IR.xlsx', frequency='an
     return df
 
 
+@profiled()
 def read_ameco_xne_us_xls(ameco_xne_us_excel='fdms/sample_data/AMECO_XNE_US.xlsx', frequency='annual'):
     sheet_name = 'ameco_xne_us'
     df = pd.read_excel(ameco_xne_us_excel, sheet_name=sheet_name, index_col=[0, 1])
@@ -151,13 +330,28 @@ def read_ameco_xne_us_xls(ameco_xne_us_excel='fdms/sample_data/AMECO_XNE_US.xlsx
     return df
 
 
+@profiled()
+def read_trade_weights_xls(trade_weights_excel=TRADE_WEIGHTS):
+    '''
+    Double export weights of the partner groups: one row per (Group, Country) with the weights of the partner
+    countries in the columns, i.e. ('437', 'BE') -> {'DE': 0.21, 'FR': 0.18...}. Groups are the partner group codes.
+    '''
+    sheet_name = 'trade_weights'
+    df = read_excel_cached(trade_weights_excel, sheet_name=sheet_name)
+    df['Group'] = df['Group'].astype(str)
+    df = df.set_index(['Group', 'Country'])
+    return df.fillna(0.0).astype(float)
+
+
+@profiled()
 def get_fc(country='BE', frequency='annual'):
     sheet_name = 'Transfer FDMS+ Q' if frequency == 'quarterly' else 'Transfer FDMS+ A'
     country_forecast_filename = 'fdms/sample_data/{}.Forecast.SF2018.xlsm'.format(country)
-    df = pd.read_excel(country_forecast_filename, sheet_name=sheet_name, header=10, index_col=[1, 3])
+    df = read_excel_cached(country_forecast_filename, sheet_name=sheet_name, header=10, index_col=[1, 3])
     return df
 
 
+@profiled()
 def get_scales_from_forecast(country='BE', frequency='annual'):
     df = get_fc(country, frequency)
     scales = {index[1] + '.1.0.0.0': df.loc[index, 'Scale'].capitalize() for index in df.index}
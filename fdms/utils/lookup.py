@@ -0,0 +1,193 @@
+'''
+(country, variable code) -> row position index for the dataframes passed to StepMixin.get_data.
+
+Two layouts are supported, the ones used all over the steps:
+
+    - input dataframes with a (Country Ameco, Variable Code) MultiIndex, sorted once when they are first indexed.
+    - results with a RangeIndex and 'Country Ameco' / 'Variable Code' columns, that grow with
+      `self.result = self.result.append(...)`; the index of the previous result is extended with the new rows only.
+
+The year columns of the dataframes indexed as read only (the inputs the steps share, see get_series_index) are
+converted to float64 once, like SeriesBlock.from_frame does, and lookups return rows of that matrix: they must not be
+modified in place once indexed. The rows of the other dataframes are converted at every lookup, so that changes made in
+place are seen; live results, which the steps modify in place, as get_data always did (`filter(regex='[0-9]{4}')` and
+`pd.to_numeric`).
+
+Indexes are built and looked up holding a lock, steps running in threads may share their inputs.
+'''
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from fdms.utils.block import KEY_COLUMNS, YEAR_REGEX, year_values
+
+
+_INDEXES = {}
+_LOCK = threading.RLock()
+
+
+class SeriesIndex:
+    '''Row positions of the series of a dataframe, keyed by (country, variable code), the last row wins'''
+    def __init__(self, dataframe, read_only=False):
+        self.positions = {}
+        # The year values are converted once (and cached) for read only dataframes only
+        self.read_only = read_only
+        self._values = None
+        self.verified = False
+        self._length = 0
+        self._index = None
+        self._columns = None
+        self._frame = None
+        self._finalizer = None
+        self._attach(dataframe)
+        self.rebuild()
+
+    @property
+    def dataframe(self):
+        return self._frame() if self._frame is not None else None
+
+    @staticmethod
+    def supports(dataframe):
+        if type(dataframe.index) == pd.MultiIndex:
+            return dataframe.index.nlevels == 2
+        if type(dataframe.index) == pd.RangeIndex:
+            return all(column in dataframe.columns for column in KEY_COLUMNS)
+        return False
+
+    def _attach(self, dataframe):
+        if self._finalizer is not None:
+            self._finalizer.detach()
+            _INDEXES.pop(self._frame_id, None)
+        self._frame = weakref.ref(dataframe)
+        self._frame_id = id(dataframe)
+        self._finalizer = weakref.finalize(dataframe, _INDEXES.pop, self._frame_id, None)
+        _INDEXES[self._frame_id] = self
+
+    def _update_columns(self):
+        dataframe = self.dataframe
+        if dataframe.columns is not self._columns:
+            self._columns = dataframe.columns
+            self.year_positions = [i for i, column in enumerate(dataframe.columns)
+                                   if YEAR_REGEX.search(str(column)) is not None]
+            if type(dataframe.index) == pd.RangeIndex:
+                self._key_positions = [dataframe.columns.get_loc(column) for column in KEY_COLUMNS]
+            self._values = None
+
+    def _keys(self, start=0):
+        dataframe = self.dataframe
+        if type(dataframe.index) == pd.MultiIndex:
+            return dataframe.index[start:]
+        return zip(dataframe['Country Ameco'].values[start:], dataframe['Variable Code'].values[start:])
+
+    def rebuild(self):
+        dataframe = self.dataframe
+        if type(dataframe.index) == pd.MultiIndex:
+            # get_data always left its inputs sorted
+            dataframe.sort_index(level=[0, 1], inplace=True)
+        self._update_columns()
+        self.positions = {key: position for position, key in enumerate(self._keys())}
+        self._values = None
+        self._length = len(dataframe)
+        self._index = dataframe.index
+        self._save_edges()
+        self.verified = True
+
+    def is_current(self):
+        dataframe = self.dataframe
+        return (dataframe is not None and dataframe.index is self._index and len(dataframe) == self._length and
+                dataframe.columns is self._columns)
+
+    def follow(self, dataframe):
+        '''
+        Moves the index to `dataframe`, a result obtained by appending rows to the indexed one. Only the new rows are
+        indexed, lookups check the keys of the rows they return and a miss triggers a full rebuild.
+        '''
+        appended = (type(dataframe.index) == pd.RangeIndex and type(self._index) == pd.RangeIndex and
+                    len(dataframe) >= self._length and self.supports(dataframe))
+        if appended and self._length > 0:
+            # Rows are only added at the end, the first and last indexed rows must be where they were
+            key_positions = [dataframe.columns.get_loc(column) for column in KEY_COLUMNS]
+            appended = all(tuple(dataframe.iat[position, column] for column in key_positions) == self._edges[i]
+                           for i, position in enumerate([0, self._length - 1]))
+        self._attach(dataframe)
+        if not appended:
+            self.rebuild()
+            return self
+        self._update_columns()
+        for position, key in enumerate(self._keys(self._length), self._length):
+            self.positions[key] = position
+        self._values = None
+        self._length = len(dataframe)
+        self._index = dataframe.index
+        self._save_edges()
+        self.verified = False
+        return self
+
+    def _save_edges(self):
+        self._edges = [self._key_at(0), self._key_at(self._length - 1)] if self._length else []
+
+    def _key_at(self, position):
+        dataframe = self.dataframe
+        if type(dataframe.index) == pd.MultiIndex:
+            return dataframe.index[position]
+        return tuple(dataframe.iat[position, column] for column in self._key_positions)
+
+    def find(self, country, variable):
+        '''Returns the row position of the series or None'''
+        with _LOCK:
+            if not self.is_current():
+                self.rebuild()
+            key = (country, variable)
+            position = self.positions.get(key)
+            if not self.verified and (position is None or self._key_at(position) != key):
+                self.rebuild()
+                position = self.positions.get(key)
+            return position
+
+    def get(self, country, variable, live=False):
+        '''
+        Returns the numeric year values of the series as a new pd.Series, raises KeyError if it's missing.
+        Set live=True for dataframes that may be modified in place, the values are not cached then.
+        '''
+        with _LOCK:
+            position = self.find(country, variable)
+            if position is None:
+                raise KeyError((country, variable))
+            if live:
+                self._values = None
+                return self._numeric(position)
+            dataframe = self.dataframe
+            if not self.read_only:
+                values = pd.to_numeric(dataframe.iloc[position, self.year_positions], errors='coerce')
+                return pd.Series(values.values.astype(np.float64), index=dataframe.columns[self.year_positions],
+                                 name=dataframe.index[position])
+            if self._values is None:
+                self._values = year_values(dataframe, self.year_positions)
+            return pd.Series(self._values[position].copy(), index=dataframe.columns[self.year_positions],
+                             name=dataframe.index[position])
+
+    def _numeric(self, position):
+        series = self.dataframe.iloc[position]
+        return pd.to_numeric(series.iloc[self.year_positions], errors='coerce')
+
+
+def get_series_index(dataframe, previous=None, read_only=False):
+    '''
+    Returns the SeriesIndex of `dataframe`, or None if its layout is not supported.
+    previous  -- SeriesIndex of the dataframe this one was appended to, it's extended instead of built from scratch
+    read_only -- The dataframe is not modified in place from now on, its year values are converted once
+    '''
+    with _LOCK:
+        index = _INDEXES.get(id(dataframe))
+        if index is None or index.dataframe is not dataframe:
+            if not SeriesIndex.supports(dataframe):
+                return None
+            if previous is not None and previous.dataframe is not dataframe:
+                index = previous.follow(dataframe)
+            else:
+                index = SeriesIndex(dataframe)
+        if read_only:
+            index.read_only = True
+        return index
@@ -0,0 +1,178 @@
+'''
+On disk memoization of the results of the steps.
+
+A step decorated with memoize stores what its perform_computation returns in `MEMO_DIR`, under the sha1 of:
+
+    - the step: its class, VERSION and the source of its module, fdms.utils and fdms.config (a change in the code
+      the steps share is a new version of every step);
+    - the country, frequency and scales of the step;
+    - the inputs: index, columns and values of the dataframes and series, or the value of anything else;
+    - BASE_PERIOD, COLUMN_ORDER and the country groups.
+
+The next time the step gets the same inputs the result is read back (and handed to the OutputWriter like a computed
+one) instead of computed. Entries are pickles of (returned value, self.result, variable codes looked up), the least
+recently used are removed when they take more than `MEMO_SIZE` bytes. Set `DMS_MEMO=0` (or `DMS_CACHE=0`) to always
+compute the steps.
+'''
+import functools
+import glob
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sys
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(filename='error.log',
+                    format='{%(pathname)s:%(lineno)d} - %(asctime)s %(module)s %(levelname)s: %(message)s',
+                    level=logging.INFO)
+
+import numpy as np
+import pandas as pd
+
+from fdms.config import BASE_DIR, BASE_PERIOD, COLUMN_ORDER, MEMO_DIR, MEMO_SIZE, USE_MEMO
+from fdms.config import country_groups
+from fdms.utils.mixins import add_reads, record_reads
+from fdms.utils.store import AmecoStore
+
+# Source digests of the modules, by filename
+_SOURCES = {}
+
+
+def _source_digest(filenames):
+    digest = hashlib.sha1()
+    for filename in sorted(filenames):
+        if filename not in _SOURCES:
+            with open(filename, 'rb') as f:
+                _SOURCES[filename] = hashlib.sha1(f.read()).hexdigest()
+        digest.update(_SOURCES[filename].encode('ascii'))
+    return digest.hexdigest()
+
+
+def _shared_sources():
+    return [filename for package in ['utils', 'config']
+            for filename in glob.glob(os.path.join(BASE_DIR, package, '*.py'))]
+
+
+def _config():
+    groups = {name: value for name, value in vars(country_groups).items() if name.isupper()}
+    return json.dumps([BASE_PERIOD, COLUMN_ORDER, groups], sort_keys=True, default=str)
+
+
+def _update(digest, value):
+    '''
+    Adds value to digest: the content of dataframes and series, the files an AmecoStore was built from, the json or
+    repr of the rest
+    '''
+    if isinstance(value, AmecoStore):
+        digest.update(json.dumps(['AmecoStore', value.name, value.sources], sort_keys=True).encode('utf-8'))
+        return
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(type(value).__name__.encode('utf-8'))
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr([(column, str(dtype)) for column, dtype in value.dtypes.items()]).encode('utf-8'))
+        else:
+            digest.update(str(value.dtype).encode('utf-8'))
+        digest.update(repr(list(value.index.names)).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        return
+    try:
+        text = json.dumps(value, sort_keys=True)
+    except TypeError:
+        text = repr(value)
+    digest.update(text.encode('utf-8'))
+
+
+def get_key(step, args):
+    '''Hash of the step, its settings and the inputs args of its perform_computation'''
+    module = sys.modules[type(step).__module__]
+    digest = hashlib.sha1()
+    # Entries pickled by other versions of Python, pandas or numpy may not load
+    versions = [list(sys.version_info[:3]), pd.__version__, np.__version__]
+    for value in [type(step).__name__, step.VERSION, _source_digest([module.__file__] + _shared_sources()),
+                  _config(), versions, step.country, step.frequency, step.scale, step.scales]:
+        _update(digest, value)
+    for value in args:
+        _update(digest, value)
+    return digest.hexdigest()
+
+
+def _filename(key, memo_dir):
+    return os.path.join(memo_dir, key + '.pkl')
+
+
+def load(key, memo_dir=MEMO_DIR):
+    '''Entry of key or None, it becomes the most recently used. Entries that can't be read are removed'''
+    filename = _filename(key, memo_dir)
+    try:
+        with open(filename, 'rb') as f:
+            entry = pickle.load(f)
+        os.utime(filename)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # Truncated files, or pickled with classes that no longer exist (AttributeError, ImportError...)
+        logger.warning('Ignoring step result {}: {!r}'.format(filename, e))
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        return None
+    return entry
+
+
+def store(key, entry, memo_dir=MEMO_DIR, max_size=MEMO_SIZE):
+    os.makedirs(memo_dir, exist_ok=True)
+    filename = _filename(key, memo_dir)
+    tmp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmp_filename, 'wb') as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_filename, filename)
+    evict(memo_dir, max_size)
+
+
+def evict(memo_dir=MEMO_DIR, max_size=MEMO_SIZE):
+    '''Removes the least recently used entries until they take max_size bytes at most'''
+    entries = []
+    for filename in glob.glob(os.path.join(memo_dir, '*.pkl')):
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, filename))
+    size = sum(entry[1] for entry in entries)
+    for _, entry_size, filename in sorted(entries):
+        if size <= max_size:
+            break
+        try:
+            os.remove(filename)
+        except OSError:
+            continue
+        size -= entry_size
+
+
+def memoize(step):
+    '''
+    Decorator of perform_computation of the step number step (see StepMixin.export_result), its results are
+    memoized on disk when USE_MEMO is set
+    '''
+    def decorator(perform_computation):
+        @functools.wraps(perform_computation)
+        def wrapper(self, *args):
+            if not USE_MEMO:
+                return perform_computation(self, *args)
+            key = get_key(self, args)
+            entry = load(key, memo_dir=MEMO_DIR)
+            if entry is not None:
+                value, self.result, reads = entry
+                add_reads(reads)
+                self.export_result(step=step)
+                return value
+            with record_reads() as reads:
+                value = perform_computation(self, *args)
+            add_reads(reads)
+            store(key, (value, self.result, reads), memo_dir=MEMO_DIR)
+            return value
+        return wrapper
+    return decorator
@@ -1,8 +1,45 @@
+import contextlib
+import threading
+
+import numpy as np
 import pandas as pd
 
 from fdms.config.scale_correction import SCALES
-from fdms.utils.series import COLUMN_ORDER
+from fdms.utils.addends import compile_addends
+from fdms.utils.block import SeriesBlock
+from fdms.utils.lookup import get_series_index
+from fdms.utils.output import get_output_writer
+from fdms.utils.profiler import profiled
+from fdms.utils.result import ResultBuilder
 from fdms.utils.splicer import Splicer
+from fdms.utils.store import AmecoStore
+
+# Variable codes looked up by the steps running in each thread, see record_reads
+_recorder = threading.local()
+
+
+@contextlib.contextmanager
+def record_reads():
+    '''Collects in a set the variable codes the steps running in the block look up (get_data, get_scale, get_index)'''
+    previous = getattr(_recorder, 'reads', None)
+    _recorder.reads = set()
+    try:
+        yield _recorder.reads
+    finally:
+        _recorder.reads = previous
+
+
+def add_reads(variables):
+    '''Adds variables to the codes collected by record_reads, for the steps that don't look them up again'''
+    reads = getattr(_recorder, 'reads', None)
+    if reads is not None:
+        reads.update(variables)
+
+
+def _record(variable):
+    reads = getattr(_recorder, 'reads', None)
+    if reads is not None:
+        reads.add(variable)
 
 
 class StepMixin:
@@ -10,25 +47,30 @@ class StepMixin:
     frequency = 'Annual'
     scale = 'Units'
     codes = {'Units': 0, 'Thousands': 1, 'Millions': 2, 'Billions': 3, '-': 0}
-    error = None
+    _result_index = None
+    # Part of the key of the memoized results (fdms.utils.memo), increase it when a step changes what it computes
+    # through code outside of its module, fdms.utils and fdms.config
+    VERSION = 1
 
-    def __init__(self, country=country, frequency=frequency, scale=scale, scales={}):
+    def __init__(self, country=country, frequency=frequency, scale=scale, scales={}, output=None):
         self.country = country
         self.frequency = frequency
         self.scale = scale
         self.scales = scales
         self.scale_correction = {}
-        self.result = pd.DataFrame(columns=COLUMN_ORDER)
+        # OutputWriter the result is handed to by export_result
+        self.output = output if output is not None else get_output_writer()
+        # Rows are added with self.result.add(meta, data), perform_computation returns self.result.to_frame()
+        self.result = ResultBuilder()
 
-    def update_result(self, series):
-        series = self.result.loc[(self.result['Country Ameco'] == series['Country Ameco']) & (
-            self.result['Variable Code'] == series['Variable Code'])]
-        if series.empty:
-            self.result.append(series, ignore_index=True, sort=True)
+    def update_result(self, meta, data):
+        if (meta['Country Ameco'], meta['Variable Code']) in self.result:
+            self.result.update(meta, data)
         else:
-            self.result.iloc[series.index.values[-1]] = series
+            self.result.add(meta, data)
 
     def get_scale(self, variable, dataframe=None, country=None):
+        _record(variable)
         if dataframe is not None:
             country = self.country if country is None else country
             try:
@@ -46,6 +88,7 @@ class StepMixin:
                     f.write(' '.join([variable, expected or '-', input_data or '-', '\n']))
         return (SCALES.get(variable) or self.scales.get(variable) or self.scale).capitalize()
 
+    @profiled()
     def apply_scale(self):
         for variable in self.scale_correction:
             meta = pd.Series(self.get_meta(variable))
@@ -62,124 +105,164 @@ class StepMixin:
                 with open('raro.txt', 'a') as f:
                     f.write(variable + '\n')
 
+    def export_result(self, step):
+        '''Hands the result to self.output, that writes it as output/{country}/output{step}.xlsx...'''
+        self.output.add_step(self.result, step=step, country=self.country)
+
     def get_meta(self, variable):
         return {'Country Ameco': self.country, 'Variable Code': variable, 'Frequency': self.frequency,
                 'Scale': self.get_scale(variable)}
 
+    def _lookups(self, dataframe_s, result=True):
+        '''(dataframe, lookup) of every dataframe of dataframe_s get_data looks in, in order, see get_data'''
+        if type(dataframe_s) in [pd.DataFrame, AmecoStore, ResultBuilder, SeriesBlock]:
+            dataframe_s = [dataframe_s]
+        dataframe_s = list(dataframe_s)
+        if any(dataframe is self.result for dataframe in dataframe_s):
+            result = False
+        if result is True:
+            dataframe_s.append(self.result)
+        for dataframe in dataframe_s:
+            if isinstance(dataframe, (AmecoStore, ResultBuilder, SeriesBlock)):
+                yield dataframe, dataframe
+            else:
+                lookup = self._get_series_index(dataframe)
+                if lookup is not None:
+                    yield dataframe, lookup
+
+    @profiled()
     def get_data(self, dataframe_s, variable, country=None, null_dates=None, result=True):
         '''Get quarterly or yearly data from dataframe (input with MultiIndex or result with RangeIndex)
         Get the numerical values from a series to perform vectorial operations
 
-        dataframe_s -- Can be single dataframe or list of dataframes to look for the variable.
-                       It will return the series found first respecting dataframes order.
-                       If not found, and no_result=True, it will try to find it in self.result.
+        dataframe_s -- Can be single dataframe (or AmecoStore, ResultBuilder, SeriesBlock) or list of dataframes to
+                       look for the variable. It will return the series found first respecting dataframes order.
+                       If not found, and result=True, it will try to find it in self.result.
         variable    -- The variable to look up.
 
-        returns     -- pd.Series or None
+        returns     -- pd.Series, raises KeyError if the variable is not found (see has_data and first_available)
         '''
+        _record(variable)
         country = self.country if country is None else country
-        if type(dataframe_s) == pd.DataFrame:
-            dataframe_s = [dataframe_s]
-        for dataframe in dataframe_s:
-            if dataframe.equals(self.result):
-                result = False
-        if result is True:
-            dataframe_s.append(self.result)
-        series = pd.Series
-        for dataframe in dataframe_s:
-            if type(dataframe.index) == pd.MultiIndex:
-                dataframe.sort_index(level=[0, 1], inplace=True)
-                try:
-                    series = dataframe.loc[(country, variable)]
-                except KeyError as e:
-                    self.error = e
-                # if series.empty:
-                #     series = dataframe.loc[(country, variable)].filter(regex='[0-9]{4}Q[1234]')
-                # TODO: Log these and make sure that this is correct, check values and get the best one
-                if not series.empty:
-                    series = series.filter(regex='[0-9]{4}')
-                    if len(series.shape) > 1:
-                        series = series.iloc[-1]
-                        series = series.squeeze()
-                    series = pd.to_numeric(series, errors='coerce')
-                    if null_dates is not None:
-                        for year in null_dates:
-                            series[year] = pd.np.nan
-                    return series
-
-            elif type(dataframe.index) == pd.RangeIndex:
-                try:
-                    result_series_index = dataframe.loc[(dataframe['Country Ameco'] == country) & (
-                            dataframe['Variable Code'] == variable)].index.values
-                    if type(result_series_index) == tuple:
-                        result_series_index = result_series_index[-1]
-                    series = dataframe.loc[result_series_index]
-                except IndexError as e:
-                    self.error = e
-                series = series.filter(regex='[0-9]{4}')
-                # if series.empty:
-                #     series = dataframe.loc[result_series_index].filter(regex='[0-9]{4}Q[1234]')
-                if not series.empty:
-                    if len(series.shape) > 1:
-                        series = series.iloc[-1]
-                        series = series.squeeze()
-                    series = pd.to_numeric(series, errors='coerce')
-                    if null_dates is not None:
-                        for year in null_dates:
-                            series[year] = pd.np.nan
-                    return series
-
-        if self.error:
-            raise self.error
-        if series.empty:
-            raise KeyError
+        for dataframe, lookup in self._lookups(dataframe_s, result=result):
+            if isinstance(lookup, AmecoStore):
+                if (country, variable) not in lookup:
+                    continue
+                series = lookup.get(country, variable)
+            else:
+                position = lookup.find(country, variable)
+                if position is None:
+                    continue
+                if dataframe is self.result and lookup is not dataframe:
+                    series = lookup.get(country, variable, live=True)
+                else:
+                    series = lookup.get(country, variable)
+            if null_dates is not None:
+                for year in null_dates:
+                    series[year] = pd.np.nan
+            return series
+
+        raise KeyError((country, variable))
+
+    def has_data(self, dataframe_s, variable, country=None, result=True):
+        '''True if get_data finds the variable, without raising'''
+        _record(variable)
+        country = self.country if country is None else country
+        for _, lookup in self._lookups(dataframe_s, result=result):
+            if isinstance(lookup, AmecoStore):
+                if (country, variable) in lookup:
+                    return True
+            elif lookup.find(country, variable) is not None:
+                return True
+        return False
+
+    def first_available(self, variables, dataframe_s=None, country=None, result=True):
+        '''
+        The first of variables get_data finds in dataframe_s (self.result by default), None if it finds none of them.
+        i.e. self.first_available(['FETD.1.0.0.0', 'NETD.1.0.0.0'], df)
+        '''
+        dataframe_s = self.result if dataframe_s is None else dataframe_s
+        for variable in variables:
+            if self.has_data(dataframe_s, variable, country=country, result=result):
+                return variable
+        return None
+
+    def _get_series_index(self, dataframe):
+        '''SeriesIndex of dataframe, the one of self.result is extended as rows are appended to it'''
+        if dataframe is not self.result:
+            return get_series_index(dataframe)
+        self._result_index = get_series_index(dataframe, previous=self._result_index)
+        return self._result_index
 
     def get_index(self, variable_code, dataframe=None, country=None):
+        _record(variable_code)
         dataframe = self.result if dataframe is None else dataframe
         country = self.country if country is None else country
-        return dataframe.loc[(dataframe['Country Ameco'] == country) & (
-                dataframe['Variable Code'] == variable_code)].index.values[-1]
+        if isinstance(dataframe, (ResultBuilder, SeriesBlock)):
+            position = dataframe.find(country, variable_code)
+        else:
+            lookup = self._get_series_index(dataframe)
+            position = None if lookup is None else lookup.find(country, variable_code)
+        if position is None:
+            raise IndexError('{} not found for {}'.format(variable_code, country))
+        return position if isinstance(dataframe, ResultBuilder) else dataframe.index[position]
 
 
 class SumAndSpliceMixin(StepMixin):
+    # Targets the sum of which is ratio spliced instead of butt spliced, by country
+    RATIO_SPLICED = {'JP': ['UUTG.1.0.0.0', 'URTG.1.0.0.0']}
+
     def _sum_and_splice(self, addends, df, ameco_h_df, splice=True):
+        '''
+        Adds every target of addends ({target: [source, '-source', ...]}) to self.result, the sum of its sources
+        (looked up in df, then in self.result) butt spliced forward to its series in ameco_h_df.
+
+        The table is compiled once (fdms.utils.addends), and the targets that don't depend on each other are summed
+        at once. A target that is a source of another one and is not in df is computed first.
+        '''
+        table = compile_addends(addends)
         splicer = Splicer()
-        for variable, sources in addends.items():
-            series_meta = self.get_meta(variable)
-            expected_scale = series_meta.get('Scale')
-            try:
-                base_series = self.get_data(ameco_h_df, variable)
-            except KeyError:
-                base_series = None
-            splice_series = pd.Series()
-            for source in sources:
-                factor = 1
-                if source.startswith('-'):
-                    source = source[1:]
-                    factor = -1
-                src_scale = self.get_scale(source, dataframe=df)
-                expected_scale = self.get_scale(variable)
-                if src_scale != expected_scale:
-                    factor = factor * pow(1000, self.codes[src_scale] - self.codes[expected_scale])
-                try:
-                    source_data = factor * self.get_data(df, source)
-                except KeyError:
-                    source_data = factor * self.get_data(self.result, source)
-                splice_series = splice_series.add(source_data, fill_value=0)
-
-            if base_series is None or splice is False:
-                series_data = splice_series
-            else:
-                series_data = splicer.butt_splice(base_series, splice_series, kind='forward')
-            if self.country == 'JP' and variable in ['UUTG.1.0.0.0', 'URTG.1.0.0.0']:
-                if variable == 'URTG.1.0.0.0':
-                    new_sources = ['UUTG.1.0.0.0', 'UBLG.1.0.0.0']
-                    splice_series = self.get_data(
-                        self.result, new_sources[0]) + self.get_data(
-                        self.result, new_sources[1]
-                    )
-                series_data = splicer.ratio_splice(base_series, splice_series, kind='forward')
-            series_data = series_data
-            series = pd.Series(series_meta)
-            series = series.append(series_data)
-            self.result = self.result.append(series, ignore_index=True, sort=True)
+        chained = set(source for source in table.sources
+                      if source in addends and not self.has_data(df, source, result=False))
+        ratio_spliced = self.RATIO_SPLICED.get(self.country, [])
+        for targets in table.batches(chained, barriers=ratio_spliced):
+            sources = {}
+            factors = np.ones(table.positions.shape)
+            splice_indexes = {}
+            for target in targets:
+                row = table.targets.index(target)
+                expected_scale = self.get_scale(target)
+                splice_index = pd.Series().index
+                for column, (source, _) in enumerate(table.terms[target]):
+                    src_scale = self.get_scale(source, dataframe=df)
+                    if src_scale != expected_scale:
+                        factors[row, column] = pow(1000, self.codes[src_scale] - self.codes[expected_scale])
+                    if source not in sources:
+                        # Looked up in df, then in self.result
+                        sources[source] = self.get_data(df, source)
+                    splice_index = splice_index.union(sources[source].index)
+                splice_indexes[target] = splice_index
+
+            years = pd.Index([])
+            for series in sources.values():
+                years = years.union(series.index)
+            values = np.full((len(table.sources), len(years)), np.nan)
+            for source, series in sources.items():
+                values[table.sources.index(source)] = series.reindex(years).values
+            sums = table.evaluate(targets, values, factors=factors)
+
+            for target, data in zip(targets, sums):
+                splice_series = pd.Series(data, index=years).reindex(splice_indexes[target])
+                self._splice_sum(splicer, target, splice_series, ameco_h_df, splice, target in ratio_spliced)
+
+    def _splice_sum(self, splicer, variable, splice_series, ameco_h_df, splice, ratio_spliced):
+        base_series = self.get_data(ameco_h_df, variable) if self.has_data(ameco_h_df, variable) else None
+        if base_series is None or splice is False:
+            series_data = splice_series
+        else:
+            series_data = splicer.butt_splice(base_series, splice_series, kind='forward')
+        if ratio_spliced:
+            if variable == 'URTG.1.0.0.0':
+                splice_series = self.get_data(self.result, 'UUTG.1.0.0.0') + self.get_data(self.result, 'UBLG.1.0.0.0')
+            series_data = splicer.ratio_splice(base_series, splice_series, kind='forward')
+        self.result.add(self.get_meta(variable), series_data)
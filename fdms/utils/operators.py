@@ -1,9 +1,11 @@
 import logging
 
+import numpy as np
 import pandas as pd
 import re
 
 from fdms.utils.splicer import Splicer
+from fdms.utils import transforms
 
 
 logger = logging.getLogger(__name__)
@@ -14,7 +16,10 @@ logging.basicConfig(filename='error.log',
 
 class Operators:
     '''
-    Merge, Iin, PCH
+    Merge, Iin, PCH, Rebase
+
+    The *_block versions work on whole variables x years DataFrames (a variable group at once), column by column
+     with numpy, and give the same results as the series versions row by row.
     '''
     def merge(self, dataframe):
         '''
@@ -49,3 +54,50 @@ class Operators:
         new_series = pd.Series({base_period: 100})
         splicer = Splicer()
         return splicer.ratio_splice(new_series, series, kind='both')
+
+    def merge_block(self, dataframes):
+        '''
+        Merges the rows of the DataFrames with the same label, taking the first not null value in the order of the
+         list, like merge on the DataFrame of the series of every row.
+
+        :param dataframes: Required. Variables x years DataFrames (None for a missing source), the result has the rows
+         and years of the first one.
+        :rtype: pandas.core.frame.DataFrame
+        '''
+        first = dataframes[0]
+        result = first.values.astype(float)
+        for dataframe in dataframes[1:]:
+            if dataframe is None:
+                continue
+            values = dataframe.reindex(index=first.index, columns=first.columns).values.astype(float)
+            result = np.where(np.isnan(result), values, result)
+        return pd.DataFrame(result, index=first.index, columns=first.columns)
+
+    def iin_block(self, dataframe, value_if_null, value_if_not_null=None):
+        '''
+        Iin on every value of a variables x years DataFrame, the values can be scalars or DataFrames like it.
+        '''
+        values = dataframe.values.astype(float)
+        if value_if_not_null is None:
+            value_if_not_null = values
+        elif isinstance(value_if_not_null, pd.DataFrame):
+            value_if_not_null = value_if_not_null.reindex_like(dataframe).values
+        if isinstance(value_if_null, pd.DataFrame):
+            value_if_null = value_if_null.reindex_like(dataframe).values
+        result = np.where(np.isnan(values), value_if_null, value_if_not_null)
+        return pd.DataFrame(result, index=dataframe.index, columns=dataframe.columns)
+
+    def pch_block(self, dataframe):
+        '''
+        Percent change of every row of a variables x years DataFrame, missing values take the one of the year before
+        '''
+        return pd.DataFrame(transforms.pch(dataframe.values.astype(float)), index=dataframe.index,
+                            columns=dataframe.columns)
+
+    def rebase_block(self, dataframe, base_period):
+        '''
+        Every row of a variables x years DataFrame divided by its base_period value, times 100. The rows are null
+         before their first and after their last value, rows without base_period value are rebased like rebase does.
+        '''
+        return pd.DataFrame(transforms.rebase(dataframe.values.astype(float), dataframe.columns, base_period),
+                            index=dataframe.index, columns=dataframe.columns)
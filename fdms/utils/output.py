@@ -0,0 +1,201 @@
+'''
+Output files of a computation.
+
+The steps hand their results to an OutputWriter (StepMixin.export_result), which keeps them in memory as SeriesBlocks
+and writes them all at once with OutputWriter.flush, or as they come in a background thread. Per step dumps can be
+turned off, and every result can be written in several formats:
+
+    - `xlsx`: one sheet, written row by row with xlsxwriter's constant memory mode.
+    - `csv`: the same columns as the workbook.
+    - `npz`: float64 matrix of series x years (`values`) and the metadata columns and years as JSON (`meta`).
+
+Every result also gets a text file with its variable codes. The defaults come from the DMS_DUMP_STEPS,
+DMS_OUTPUT_FORMATS and DMS_OUTPUT_BACKGROUND environment variables (see fdms.config).
+'''
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(filename='error.log',
+                    format='{%(pathname)s:%(lineno)d} - %(asctime)s %(module)s %(levelname)s: %(message)s',
+                    level=logging.INFO)
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from fdms.config import COLUMN_ORDER, DUMP_STEPS, OUTPUT_BACKGROUND, OUTPUT_DIR, OUTPUT_FORMATS
+from fdms.utils.block import SeriesBlock, as_block
+
+FORMATS = ['xlsx', 'csv', 'npz']
+
+
+def get_step_filename(step, country, extension, output_dir=OUTPUT_DIR):
+    '''i.e. output/BE/output1.xlsx, output/BE/outputvars1.txt for extension='txt' '''
+    name = 'outputvars{}.txt' if extension == 'txt' else 'output{}.' + extension
+    return os.path.join(output_dir, country, name.format(step))
+
+
+def _makedirs(filename):
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+def _to_json_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    return None if value != value else value
+
+
+def write_vars(result, filename):
+    _makedirs(filename)
+    with open(filename, 'w') as f:
+        f.write('\n'.join(result.index.get_level_values('Variable Code').tolist()))
+
+
+def write_xlsx(result, filename, sheet_name='Sheet1', columns=COLUMN_ORDER):
+    '''
+    Writes the columns of result (dataframe or SeriesBlock) like DataFrame.to_excel(index=False) does with its index
+    reset, NaN are empty cells, but row by row so that xlsxwriter only keeps one row in memory
+    '''
+    _makedirs(filename)
+    block = as_block(result)
+    workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet(sheet_name)
+        header = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        for column, label in enumerate(columns):
+            worksheet.write(0, column, label, header)
+        for row, values in enumerate(zip(*[block.column_values(column) for column in columns]), 1):
+            for column, value in enumerate(values):
+                if isinstance(value, float):
+                    if value != value:
+                        continue
+                    if value in (np.inf, -np.inf):
+                        value = 'inf' if value > 0 else '-inf'
+                worksheet.write(row, column, value)
+    finally:
+        workbook.close()
+
+
+def write_csv(result, filename, columns=COLUMN_ORDER):
+    _makedirs(filename)
+    block = as_block(result)
+    frame = pd.DataFrame({column: block.column_values(column) for column in columns}, columns=columns)
+    frame.to_csv(filename, index=False)
+
+
+def write_npz(result, filename, columns=COLUMN_ORDER):
+    _makedirs(filename)
+    block = as_block(result)
+    years = [column for column in columns if not isinstance(column, str)]
+    meta = {'years': years, 'columns': {column: [_to_json_value(value) for value in block.column_values(column)]
+                                        for column in columns if isinstance(column, str)}}
+    values = block.values[:, [block.years.index(year) for year in years]]
+    with open(filename, 'wb') as f:
+        np.savez(f, values=values, meta=np.array(json.dumps(meta)))
+
+
+WRITERS = {'xlsx': write_xlsx, 'csv': write_csv, 'npz': write_npz}
+
+
+class OutputWriter:
+    '''
+    output_dir -- Directory of the step dumps, one subdirectory per country.
+    formats    -- Formats of the step dumps, see FORMATS.
+    dump_steps -- False to ignore the results of the steps.
+    background -- True to write the results in a thread as they are added, else they are written by flush.
+    '''
+    def __init__(self, output_dir=OUTPUT_DIR, formats=OUTPUT_FORMATS, dump_steps=DUMP_STEPS,
+                 background=OUTPUT_BACKGROUND):
+        unknown = [output_format for output_format in formats if output_format not in WRITERS]
+        if unknown:
+            raise ValueError('Unknown output formats {}'.format(', '.join(unknown)))
+        self.output_dir = output_dir
+        self.formats = list(formats)
+        self.dump_steps = dump_steps
+        self.background = background
+        self.pending = []
+        self.errors = []
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+
+    def add_step(self, result, step, country):
+        '''Keeps a copy of the result of a step, to be written as output/{country}/output{step}.{format}'''
+        if not self.dump_steps:
+            return
+        filenames = [(output_format, get_step_filename(step, country, output_format, self.output_dir))
+                     for output_format in self.formats]
+        self.add(result, filenames, vars_filename=get_step_filename(step, country, 'txt', self.output_dir))
+
+    def add(self, result, filenames, vars_filename=None):
+        '''
+        result    -- Dataframe or SeriesBlock, a copy is kept.
+        filenames -- list of (format, filename)
+        '''
+        if isinstance(result, SeriesBlock):
+            block = result.take(np.arange(len(result)))
+        else:
+            block = SeriesBlock.from_frame(result)
+        job = (block, filenames, vars_filename)
+        if not self.background:
+            with self._lock:
+                self.pending.append(job)
+            return
+        with self._lock:
+            if self._thread is None:
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name='OutputWriter', daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+
+    def _write(self, job):
+        result, filenames, vars_filename = job
+        try:
+            for output_format, filename in filenames:
+                WRITERS[output_format](result, filename)
+            if vars_filename is not None:
+                write_vars(result, vars_filename)
+        except Exception as e:
+            logger.error('Failed to write {}: {}'.format(', '.join(name for _, name in filenames), e))
+            self.errors.append(e)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._write(job)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        '''Writes the pending results (waits for the background thread), raises the first error if any'''
+        with self._lock:
+            pending, self.pending = self.pending, []
+        for job in pending:
+            self._write(job)
+        if self._queue is not None:
+            self._queue.join()
+        errors, self.errors = self.errors, []
+        if errors:
+            raise errors[0]
+
+
+_output_writer = None
+_output_writer_lock = threading.Lock()
+
+
+def get_output_writer():
+    '''OutputWriter used by the steps by default, flushed at exit'''
+    global _output_writer
+    with _output_writer_lock:
+        if _output_writer is None:
+            _output_writer = OutputWriter()
+            atexit.register(_output_writer.flush)
+    return _output_writer
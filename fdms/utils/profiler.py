@@ -0,0 +1,174 @@
+'''
+Opt-in profiler of the computations, set DMS_PROFILE=1 (or call enable, run_batch.py --profile) to turn it on.
+
+It records the wall time and peak memory of every step (step) and the call count and cumulative time of the
+functions decorated with profiled: StepMixin.get_data and apply_scale, the Splicer methods, export_to_excel and the
+readers of fdms.utils.interfaces. write(name) saves what was recorded since the last write in PROFILE_DIR:
+
+    - {name}.json: summary, {'steps': {step: {count, wall_time, peak_memory}}, 'calls': {function: {count, time}}};
+    - {name}.trace.json: every step and call as a Chrome trace event (chrome://tracing, Perfetto).
+
+Times are in seconds in the summary and in microseconds in the trace, memory in bytes. The peak memory of a step is
+the one of the Python and numpy allocations (tracemalloc) made while it runs, it's only right when no other step runs
+in the same process: Compute runs its steps one after the other while profiling instead of on a thread pool. The
+processes of a process pool record what they run too, collect returns it to be merged in the main process (merge,
+see Scheduler.run). tracemalloc slows the allocations down, compare the times of profiled runs with each other. Turned
+off, a profiled function costs one flag check per call.
+'''
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from fdms.config import PROFILE, PROFILE_DIR
+
+_LOCK = threading.Lock()
+_ORIGIN = time.perf_counter()
+_enabled = False
+_events = []
+_steps = collections.OrderedDict()
+_calls = collections.OrderedDict()
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable():
+    '''Turns profiling on, in the processes started from now on too'''
+    global _enabled
+    _enabled = True
+    os.environ['DMS_PROFILE'] = '1'
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    '''Turns profiling off and drops what was recorded'''
+    global _enabled
+    _enabled = False
+    os.environ.pop('DMS_PROFILE', None)
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    with _LOCK:
+        _clear()
+
+
+def _clear():
+    del _events[:]
+    _steps.clear()
+    _calls.clear()
+
+
+def _add(event):
+    '''Records event, _LOCK held'''
+    _events.append(event)
+    duration = event['dur'] / 1e6
+    if event['cat'] == 'step':
+        step = _steps.setdefault(event['name'], {'count': 0, 'wall_time': 0.0, 'peak_memory': 0})
+        step['count'] += 1
+        step['wall_time'] += duration
+        step['peak_memory'] = max(step['peak_memory'], event['args']['peak_memory'])
+    else:
+        calls = _calls.setdefault(event['name'], {'count': 0, 'time': 0.0})
+        calls['count'] += 1
+        calls['time'] += duration
+
+
+def _record(name, category, start, end, args=None):
+    event = {'name': name, 'cat': category, 'ph': 'X', 'ts': (start - _ORIGIN) * 1e6, 'dur': (end - start) * 1e6,
+             'pid': os.getpid(), 'tid': threading.get_ident()}
+    if args:
+        event['args'] = args
+    with _LOCK:
+        _add(event)
+
+
+def collect():
+    '''
+    Takes the events this process recorded since the last write or collect, to be merged in the process it runs for.
+    A forked process starts with a copy of the events of its parent, they are dropped.
+    '''
+    with _LOCK:
+        events = [event for event in _events if event['pid'] == os.getpid()]
+        _clear()
+    return events
+
+
+def merge(events):
+    '''Records the events another process collected'''
+    with _LOCK:
+        for event in events:
+            _add(event)
+
+
+def profiled(name=None):
+    '''Decorator recording the calls of the function as name, its qualified name by default'''
+    def decorator(function):
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _record(label, 'call', start, time.perf_counter())
+        return wrapper
+    return decorator
+
+
+def _reset_peak():
+    '''Resets the peak of the traced memory, returns the traced memory the new peak is relative to'''
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+    # Before Python 3.9 the peak is only reset with the traces
+    tracemalloc.clear_traces()
+    return 0
+
+
+@contextlib.contextmanager
+def step(name):
+    '''Records the wall time and peak memory of the block as the step name'''
+    if not _enabled:
+        yield
+        return
+    memory = _reset_peak() if tracemalloc.is_tracing() else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        peak = tracemalloc.get_traced_memory()[1] - memory if memory is not None else 0
+        _record(name, 'step', start, end, {'peak_memory': peak})
+
+
+def write(name, profile_dir=PROFILE_DIR):
+    '''
+    Writes what was recorded since the last write as {name}.json and {name}.trace.json in profile_dir, returns the
+    summary (None when profiling is off)
+    '''
+    if not _enabled:
+        return None
+    with _LOCK:
+        summary = {'name': name, 'pid': os.getpid(), 'steps': collections.OrderedDict(_steps),
+                   'calls': collections.OrderedDict(sorted(_calls.items(), key=lambda item: -item[1]['time']))}
+        events = list(_events)
+        _clear()
+    os.makedirs(profile_dir, exist_ok=True)
+    with open(os.path.join(profile_dir, '{}.json'.format(name)), 'w') as f:
+        json.dump(summary, f, indent=2)
+    with open(os.path.join(profile_dir, '{}.trace.json'.format(name)), 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return summary
+
+
+if PROFILE:
+    enable()
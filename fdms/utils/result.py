@@ -0,0 +1,161 @@
+'''
+Accumulator for the series computed by a step.
+
+The year values of every series are kept in a float64 matrix that doubles its size when it's full, the metadata
+(country, variable code, frequency, scale...) in one list per column, and a dict maps (country, variable code) to the
+last row added for it. The rows are handed over once, as a SeriesBlock (ResultBuilder.to_block) or as the
+(Country Ameco, Variable Code) indexed dataframe the steps return (ResultBuilder.to_frame).
+'''
+import numpy as np
+import pandas as pd
+
+from fdms.config import COLUMN_ORDER
+from fdms.utils.block import SeriesBlock
+
+KEY_COLUMNS = ['Country Ameco', 'Variable Code']
+
+
+def _sorted_labels(labels):
+    # New columns are added sorted, years first, like DataFrame.append(sort=True) does
+    return sorted(labels, key=lambda label: (isinstance(label, str), str(label)))
+
+
+class ResultBuilder:
+    '''Rows of a step result, see the module docstring'''
+    def __init__(self, columns=COLUMN_ORDER, capacity=64):
+        self.columns = []
+        self.meta = {}
+        self.years = []
+        self._year_positions = {}
+        self._values = np.full((capacity, max(len(columns), 8)), np.nan)
+        self._index = {}
+        self._length = 0
+        self._add_columns(list(columns), meta=[column for column in columns if isinstance(column, str)])
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def _add_columns(self, labels, meta=()):
+        for label in labels:
+            if label in self.meta or label in self._year_positions:
+                continue
+            self.columns.append(label)
+            if label in meta:
+                self.meta[label] = [np.nan] * self._length
+            else:
+                self._year_positions[label] = len(self.years)
+                self.years.append(label)
+        if len(self.years) > self._values.shape[1]:
+            values = np.full((self._values.shape[0], 2 * len(self.years)), np.nan)
+            values[:, :self._values.shape[1]] = self._values
+            self._values = values
+
+    def _new_row(self):
+        if self._length == self._values.shape[0]:
+            values = np.full((2 * self._values.shape[0], self._values.shape[1]), np.nan)
+            values[:self._length] = self._values[:self._length]
+            self._values = values
+        self._length += 1
+        return self._length - 1
+
+    def _set_meta(self, position, meta):
+        self._add_columns(_sorted_labels([label for label in meta if label not in self.meta]), meta=list(meta))
+        for label, column in self.meta.items():
+            value = meta.get(label, np.nan)
+            if position == len(column):
+                column.append(value)
+            else:
+                column[position] = value
+
+    def _set_values(self, position, data, add_columns=True):
+        self._values[position, :len(self.years)] = np.nan
+        if data is None or len(data) == 0:
+            return
+        if add_columns:
+            self._add_columns(_sorted_labels([label for label in data.index if label not in self._year_positions]))
+        values = data.values if data.dtype != object else pd.to_numeric(data, errors='coerce').values
+        for label, value in zip(data.index, values):
+            column = self._year_positions.get(label)
+            if column is not None:
+                self._values[position, column] = value
+
+    def add(self, meta, data):
+        '''Adds a row, meta is a dict with (at least) Country Ameco and Variable Code and data a pd.Series by year'''
+        position = self._new_row()
+        self._set_meta(position, meta)
+        self._set_values(position, data)
+        self._index[(meta['Country Ameco'], meta['Variable Code'])] = position
+
+    def add_rows(self, metas, values, years):
+        '''
+        Adds a row for every dict of metas (like add), values is the float64 matrix of rows x years. The rows are
+        copied at once, like the series of add they add the years that are not columns yet.
+        '''
+        self._add_columns(_sorted_labels([year for year in years if year not in self._year_positions]))
+        columns = [self._year_positions[year] for year in years]
+        for meta in metas:
+            position = self._new_row()
+            self._set_meta(position, meta)
+            self._values[position, :len(self.years)] = np.nan
+            self._index[(meta['Country Ameco'], meta['Variable Code'])] = position
+        start = self._length - len(metas)
+        self._values[start:self._length, columns] = values
+
+    def replace(self, position, meta, data):
+        '''Replaces the row at position (as returned by find), years that are not columns yet are ignored'''
+        old_key = (self.meta['Country Ameco'][position], self.meta['Variable Code'][position])
+        self._set_meta(position, meta)
+        self._set_values(position, data, add_columns=False)
+        key = (meta['Country Ameco'], meta['Variable Code'])
+        if key != old_key:
+            self._reindex(old_key)
+            self._reindex(key)
+
+    def update(self, meta, data):
+        '''Replaces the last row of the series'''
+        position = self.find(meta['Country Ameco'], meta['Variable Code'])
+        if position is None:
+            raise KeyError((meta['Country Ameco'], meta['Variable Code']))
+        self.replace(position, meta, data)
+
+    def _reindex(self, key):
+        positions = [position for position, row_key in enumerate(zip(self.meta['Country Ameco'],
+                                                                      self.meta['Variable Code'])) if row_key == key]
+        if positions:
+            self._index[key] = positions[-1]
+        else:
+            self._index.pop(key, None)
+
+    def set_value(self, country, variable, year, value):
+        position = self.find(country, variable)
+        if position is None:
+            raise KeyError((country, variable))
+        self._add_columns([year])
+        self._values[position, self._year_positions[year]] = value
+
+    def find(self, country, variable):
+        '''Returns the row position of the series or None'''
+        return self._index.get((country, variable))
+
+    def get(self, country, variable):
+        '''Returns the year values of the series as a new pd.Series, raises KeyError if it's missing'''
+        position = self.find(country, variable)
+        if position is None:
+            raise KeyError((country, variable))
+        return pd.Series(self._values[position, :len(self.years)].copy(), index=pd.Index(self.years, dtype=object),
+                         name=position)
+
+    def to_block(self):
+        '''Returns the rows as a SeriesBlock'''
+        meta = pd.DataFrame({label: column for label, column in self.meta.items() if label not in KEY_COLUMNS},
+                            columns=[label for label in self.meta if label not in KEY_COLUMNS])
+        return SeriesBlock(self.meta['Country Ameco'], self.meta['Variable Code'],
+                           self._values[:self._length, :len(self.years)], self.years, meta=meta,
+                           columns=[column for column in self.columns if column not in KEY_COLUMNS])
+
+    def to_frame(self):
+        '''Returns the rows as a dataframe indexed by (Country Ameco, Variable Code)'''
+        return self.to_block().to_frame()
@@ -1,54 +1,43 @@
 import pandas as pd
-import os
 import re
 
-from fdms.config import VARS_FILENAME, EXCEL_FILENAME, COLUMN_ORDER, PROJECT_ROOT
+from fdms.config import VARS_FILENAME, EXCEL_FILENAME, COLUMN_ORDER
 from fdms.config.country_groups import ALL_COUNTRIES
+from fdms.utils.block import SeriesBlock, as_block
+from fdms.utils.output import get_step_filename, write_vars, write_xlsx
+from fdms.utils.profiler import profiled
 
 
 def get_filenames_for_step(step, country):
-    return os.path.join(PROJECT_ROOT, 'output\\{}\\outputvars{}.txt'.format(country, step)), os.path.join(
-        PROJECT_ROOT, 'output\\{}\\output{}.xlsx'.format(country, step))
+    return get_step_filename(step, country, 'txt'), get_step_filename(step, country, 'xlsx')
 
 
+@profiled()
 def export_to_excel(result, vars_filename=VARS_FILENAME, excel_filename=EXCEL_FILENAME, step=None, sheet_name='Sheet1',
                     country='BE'):
     if step is not None:
         vars_filename, excel_filename = get_filenames_for_step(step, country)
-    column_order = COLUMN_ORDER
-    export_data = result.copy()
-    export_data = export_data.reset_index()
-    writer = pd.ExcelWriter(excel_filename, engine='xlsxwriter')
-    export_data[column_order].to_excel(writer, index_label=[('Country Ameco', 'Variable Code')],
-                                       sheet_name=sheet_name, index=False)
-    result_vars = result.index.get_level_values('Variable Code').tolist()
-    # We shouldn't need this line
-    output_dir = os.path.join(PROJECT_ROOT, 'output\\{}'.format(country))
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    assert(os.path.exists(output_dir))
-    with open(vars_filename, 'w') as f:
-        f.write('\n'.join(result_vars))
+    write_xlsx(result, excel_filename, sheet_name=sheet_name)
+    write_vars(result, vars_filename)
 
 
 def report_diff(result, expected, diff=None, diff_series=None, country=None, excel_filename='output/outputdiff.xlsx'):
+    '''
+    Writes result, expected and where they are equal (or both NaN) to excel_filename. result and expected are
+    dataframes or SeriesBlocks with the same series, the values are compared on the float64 matrices of their blocks.
+    '''
     column_order = COLUMN_ORDER
     # TODO: Fix all scales
     # column_order.remove('Scale')
-    diff = (expected == result) | (expected != expected) & (result != result)
-    result = result.reset_index()
+    result, expected = as_block(result), as_block(expected)
+    diff = result.compare(expected)
     if country in ALL_COUNTRIES:
         excel_filename = 'output/{}/outputdiff.xlsx'.format(country)
     writer = pd.ExcelWriter(excel_filename, engine='xlsxwriter')
-    result[column_order].to_excel(writer, index_label=[('Country Ameco', 'Variable Code')], sheet_name='result',
-                                  index=False)
-    expected = expected.reset_index()
-    expected[column_order].to_excel(writer, index_label=[('Country Ameco', 'Variable Code')], sheet_name='expected',
-                                    index=False)
-    diff_series = diff.all(axis=1)
-    diff = diff.reset_index()
-    diff[column_order].to_excel(writer, index_label=[('Country Ameco', 'Variable Code')], sheet_name='diff',
-                                index=False)
+    for sheet_name, frame in [('result', result.to_frame()), ('expected', expected.to_frame()), ('diff', diff)]:
+        frame = frame.reset_index()
+        frame[column_order].to_excel(writer, index_label=[('Country Ameco', 'Variable Code')], sheet_name=sheet_name,
+                                     index=False)
     # if diff_series:
     #     diff_series = diff_series.reset_index()
     #     diff_series.to_excel(writer, sheet_name='diff_series', index=False)
@@ -56,10 +45,24 @@ def report_diff(result, expected, diff=None, diff_series=None, country=None, exc
 
 
 def remove_duplicates(result):
-    result = result.reset_index()
-    result.drop_duplicates(['Country Ameco', 'Variable Code'], keep='last', inplace=True)
-    result = result.set_index(['Country Ameco', 'Variable Code'])
-    return result
+    '''Keeps the last row of every (Country Ameco, Variable Code), result is a dataframe or a SeriesBlock'''
+    if isinstance(result, SeriesBlock):
+        return result.drop_duplicates(keep='last')
+    return result.loc[~result.index.duplicated(keep='last')]
+
+
+def changed_variables(old, new):
+    '''
+    Variable codes of the rows that differ (NaN equals NaN) between the dataframes old and new, None if they don't
+    have the same rows in the same order or the same columns: the series added, removed or moved change the result
+    of the steps going through all the rows.
+    '''
+    if not old.index.equals(new.index) or not old.columns.equals(new.columns):
+        return None
+    if old.equals(new):
+        return set()
+    equal = ((old == new) | (old.isnull() & new.isnull())).all(axis=1)
+    return set(new.index[~equal.values].get_level_values('Variable Code'))
 
 
 def get_input_series(country_excel='fdms/sample_data/IT_DB_orig.xlsx', sheet_name='A1996'):
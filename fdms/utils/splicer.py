@@ -5,8 +5,11 @@ logging.basicConfig(filename='error.log',
                     format='{%(pathname)s:%(lineno)d} - %(asctime)s %(module)s %(levelname)s: %(message)s',
                     level=logging.INFO)
 
+import numpy as np
 import pandas as pd
 
+from fdms.utils.profiler import profiled
+
 
 class Splicer:
     '''
@@ -53,6 +56,7 @@ class Splicer:
             return stripped_base, stripped_splice, stripped_splice.index.get_loc(stripped_base.index[0])
         return None, None, None
 
+    @profiled()
     def butt_splice(self, base_series, splice_series, kind='forward', period=None):
         '''
         BUTTSPLICE extends the base series by taking the values directly from the splice series.
@@ -90,10 +94,10 @@ class Splicer:
         if kind == 'backward' or kind == 'both':
             stripped_base, stripped_splice, greater_splice_loc = self._strip_and_get_backward_splice_boundaries(
                 base_series, splice_series)
-            stripped_result = stripped_base
-            if result is not None:
-                stripped_result = result.iloc[result.index.get_loc(stripped_base.index[0]):]
             if greater_splice_loc is not None:
+                stripped_result = stripped_base
+                if result is not None:
+                    stripped_result = result.iloc[result.index.get_loc(stripped_base.index[0]):]
                 result = pd.concat([splice_series.iloc[:splice_series.index.get_loc(stripped_splice.index[5])],
                                     stripped_result], sort=True)
                 result.name = name
@@ -107,6 +111,7 @@ class Splicer:
 
         return result
 
+    @profiled()
     def ratio_splice(self, base_series, splice_series, kind='forward', variable=None, period=None, bp=False):
         '''
         RATIOSPLICE extends the base series by taking the period-over-period ratio (percent change) in the splice
@@ -125,8 +130,8 @@ class Splicer:
                 pct_change = stripped_splice.iloc[start_splice_loc - 1:].pct_change()[1:]
                 new_data = pct_change[1:].copy()
                 new_data.iloc[0] = float(stripped_base.iloc[-1]) * (new_data.iloc[0] + 1)
-                for index, item in list(pct_change.iteritems())[2:]:
-                    new_data.loc[index] = new_data.loc[index - 1] * (item + 1)
+                # new_data[year] = new_data[year - 1] * (pct_change[year] + 1)
+                new_data[:] = np.multiply.accumulate(np.append(new_data.iloc[0], pct_change.values[2:] + 1))
                 result = pd.concat([stripped_base, new_data, splice_series.iloc[splice_series.index.get_loc(
                     stripped_splice.index[-1]) + 1:]], sort=True)
                 result.name = name
@@ -142,15 +147,15 @@ class Splicer:
         if kind == 'backward' or kind == 'both':
             stripped_base, stripped_splice, greater_splice_loc = self._strip_and_get_backward_splice_boundaries(
                 base_series, splice_series)
-            stripped_result = stripped_base
-            if result is not None:
-                stripped_result = result.iloc[result.index.get_loc(stripped_base.index[0]):]
             if greater_splice_loc is not None:
+                stripped_result = stripped_base
+                if result is not None:
+                    stripped_result = result.iloc[result.index.get_loc(stripped_base.index[0]):]
                 pct_change = stripped_splice.iloc[:greater_splice_loc + 2].pct_change()[:-1]
                 new_data = pct_change[:-1].copy()
                 new_data.iloc[-1] = stripped_base.iloc[0] / (pct_change.iloc[-1] + 1)
-                for index, item in list(reversed(list(pct_change.iteritems())))[1:-1]:
-                    new_data.loc[index - 1] = new_data.loc[index] / (item + 1)
+                # new_data[year - 1] = new_data[year] / (pct_change[year] + 1)
+                new_data[:] = np.divide.accumulate(np.append(new_data.iloc[-1], pct_change.values[-2:0:-1] + 1))[::-1]
                 result = pd.concat([splice_series.iloc[:splice_series.index.get_loc(
                     stripped_splice.index[0])], new_data, stripped_result], sort=True)
                 result.name = name
@@ -165,6 +170,7 @@ class Splicer:
 
         return result
 
+    @profiled()
     def level_splice(self, base_series, splice_series, kind='forward', period=None):
         '''
         LEVELSPLICE extends the base series by taking the period-over-period difference in the splice series, and
@@ -184,8 +190,8 @@ class Splicer:
                         start_splice_loc - 1:] - stripped_splice.iloc[start_splice_loc - 1:].shift(1))[1:]
                 new_data = diff[1:].copy()
                 new_data.iloc[0] = stripped_base.iloc[-1] + new_data.iloc[0]
-                for index, item in list(diff.iteritems())[2:]:
-                    new_data.loc[index] = new_data.loc[index - 1] + item
+                # new_data[year] = new_data[year - 1] + diff[year]
+                new_data[:] = np.add.accumulate(np.append(new_data.iloc[0], diff.values[2:]))
                 result = pd.concat([stripped_base, new_data, splice_series.iloc[splice_series.index.get_loc(
                     stripped_splice.index[-1]) + 1:]], sort=True)
                 result.name = name
@@ -199,16 +205,16 @@ class Splicer:
         if kind == 'backward' or kind == 'both':
             stripped_base, stripped_splice, greater_splice_loc = self._strip_and_get_backward_splice_boundaries(
                 base_series, splice_series)
-            stripped_result = stripped_base
-            if result is not None:
-                stripped_result = result.iloc[result.index.get_loc(stripped_base.index[0]):]
             if greater_splice_loc is not None:
+                stripped_result = stripped_base
+                if result is not None:
+                    stripped_result = result.iloc[result.index.get_loc(stripped_base.index[0]):]
                 diff = (stripped_splice.iloc[
                         :greater_splice_loc + 2] - stripped_splice.iloc[:greater_splice_loc + 2].shift(1))[:-1]
                 new_data = diff[:-1].copy()
                 new_data.iloc[-1] = stripped_base.iloc[0] - diff.iloc[-1]
-                for index, item in list(reversed(list(diff.iteritems())))[1:-1]:
-                    new_data.loc[index - 1] = new_data.loc[index] - item
+                # new_data[year - 1] = new_data[year] - diff[year]
+                new_data[:] = np.subtract.accumulate(np.append(new_data.iloc[-1], diff.values[-2:0:-1]))[::-1]
                 result = pd.concat([splice_series.iloc[:splice_series.index.get_loc(
                     stripped_splice.index[0])], new_data, stripped_result], sort=True)
                 result.name = name
@@ -221,6 +227,7 @@ class Splicer:
 
         return result
 
+    @profiled()
     def splice_and_level_forward(self, base_series, splice_series, kind='forward', variable=None, scales=None):
         '''
         SPLICE_AND_LEVEL performs the operation RatioSplice(base, level(series)) = base * (1 + 0,01 * series)
@@ -239,8 +246,9 @@ class Splicer:
             if start_splice_loc is not None:
                 new_data = stripped_splice.iloc[start_splice_loc - 1:][1:].copy()
                 new_data.iloc[0] = stripped_base.iloc[-1]
-                for index, item in list(new_data.iteritems())[1:]:
-                    new_data.loc[index] = float(new_data.loc[index - 1]) * (1 + 0.01 * float(item))
+                # new_data[year] = new_data[year - 1] * (1 + 0.01 * new_data[year])
+                new_data[:] = np.multiply.accumulate(np.append(float(new_data.iloc[0]), 1 + 0.01 * new_data.values[
+                    1:].astype(float)))
                 result = pd.concat([stripped_base, new_data[1:]], sort=True)
                 result.name = name
             else:
@@ -251,3 +259,121 @@ class Splicer:
                     variable, country))
 
         return result
+
+    @profiled()
+    def splice_block(self, base_df, splice_df, method='ratio', kind='forward'):
+        '''
+        Splices every row of base_df with the same row of splice_df, the block version of butt_splice, ratio_splice
+         and level_splice.
+
+        :param base_df: Required. Variables x years, the year columns in ascending order.
+        :type base_df: pandas.core.frame.DataFrame
+        :param splice_df: Required. Reindexed like base_df.
+        :type splice_df: pandas.core.frame.DataFrame
+        :param str method: Optional. "butt", "ratio" or "level". Default = "ratio".
+        :param str kind: Optional. "forward", "backward" or "both". Default = "forward".
+        :rtype: pandas.core.frame.DataFrame
+
+        The splice boundaries of all the rows are found at once and the splices computed with one operation per year
+         for all the rows. Rows the per-series method handles as a special case (empty rows, splices that fail or
+         that start at the first year...) are spliced with the per-series method, a None result is a row of NaN.
+        '''
+        functions = {'butt': self.butt_splice, 'ratio': self.ratio_splice, 'level': self.level_splice}
+        if method not in functions:
+            raise ValueError('Unknown splice method {}'.format(method))
+        if kind not in ['forward', 'backward', 'both']:
+            raise ValueError('Unknown splice kind {}'.format(kind))
+        splice_df = splice_df.reindex(index=base_df.index, columns=base_df.columns)
+        base, splice = base_df.values.astype(float), splice_df.values.astype(float)
+        result = base.copy()
+        base_first, base_last = self._valid_boundaries(base)
+        splice_first, splice_last = self._valid_boundaries(splice)
+        regular = ~np.isnan(base).all(axis=1) & ~np.isnan(splice).all(axis=1)
+        if kind in ['forward', 'both']:
+            regular &= base_last < splice_last
+            if method != 'butt':
+                regular &= base_last > 0
+        if kind in ['backward', 'both']:
+            regular &= base_first > splice_first
+            if method == 'butt':
+                # butt_splice takes the splice series up to its 6th value (and not to the start of the base series)
+                regular &= splice_first + 5 <= base_first
+            else:
+                regular &= base_first < base.shape[1] - 1
+        rows = np.flatnonzero(regular)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if kind in ['forward', 'both']:
+                result[rows] = self._splice_block_forward(method, base[rows], splice[rows], base_last[rows],
+                                                          splice_last[rows])
+            if kind in ['backward', 'both']:
+                result[rows] = self._splice_block_backward(method, base[rows], result[rows], splice[rows],
+                                                           base_first[rows], splice_first[rows])
+        for row in np.flatnonzero(~regular):
+            series = functions[method](base_df.iloc[row], splice_df.iloc[row], kind=kind)
+            if series is None:
+                result[row] = np.nan
+            else:
+                # Like ResultBuilder, the last value of a year wins
+                series = series[~series.index.duplicated(keep='last')]
+                result[row] = pd.to_numeric(series.reindex(base_df.columns), errors='coerce').values
+        return pd.DataFrame(result, index=base_df.index, columns=base_df.columns)
+
+    def _valid_boundaries(self, values):
+        '''
+        :return: tuple(first valid positions, last valid positions), the first and last columns for empty rows
+        '''
+        valid = ~np.isnan(values)
+        first = valid.argmax(axis=1)
+        last = values.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+        empty = ~valid.any(axis=1)
+        first[empty], last[empty] = 0, values.shape[1] - 1
+        return first, last
+
+    def _splice_steps(self, method, splice, start):
+        '''
+        Period over period changes of the splice rows from the positions in start, pct_change pads the missing
+         values like ratio_splice does
+        '''
+        columns = np.arange(splice.shape[1])
+        if method == 'ratio':
+            splice = np.where(columns >= start[:, None], splice, np.nan)
+            last_valid = np.maximum.accumulate(np.where(np.isnan(splice), 0, columns), axis=1)
+            splice = splice[np.arange(splice.shape[0])[:, None], last_valid]
+            steps = np.full(splice.shape, np.nan)
+            # (pct_change + 1), rounded the same way
+            steps[:, 1:] = splice[:, 1:] / splice[:, :-1] - 1 + 1
+            return steps
+        steps = np.full(splice.shape, np.nan)
+        steps[:, 1:] = splice[:, 1:] - splice[:, :-1]
+        return steps
+
+    def _splice_block_forward(self, method, base, splice, base_last, splice_last):
+        columns = np.arange(base.shape[1])
+        if method == 'butt':
+            return np.where(columns <= base_last[:, None], base, splice)
+        steps = self._splice_steps(method, splice, base_last - 1)
+        operation = np.multiply if method == 'ratio' else np.add
+        last_values = base[np.arange(base.shape[0]), base_last]
+        new_data = np.full(base.shape, np.nan)
+        for column in columns[1:]:
+            # new_data[year] = new_data[year - 1] * (pct_change[year] + 1) or new_data[year - 1] + diff[year]
+            new_data[:, column] = operation(np.where(column == base_last + 1, last_values, new_data[:, column - 1]),
+                                            steps[:, column])
+        return np.where(columns <= base_last[:, None], base,
+                        np.where(columns <= splice_last[:, None], new_data, splice))
+
+    def _splice_block_backward(self, method, base, result, splice, base_first, splice_first):
+        columns = np.arange(base.shape[1])
+        if method == 'butt':
+            return np.where(columns < splice_first[:, None] + 5, splice,
+                            np.where(columns >= base_first[:, None], result, np.nan))
+        steps = self._splice_steps(method, splice, splice_first)
+        operation = np.divide if method == 'ratio' else np.subtract
+        first_values = base[np.arange(base.shape[0]), base_first]
+        new_data = np.full(base.shape, np.nan)
+        for column in columns[:0:-1]:
+            # new_data[year - 1] = new_data[year] / (pct_change[year] + 1) or new_data[year] - diff[year]
+            new_data[:, column - 1] = operation(np.where(column == base_first, first_values, new_data[:, column]),
+                                                steps[:, column])
+        return np.where(columns < splice_first[:, None], splice,
+                        np.where(columns < base_first[:, None], new_data, result))
@@ -0,0 +1,189 @@
+'''
+Binary store for the AMECO databases (`AMECO_H*.TXT` and `AMECO_DB_*.xlsx`).
+
+The store is built once from the original files and saved in `STORE_DIR` as:
+
+    - `{name}.{build}.npy`: float64 matrix of series x years, opened memory-mapped so that every process reading the
+      store shares the same pages. `build` is a new id for every build.
+    - `{name}.json`: the years, the (country, variable code) of every row, a small metadata table (unit, scale and
+      title), the mtime and size of the files it was built from and the name of its values file.
+
+The values are written first and the json replaces the previous one last, so the json always names values of the same
+build: a build that crashed in between leaves the previous store as it was. The values of the previous build are
+removed, the processes that opened them keep their mapping.
+
+AmecoStore can be passed to StepMixin.get_data as any other dataframe, and to years_frame. It's pickled as its name
+and directory: the processes it's handed to open the memory-mapped files again instead of getting a copy.
+'''
+import json
+import logging
+import os
+import re
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from fdms.config import AMECO, BASE_DIR, STORE_DIR
+from fdms.utils.interfaces import read_ameco_txt, read_ameco_db_xls
+
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(filename='error.log',
+                    format='{%(pathname)s:%(lineno)d} - %(asctime)s %(module)s %(levelname)s: %(message)s',
+                    level=logging.INFO)
+
+METADATA_COLUMNS = ['Unit', 'Scale', 'Title']
+
+
+def _read_source(filename):
+    '''Returns a (Country Ameco, Variable Code) indexed dataframe with the metadata columns and the year columns'''
+    match = re.match(r'^AMECO_DB_(.+)\.xlsx$', os.path.basename(filename))
+    if match:
+        df = read_ameco_db_xls(filename, sheet_name=match.group(1), all_data=True)
+        df['Unit'], df['Title'] = np.nan, np.nan
+    else:
+        df = read_ameco_txt(filename)
+        df = df.rename(columns={'Unit indication': 'Unit', 'Unit of the series': 'Scale'})
+    years = [c for c in df.columns if re.match('^[0-9]{4}$', str(c))]
+    return df[METADATA_COLUMNS + years]
+
+
+def _values_name(meta_filename):
+    '''Name of the values file of the store with the json meta_filename, None without a valid json'''
+    try:
+        with open(meta_filename) as f:
+            # {name}.npy for the stores built before the build ids
+            return json.load(f).get('values', os.path.basename(meta_filename)[:-len('.json')] + '.npy')
+    except (OSError, ValueError):
+        return None
+
+
+def _source_signature(filename):
+    stat = os.stat(filename)
+    return {'filename': os.path.abspath(filename), 'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+class AmecoStore:
+    '''
+    Read only view on a store built with AmecoStore.build. Lookups by (country, variable code) use a hash index and
+    return float64 series indexed by year.
+    '''
+    def __init__(self, name, store_dir=STORE_DIR):
+        self.name = name
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, name + '.json')) as f:
+            meta = json.load(f)
+        self.years = meta['years']
+        self.keys = [tuple(key) for key in meta['keys']]
+        self.sources = meta['sources']
+        self.metadata = pd.DataFrame(meta['metadata'], columns=METADATA_COLUMNS,
+                                     index=pd.MultiIndex.from_tuples(self.keys, names=['Country Ameco',
+                                                                                        'Variable Code']))
+        self.values = np.load(os.path.join(store_dir, meta['values']), mmap_mode='r')
+        if self.values.shape != (len(self.keys), len(self.years)):
+            raise ValueError('{} values for {} series and {} years'.format(self.values.shape, len(self.keys),
+                                                                          len(self.years)))
+        self.index = {key: row for row, key in enumerate(self.keys)}
+
+    @classmethod
+    def build(cls, name, filenames, store_dir=STORE_DIR):
+        '''
+        Build the store from AMECO_H*.TXT and AMECO_DB_*.xlsx files. When the same series is found in more than one
+        file, the first file wins.
+        '''
+        frames = [_read_source(filename) for filename in filenames]
+        years = sorted(set(c for df in frames for c in df.columns if c not in METADATA_COLUMNS))
+        keys, metadata, blocks, seen = [], [], [], set()
+        for df in frames:
+            df = df.loc[~df.index.duplicated(keep='last')]
+            df = df.loc[[key not in seen for key in df.index]]
+            seen.update(df.index)
+            keys.extend(df.index.tolist())
+            df_metadata = df[METADATA_COLUMNS].astype(object)
+            metadata.extend(df_metadata.where(df_metadata.notna(), None).values.tolist())
+            blocks.append(df.reindex(columns=years).values.astype(np.float64))
+        values = np.concatenate(blocks) if blocks else np.empty((0, len(years)))
+
+        os.makedirs(store_dir, exist_ok=True)
+        tmp_suffix = '.{}.tmp'.format(os.getpid())
+        values_name = '{}.{}.npy'.format(name, uuid.uuid4().hex)
+        values_filename = os.path.join(store_dir, values_name)
+        meta_filename = os.path.join(store_dir, name + '.json')
+        with open(values_filename + tmp_suffix, 'wb') as f:
+            np.save(f, values)
+        os.replace(values_filename + tmp_suffix, values_filename)
+        with open(meta_filename + tmp_suffix, 'w') as f:
+            json.dump({'years': years, 'keys': keys, 'metadata': metadata, 'values': values_name,
+                       'sources': [_source_signature(filename) for filename in filenames]}, f)
+        previous = _values_name(meta_filename)
+        os.replace(meta_filename + tmp_suffix, meta_filename)
+        if previous is not None and previous != values_name:
+            try:
+                os.remove(os.path.join(store_dir, previous))
+            except OSError:
+                pass
+        return cls(name, store_dir=store_dir)
+
+    @classmethod
+    def open(cls, name, filenames, store_dir=STORE_DIR):
+        '''Open the store, (re)building it first if it's missing or any of the files changed since it was built'''
+        try:
+            store = cls(name, store_dir=store_dir)
+        except (OSError, ValueError, KeyError) as e:
+            logger.info('Building AMECO store {} ({})'.format(name, e))
+            return cls.build(name, filenames, store_dir=store_dir)
+        if store.sources != [_source_signature(filename) for filename in filenames]:
+            logger.info('Rebuilding AMECO store {}, source files changed'.format(name))
+            return cls.build(name, filenames, store_dir=store_dir)
+        return store
+
+    def __getstate__(self):
+        return {'name': self.name, 'store_dir': self.store_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state['name'], store_dir=state['store_dir'])
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, country, variable):
+        '''Returns a copy of the series as pd.Series indexed by year, raises KeyError if the series is not stored'''
+        row = self.index[(country, variable)]
+        return pd.Series(np.array(self.values[row]), index=self.years, name=(country, variable))
+
+    def frame(self, keys, years):
+        '''keys x years float64 dataframe of the series with the keys, NaN rows for the keys the store doesn't have'''
+        values = np.full((len(keys), len(years)), np.nan)
+        rows = [(i, self.index[key]) for i, key in enumerate(keys) if key in self.index]
+        positions = {year: column for column, year in enumerate(self.years)}
+        columns = [(i, positions[year]) for i, year in enumerate(years) if year in positions]
+        if rows and columns:
+            values[np.ix_([i for i, _ in rows], [i for i, _ in columns])] = self.values[
+                np.ix_([row for _, row in rows], [column for _, column in columns])]
+        return pd.DataFrame(values, columns=years)
+
+    def get_metadata(self, country, variable):
+        return self.metadata.iloc[self.index[(country, variable)]].to_dict()
+
+    def to_frame(self, country=None):
+        '''Same layout as read_ameco_txt/read_ameco_db_xls, optionally for a single country'''
+        rows = range(len(self.keys)) if country is None else [
+            row for row, key in enumerate(self.keys) if key[0] == country]
+        df = pd.DataFrame(np.array(self.values[list(rows)]), columns=self.years,
+                          index=pd.MultiIndex.from_tuples([self.keys[row] for row in rows],
+                                                          names=['Country Ameco', 'Variable Code']))
+        return pd.concat([self.metadata.iloc[list(rows)], df], axis=1)
+
+
+def get_ameco_h_store(filenames=None):
+    return AmecoStore.open('ameco_h', filenames or [AMECO])
+
+
+def get_ameco_db_store(country):
+    '''Store of all the data of AMECO_DB_{country}.xlsx, like read_ameco_db_xls(all_data=True, country=country)'''
+    return AmecoStore.open('ameco_db_{}'.format(country),
+                           [os.path.join(BASE_DIR, 'sample_data/AMECO_DB_{}.xlsx'.format(country))])
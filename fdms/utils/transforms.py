@@ -0,0 +1,148 @@
+'''
+Series derived from another series, computed in bulk: percent change, rebase, shift and sign flip.
+
+    transforms = Transforms([('OVGDP.1.0.0.0', 'pch', 'OVGDP.6.0.0.0'), ('CMGS.1.0.0.0', 'neg', 'CMGS.1.0.0.0')])
+    transforms.apply(step)
+
+The sources are gathered in one sources x years matrix and every kind of transform is computed with one operation on
+all its rows. The results are the ones of the series operations they replace:
+
+    - pch: `series.pct_change() * 100`, a missing value takes the one of the year before.
+    - rebase: `Operators().rebase(series, BASE_PERIOD)`, the ratio splice of the series on 100 in the base period,
+      computed as a division by the base period value (the same up to the rounding of the chained ratios).
+    - shift: `series.shift(1)`, the value of the year before.
+    - neg: `-series`.
+'''
+import collections
+
+import numpy as np
+import pandas as pd
+
+from fdms.config import BASE_PERIOD
+from fdms.utils.splicer import Splicer
+
+TRANSFORMS = ['pch', 'rebase', 'shift', 'neg']
+
+
+def pad(values):
+    '''values forward filled along the years'''
+    positions = np.where(np.isnan(values), 0, np.arange(values.shape[1]))
+    positions = np.maximum.accumulate(positions, axis=1)
+    return values[np.arange(values.shape[0])[:, None], positions]
+
+
+def shift(values, periods=1):
+    '''values moved periods years later (earlier if negative), like DataFrame.shift(periods, axis=1)'''
+    result = np.full(values.shape, np.nan)
+    if periods > 0:
+        result[:, periods:] = values[:, :-periods]
+    elif periods < 0:
+        result[:, :periods] = values[:, -periods:]
+    else:
+        result[:] = values
+    return result
+
+
+def pch(values):
+    '''Percent change of every row, like pct_change() * 100'''
+    padded = pad(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (padded / shift(padded, 1) - 1) * 100
+
+
+def rebase(values, years, base_period=BASE_PERIOD):
+    '''
+    Every row rebased to 100 in base_period, like Operators.rebase: divided by its base period value, between its first
+    and last values. The rows the ratio splice handles as a special case (the base period missing, not after the first
+    value or not before the last one) are rebased one by one with it.
+    '''
+    years = list(years)
+    result = np.full(values.shape, np.nan)
+    if base_period not in years:
+        return result
+    column = years.index(base_period)
+    valid = ~np.isnan(values)
+    first = np.where(valid.any(axis=1), valid.argmax(axis=1), values.shape[1])
+    last = values.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+    regular = valid[:, column] & (first < column) & (column < last)
+    columns = np.arange(values.shape[1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rebased = pad(values) / values[:, [column]] * 100
+    inside = (columns >= first[:, None]) & (columns <= last[:, None])
+    result[regular] = np.where(inside, rebased, np.nan)[regular]
+    base = pd.Series({base_period: 100})
+    for row in np.flatnonzero(~regular):
+        series = Splicer().ratio_splice(base, pd.Series(values[row], index=years), kind='both')
+        if series is not None:
+            series = series[~series.index.duplicated(keep='last')]
+            result[row] = pd.to_numeric(series.reindex(years), errors='coerce').values
+    return result
+
+
+class Transforms:
+    '''
+    rules       -- list of (source, transform, target), transform is one of TRANSFORMS. A target replaces its series
+                   when it's already in the result (i.e. a sign flip in place).
+    base_period -- Base period of the rebase transforms.
+    '''
+    def __init__(self, rules, base_period=BASE_PERIOD):
+        unknown = [transform for _, transform, _ in rules if transform not in TRANSFORMS]
+        if unknown:
+            raise ValueError('Unknown transforms {}'.format(', '.join(unknown)))
+        self.rules = list(rules)
+        self.base_period = base_period
+
+    def evaluate(self, step, sources=None, missing=None):
+        '''
+        Returns an OrderedDict target -> pd.Series indexed by years.
+
+        step    -- StepMixin looking up the sources with get_data.
+        sources -- What the sources are looked up in (see StepMixin.get_data), step.result by default. A dict
+                   {code: pd.Series} is used as is.
+        missing -- List the targets with a missing source are appended to, if None a missing source raises KeyError.
+        '''
+        sources = step.result if sources is None else sources
+        series = collections.OrderedDict()
+        for source, _, target in self.rules:
+            if source in series:
+                continue
+            try:
+                series[source] = sources[source] if isinstance(sources, dict) else step.get_data(sources, source)
+            except (KeyError, IndexError):
+                if missing is None:
+                    raise
+        years = sorted(set(year for data in series.values() for year in data.index))
+        values = np.full((len(series), len(years)), np.nan)
+        for row, data in enumerate(series.values()):
+            values[row] = pd.to_numeric(data.reindex(years), errors='coerce').values
+        rows = {source: row for row, source in enumerate(series)}
+
+        results = np.full((len(self.rules), len(years)), np.nan)
+        for transform in TRANSFORMS:
+            positions = [position for position, (source, kind, _) in enumerate(self.rules)
+                         if kind == transform and source in rows]
+            if not positions:
+                continue
+            block = values[[rows[self.rules[position][0]] for position in positions]]
+            if transform == 'pch':
+                results[positions] = pch(block)
+            elif transform == 'rebase':
+                results[positions] = rebase(block, years, self.base_period)
+            elif transform == 'shift':
+                results[positions] = shift(block, 1)
+            else:
+                results[positions] = -block
+
+        targets = collections.OrderedDict()
+        for position, (source, _, target) in enumerate(self.rules):
+            if source in rows:
+                # On the years of the source, like the series operation
+                targets[target] = pd.Series(results[position], index=years).reindex(series[source].index)
+            elif missing is not None:
+                missing.append(target)
+        return targets
+
+    def apply(self, step, sources=None, missing=None):
+        '''Adds the targets to step.result in the order of the rules, see evaluate'''
+        for target, data in self.evaluate(step, sources=sources, missing=missing).items():
+            step.update_result(step.get_meta(target), data)